@@ -0,0 +1,215 @@
+import numpy as np
+from .crud import crud, natural_key
+
+# --------------------------------------------------
+# LOOM / SHED ANALYTICS (Vectorised with NumPy)
+# --------------------------------------------------
+# A date range of production is loaded once as column arrays
+# (CRUD.production_shift_columns). Every record is mapped to integer loom /
+# shed / day / shift codes, and each figure is one np.bincount over those
+# codes: a year across 500 looms is a handful of array passes instead of
+# a Python loop per record.
+#
+#   utilisation = shifts a loom produced in / shifts available
+# A loom is available on both shifts of every day in the range. The loom
+# list comes from the shed hierarchy, so looms that never ran show up as
+# idle; several workers on one loom-shift count as one active shift.
+# Only "Day" and "Night" are shifts: records with any other shift value
+# are left out and counted as "unknown_shift_records" in the report.
+#
+# Months in the Parquet archive (app.archive) are read from it. On
+# Firestore the rest comes from the monthly rollups, whose loom entries
+# keep the meters of every shift (app.rollups): a year is a few thousand
+# worker-month reads instead of ~220k records. Months whose rollups were
+# written before that are read record by record until they are rebuilt.
+#
+# Imported by app/reports.py on first use, so NumPy stays out of the
+# import path of everything else (cold start, see app/startup.py).
+
+ANALYTICS_FIELDS = ["date", "shift", "loom_id", "shed_name", "loom_number", "meters"]
+SHIFT_NAMES = ("Day", "Night")  # codes 0 and 1; anything else is not a shift
+
+
+class Production:
+    """One period's production as integer-coded NumPy columns."""
+
+    def __init__(self, start: str, end: str, shed_name: str = None):
+        self.start, self.end = start, end
+        self.days = int((np.datetime64(end, "D") - np.datetime64(start, "D")).astype(int)) + 1
+
+        # Hierarchy looms first; looms only seen in production (e.g. since
+        # deleted) are appended when the records are coded
+        self.looms = [
+            (loom["id"], shed["name"], loom["loom_number"])
+            for shed in crud.get_hierarchy()
+            if shed_name is None or (shed["name"] or "").upper() == shed_name
+            for loom in shed["looms"]
+        ]
+        cols = crud.production_shift_columns(start, end, ANALYTICS_FIELDS, shed_name=shed_name)
+
+        shift = np.full(len(cols["shift"]), -1, dtype=np.int64)
+        names = np.asarray(cols["shift"], dtype=object)
+        for code, name in enumerate(SHIFT_NAMES):
+            shift[names == name] = code
+        known = shift >= 0
+        self.unknown_shifts = int(len(shift) - known.sum())
+        if self.unknown_shifts:
+            cols = {field: [value for value, keep in zip(values, known.tolist()) if keep]
+                    for field, values in cols.items()}
+            shift = shift[known]
+
+        self.loom = self._code_looms(cols)
+        self.day = (np.asarray(cols["date"], dtype="datetime64[D]") - np.datetime64(start, "D")).astype(np.int64)
+        self.shift = shift
+        self.meters = np.nan_to_num(np.asarray(cols["meters"], dtype=float))
+
+        self.sheds = sorted({shed or "" for _, shed, _ in self.looms}, key=natural_key)
+        shed_code = {shed: k for k, shed in enumerate(self.sheds)}
+        self.loom_shed = np.array([shed_code[shed or ""] for _, shed, _ in self.looms], dtype=np.int64)
+
+    def _code_looms(self, cols: dict):
+        """Loom code per record; only the distinct loom ids go through Python."""
+        loom_ids, first, inverse = np.unique(
+            np.asarray(cols["loom_id"], dtype=str), return_index=True, return_inverse=True
+        )
+        code = {loom_id: i for i, (loom_id, _, _) in enumerate(self.looms)}
+        for loom_id, row in zip(loom_ids.tolist(), first.tolist()):
+            if loom_id not in code:
+                code[loom_id] = len(self.looms)
+                self.looms.append((loom_id, cols["shed_name"][row], cols["loom_number"][row]))
+        return np.array([code[loom_id] for loom_id in loom_ids.tolist()], dtype=np.int64)[inverse]
+
+    def active_shifts(self):
+        """[looms x 2]: distinct (day, shift) slots in which each loom produced."""
+        produced = self.meters > 0
+        slots = np.unique((self.loom[produced] * self.days + self.day[produced]) * 2 + self.shift[produced])
+        loom_shift = (slots // (2 * self.days)) * 2 + slots % 2
+        return np.bincount(loom_shift, minlength=len(self.looms) * 2).reshape(-1, 2)
+
+    def sum_by(self, codes, groups: int):
+        """Meters summed per group code (0 .. groups - 1)."""
+        return np.bincount(codes, weights=self.meters, minlength=groups)
+
+
+def moving_average(matrix, window: int):
+    """Trailing mean over 'window' columns per row; the first columns average what exists."""
+    cumulative = np.concatenate([np.zeros((matrix.shape[0], 1)), np.cumsum(matrix, axis=1)], axis=1)
+    index = np.arange(matrix.shape[1])
+    low = np.maximum(index + 1 - window, 0)
+    return (cumulative[:, index + 1] - cumulative[:, low]) / (index + 1 - low)
+
+
+def _ratio(numerator, denominator):
+    numerator = np.asarray(numerator, dtype=float)
+    denominator = np.broadcast_to(np.asarray(denominator, dtype=float), numerator.shape)
+    return np.divide(numerator, denominator, out=np.zeros(numerator.shape), where=denominator > 0)
+
+
+def _rounded(values, digits: int = 2):
+    return np.round(values, digits).tolist()
+
+
+# --------------------------------------------------
+# LOOM UTILISATION
+# --------------------------------------------------
+def loom_report(start: str, end: str, shed_name: str = None):
+    data = Production(start, end, shed_name)
+    n_looms, days = len(data.looms), data.days
+
+    meters = data.sum_by(data.loom * 2 + data.shift, n_looms * 2).reshape(-1, 2)
+    active = data.active_shifts()
+    utilisation = active.sum(axis=1) / (2 * days)
+
+    meters_r, totals_r = _rounded(meters), _rounded(meters.sum(axis=1))
+    util_r, shift_util_r = _rounded(utilisation, 4), _rounded(active / days, 4)
+    order = sorted(range(n_looms), key=lambda i: (natural_key(data.looms[i][1] or ""),
+                                                  natural_key(str(data.looms[i][2] or ""))))
+    looms = []
+    for i in order:
+        loom_id, shed, loom_number = data.looms[i]
+        looms.append({
+            "loom_id": loom_id,
+            "loom": f"{shed or ''}{loom_number or ''}",
+            "shed": shed,
+            "meters": totals_r[i],
+            "meters_day": meters_r[i][0],
+            "meters_night": meters_r[i][1],
+            "active_shifts": int(active[i].sum()),
+            "available_shifts": 2 * days,
+            "utilisation": util_r[i],
+            "utilisation_day": shift_util_r[i][0],
+            "utilisation_night": shift_util_r[i][1],
+        })
+
+    return {
+        "period": {"start": start, "end": end, "days": days},
+        "summary": {
+            "looms": n_looms,
+            "idle_looms": int((active.sum(axis=1) == 0).sum()),
+            "total_meters": round(float(meters.sum()), 2),
+            "utilisation": round(float(utilisation.mean()), 4) if n_looms else 0.0,
+            "unknown_shift_records": data.unknown_shifts,
+        },
+        "idle": [loom["loom"] for loom in looms if loom["active_shifts"] == 0],
+        "looms": looms,
+    }
+
+
+# --------------------------------------------------
+# SHED TRENDS AND SHIFT PERFORMANCE
+# --------------------------------------------------
+def _shift_stats(meters, active, looms: int, days: int):
+    """Day/Night meters, active loom-shifts, utilisation and meters per active shift."""
+    per_active = _ratio(meters, active)
+    utilisation = _ratio(active, looms * days)
+    stats = {
+        name: {
+            "meters": round(float(meters[s]), 2),
+            "active_shifts": int(active[s]),
+            "utilisation": round(float(utilisation[s]), 4),
+            "meters_per_active_shift": round(float(per_active[s]), 2),
+        }
+        for s, name in enumerate(SHIFT_NAMES)
+    }
+    # Only meaningful when both shifts ran
+    weaker = None
+    if (active > 0).all() and per_active[0] != per_active[1]:
+        weaker = SHIFT_NAMES[int(np.argmin(per_active))]
+    return stats, weaker
+
+
+def shed_report(start: str, end: str, shed_name: str = None, window: int = 7):
+    data = Production(start, end, shed_name)
+    n_sheds, days = len(data.sheds), data.days
+    shed = data.loom_shed[data.loom]
+
+    daily = data.sum_by(shed * days + data.day, n_sheds * days).reshape(n_sheds, days)
+    shift_meters = data.sum_by(shed * 2 + data.shift, n_sheds * 2).reshape(n_sheds, 2)
+    shift_active = np.zeros((n_sheds, 2))
+    np.add.at(shift_active, data.loom_shed, data.active_shifts())
+    looms_per_shed = np.bincount(data.loom_shed, minlength=n_sheds)
+
+    daily_r, moving_r = _rounded(daily), _rounded(moving_average(daily, window))
+    sheds = []
+    for k, name in enumerate(data.sheds):
+        shifts, weaker = _shift_stats(shift_meters[k], shift_active[k], int(looms_per_shed[k]), days)
+        sheds.append({
+            "shed": name,
+            "looms": int(looms_per_shed[k]),
+            "meters": round(float(daily[k].sum()), 2),
+            "daily": daily_r[k],
+            "moving_average": moving_r[k],
+            "shifts": shifts,
+            "underperforming_shift": weaker,
+        })
+
+    shifts, weaker = _shift_stats(shift_meters.sum(axis=0), shift_active.sum(axis=0), len(data.looms), days)
+    return {
+        "period": {"start": start, "end": end, "days": days},
+        "window": window,
+        "dates": np.arange(np.datetime64(start, "D"), np.datetime64(end, "D") + 1).astype(str).tolist(),
+        "sheds": sheds,
+        "shifts": shifts,
+        "underperforming_shift": weaker,
+        "unknown_shift_records": data.unknown_shifts,
+    }
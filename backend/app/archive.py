@@ -0,0 +1,399 @@
+import json
+import logging
+import os
+import threading
+import time
+from datetime import date, timedelta
+from .payroll import now_iso
+from .storage import get_engine
+from .storage.base import SLIP_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------
+# PRODUCTION ARCHIVE (Monthly Parquet partitions)
+# --------------------------------------------------
+# Closed months of production are copied to local Parquet files, one per
+# month, with typed columns:
+#   {ARCHIVE_DIR}/production/month=YYYY-MM/part-0.parquet
+#   {ARCHIVE_DIR}/manifest.json           months, row counts, totals
+#   {ARCHIVE_DIR}/dirty/YYYY-MM           closed month written since archived
+# The hive layout lets pyarrow.dataset, pandas or DuckDB open the directory
+# as one table, offline.
+#
+# Salary, payroll, exports and analytics read archived months from these
+# memory-mapped files instead of storage (CRUD splits each range with
+# ProductionArchive.plan); the open month and anything not archived stays
+# live. Payroll runs always read storage: a freeze stores what they read.
+#
+# A run (POST /archive/run, every ARCHIVE_INTERVAL seconds, or
+# 'python -m app.archive') only rewrites a month when its totals
+# (StorageEngine.production_month_stats: the monthly rollups on Firestore,
+# an aggregate on SQLite) differ from the manifest, or when it has a dirty
+# marker. Every production write to a closed month leaves that marker in
+# the archive directory, which all processes reading the archive share, so
+# the month is read live by all of them until a run has rewritten it.
+# (Watching the directory costs one stat() per read, like the manifest.)
+#
+# Edits that bypass the API (console, scripts, a deployment without this
+# ARCHIVE_DIR) leave no marker and are only seen through the totals, which
+# miss a change that keeps them, e.g. a record moved to another worker.
+# Run with --force (POST /archive/run?force=true) after such edits.
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR") or None  # unset: no archive, every read is live
+ARCHIVE_INTERVAL = float(os.getenv("ARCHIVE_INTERVAL", "0"))  # seconds between runs; 0 = on request only
+ARCHIVE_GRACE_DAYS = int(os.getenv("ARCHIVE_GRACE_DAYS", "7"))  # late entries expected after month end
+ARCHIVE_ROW_GROUP = 4096  # rows are sorted by worker, so a worker's slip reads one or two groups
+
+# Column name and Arrow type; every field a production reader asks for
+ARCHIVE_COLUMNS = [
+    ("worker_id", "string"),
+    ("loom_id", "string"),
+    ("shed_name", "string"),
+    ("loom_number", "string"),
+    ("date", "date32"),
+    ("shift", "string"),
+    ("meters", "float64"),
+    ("rate", "float64"),
+    ("total_amount", "float64"),
+]
+ARCHIVE_FIELDS = [name for name, _ in ARCHIVE_COLUMNS]
+
+
+class ArchiveDisabled(Exception):
+    """ARCHIVE_DIR is not set."""
+
+
+def _month_last_day(month: str):
+    first = date.fromisoformat(f"{month}-01")
+    return ((first.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)).isoformat()
+
+
+def _months(start: str, end: str):
+    """The "YYYY-MM" months touching [start, end], in order."""
+    months, month = [], start[:7]
+    while month <= end[:7]:
+        months.append(month)
+        month = (date.fromisoformat(_month_last_day(month)) + timedelta(days=1)).isoformat()[:7]
+    return months
+
+
+def last_closed_month(today: date = None):
+    """The newest month that ended at least ARCHIVE_GRACE_DAYS ago."""
+    today = today or date.today()
+    return (today - timedelta(days=ARCHIVE_GRACE_DAYS)).replace(day=1) - timedelta(days=1)
+
+
+def _fingerprint(totals: dict):
+    # Rounded: rollup increments and SQL sums add floats in any order
+    return {
+        "records": int(totals["records"]),
+        "meters": round(totals["meters"], 3),
+        "amount": round(totals["amount"], 2),
+    }
+
+
+class ProductionArchive:
+    """The manifest of archived months, the runs that write them and the reads."""
+
+    def __init__(self, root: str = ARCHIVE_DIR):
+        self.root = root
+        self._lock = threading.Lock()       # manifest and dirty months
+        self._run_lock = threading.Lock()   # one run at a time
+        self._manifest = {}                 # month -> {"rows", "bytes", "written_at", "fingerprint"}
+        self._manifest_mtime = None
+        self._dirty = {}                    # month -> mtime of its dirty marker
+        self._dirty_mtime = None
+        self._last_run = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def enabled(self):
+        return self.root is not None
+
+    # ---------------- Lifecycle ----------------
+    def start(self):
+        """Loads the manifest; with ARCHIVE_INTERVAL also archives periodically."""
+        if not self.enabled:
+            return
+        self._refresh()
+        if ARCHIVE_INTERVAL > 0 and self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="production-archive", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self._thread = None
+
+    def _loop(self):
+        while not self._stop.wait(ARCHIVE_INTERVAL):
+            try:
+                self.run()
+            except Exception as e:
+                logger.warning("Production archive run failed: %s", e)
+
+    # ---------------- Manifest ----------------
+    def _manifest_path(self):
+        return os.path.join(self.root, "manifest.json")
+
+    def _partition_path(self, month: str):
+        return os.path.join(self.root, "production", f"month={month}", "part-0.parquet")
+
+    def _dirty_dir(self):
+        return os.path.join(self.root, "dirty")
+
+    def _refresh(self):
+        """
+        Re-reads the manifest when a run (of any process) replaced it, and the
+        dirty markers when one was added or removed: two stat() per read.
+        """
+        try:
+            mtime = os.stat(self._manifest_path()).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._manifest_mtime:
+            months = {}
+            if mtime is not None:
+                with open(self._manifest_path()) as f:
+                    months = json.load(f)["months"]
+            with self._lock:
+                self._manifest, self._manifest_mtime = months, mtime
+
+        try:
+            dirty_mtime = os.stat(self._dirty_dir()).st_mtime_ns
+        except FileNotFoundError:
+            dirty_mtime = None
+        if dirty_mtime != self._dirty_mtime:
+            dirty = self._read_dirty()
+            with self._lock:
+                self._dirty, self._dirty_mtime = dirty, dirty_mtime
+
+    def _read_dirty(self):
+        """{month: marker mtime} of the dirty markers."""
+        dirty = {}
+        try:
+            entries = list(os.scandir(self._dirty_dir()))
+        except FileNotFoundError:
+            return dirty
+        for entry in entries:
+            try:
+                dirty[entry.name] = entry.stat().st_mtime_ns
+            except FileNotFoundError:
+                pass  # Cleared by a run meanwhile
+        return dirty
+
+    def _save(self, months: dict):
+        tmp = self._manifest_path() + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"updated_at": now_iso(), "months": dict(sorted(months.items()))}, f, indent=1)
+        os.replace(tmp, self._manifest_path())
+
+    def touch(self, days):
+        """
+        Production was written on these dates: their closed months are read
+        live, by every process, until a run has rewritten them.
+        """
+        if not self.enabled:
+            return
+        last = last_closed_month().isoformat()[:7]
+        months = {month for month in (str(day)[:7] for day in days) if month <= last}
+        if not months:
+            return  # The open months are never archived
+        os.makedirs(self._dirty_dir(), exist_ok=True)
+        for month in months:
+            # Appending always moves the mtime, so a run can tell a write made during it
+            with open(os.path.join(self._dirty_dir(), month), "a") as marker:
+                marker.write(now_iso() + "\n")
+            with self._lock:
+                self._dirty[month] = os.stat(marker.name).st_mtime_ns
+
+    # ---------------- Runs ----------------
+    def run(self, force: bool = False):
+        """
+        Archives every closed month whose totals changed (every month with force).
+        Output: {"written": [...], "unchanged", "removed": [...], "last_month", "seconds"}
+        Raises StorageUnavailable, without archiving, if journaled entries
+        could not be stored first.
+        """
+        # Here, not at the top: the write-behind flusher imports this module
+        from .writebehind import ensure_flushed
+
+        if not self.enabled:
+            raise ArchiveDisabled("The production archive is off; set ARCHIVE_DIR")
+
+        with self._run_lock:
+            started = time.perf_counter()
+            # Journaled entries are stored (and in the totals) before we compare
+            ensure_flushed()
+            os.makedirs(self.root, exist_ok=True)
+            self._refresh()
+            # From disk: appending to a marker does not change the directory
+            dirty = self._read_dirty()
+            with self._lock:
+                manifest = dict(self._manifest)
+
+            last = last_closed_month().isoformat()[:7]
+            stats = get_engine().production_month_stats(None, last)
+            written = []
+            for month, totals in sorted(stats.items()):
+                fingerprint = _fingerprint(totals)
+                entry = manifest.get(month)
+                if (not force and month not in dirty and entry is not None
+                        and entry["fingerprint"] == fingerprint
+                        and os.path.exists(self._partition_path(month))):
+                    continue
+                manifest[month] = {**self._write_month(month), "fingerprint": fingerprint}
+                if manifest[month]["rows"] != fingerprint["records"]:
+                    logger.warning("Archive %s: %d rows but the totals count %d (rebuild the rollups?)",
+                                   month, manifest[month]["rows"], fingerprint["records"])
+                written.append(month)
+
+            # Every record of the month was deleted
+            removed = [m for m in manifest if m not in stats and m <= last]
+            for month in removed:
+                del manifest[month]
+                try:
+                    os.remove(self._partition_path(month))
+                except OSError:
+                    pass
+
+            self._save(manifest)
+            with self._lock:
+                self._manifest = manifest
+                self._manifest_mtime = os.stat(self._manifest_path()).st_mtime_ns
+                # Markers of months written to during the run stay until the next one
+            for month, mtime in dirty.items():
+                self._clear_dirty(month, mtime)
+
+            self._last_run = {
+                "finished_at": now_iso(),
+                "written": written,
+                "unchanged": len(stats) - len(written),
+                "removed": removed,
+                "last_month": last,
+                "seconds": round(time.perf_counter() - started, 2),
+            }
+            logger.info("Production archive: %d months written, %d unchanged in %.1fs",
+                        len(written), self._last_run["unchanged"], self._last_run["seconds"])
+            return dict(self._last_run)
+
+    def _clear_dirty(self, month: str, mtime: int):
+        path = os.path.join(self._dirty_dir(), month)
+        try:
+            if os.stat(path).st_mtime_ns == mtime:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            if self._dirty.get(month) == mtime:
+                del self._dirty[month]
+
+    def _write_month(self, month: str):
+        """Exports one month from storage to its partition (atomically replaced)."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        columns = {field: [] for field in ARCHIVE_FIELDS}
+        appends = [(field, columns[field].append) for field in ARCHIVE_FIELDS]
+        for record in get_engine().stream_production(f"{month}-01", _month_last_day(month), fields=ARCHIVE_FIELDS):
+            for field, append in appends:
+                append(record.get(field))
+
+        arrays = {
+            name: pa.array(columns[name], pa.string()).cast(pa.date32()) if kind == "date32"
+            else pa.array(columns[name], pa.type_for_alias(kind))
+            for name, kind in ARCHIVE_COLUMNS
+        }
+        table = pa.table(arrays).sort_by([("worker_id", "ascending"), ("date", "ascending"), ("shift", "ascending")])
+
+        path = self._partition_path(month)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        pq.write_table(table, path + ".tmp", row_group_size=ARCHIVE_ROW_GROUP, compression="zstd")
+        os.replace(path + ".tmp", path)
+        return {"rows": table.num_rows, "bytes": os.path.getsize(path), "written_at": now_iso()}
+
+    # ---------------- Reads ----------------
+    def plan(self, start: str, end: str, fields=SLIP_FIELDS):
+        """
+        Splits [start, end] into consecutive (start, end, archived) segments
+        in date order. All live when the archive is off or lacks a field.
+        """
+        if not self.enabled or not set(fields) <= set(ARCHIVE_FIELDS):
+            return [(start, end, False)]
+        self._refresh()
+        with self._lock:
+            archived = {m for m in self._manifest if m not in self._dirty}
+
+        segments = []
+        for month in _months(start, end):
+            low, high = max(start, f"{month}-01"), min(end, _month_last_day(month))
+            if segments and segments[-1][2] == (month in archived):
+                segments[-1] = (segments[-1][0], high, month in archived)
+            else:
+                segments.append((low, high, month in archived))
+        return segments
+
+    def _read(self, start: str, end: str, fields: list, worker_id: str = None, shed_name: str = None):
+        """The archived rows in [start, end] as an Arrow table ordered by date; dates as strings."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        filters = [("date", ">=", date.fromisoformat(start)), ("date", "<=", date.fromisoformat(end))]
+        if worker_id is not None:
+            filters.append(("worker_id", "=", worker_id))
+        if shed_name is not None:
+            filters.append(("shed_name", "=", shed_name))
+
+        columns = list(dict.fromkeys([*fields, "date"]))
+        tables = [
+            pq.read_table(self._partition_path(month), columns=columns, filters=filters, memory_map=True)
+            for month in _months(start, end)
+        ]
+        table = pa.concat_tables(tables).sort_by("date")  # stable: keeps worker order within a day
+        return table.set_column(table.schema.get_field_index("date"), "date", table["date"].cast(pa.string()))
+
+    def records(self, start: str, end: str, fields: list = SLIP_FIELDS, worker_id: str = None, shed_name: str = None):
+        """Same dicts as StorageEngine.stream_production, from the archive."""
+        return self._read(start, end, fields, worker_id, shed_name).select(list(fields)).to_pylist()
+
+    def columns(self, start: str, end: str, fields: list, shed_name: str = None):
+        """Same as StorageEngine.production_columns, from the archive."""
+        table = self._read(start, end, fields, shed_name=shed_name)
+        return {field: table[field].to_pylist() for field in fields}
+
+    # ---------------- Status ----------------
+    def status(self):
+        if not self.enabled:
+            return {"enabled": False}
+        self._refresh()
+        with self._lock:
+            months = [
+                {"month": month, "rows": entry["rows"], "bytes": entry["bytes"],
+                 "written_at": entry["written_at"], "live": month in self._dirty}
+                for month, entry in sorted(self._manifest.items())
+            ]
+        return {
+            "enabled": True,
+            "dir": self.root,
+            "interval": ARCHIVE_INTERVAL,
+            "grace_days": ARCHIVE_GRACE_DAYS,
+            "last_run": self._last_run,
+            "months": months,
+        }
+
+
+archive = ProductionArchive()
+
+
+if __name__ == "__main__":
+    # One run from cron or a shell: python -m app.archive [--force]
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Archive closed production months to Parquet")
+    parser.add_argument("--force", action="store_true", help="Rewrite every month, changed or not")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps(archive.run(force=args.force), indent=2))
@@ -1,9 +1,16 @@
 import os
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
 from fastapi import HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials # NEW: Required for Swagger UI lock button
-import firebase_admin
-from firebase_admin import credentials, auth as firebase_auth
-from pathlib import Path
+from .database import get_firebase_app
+from .profiling import phase
+
+logger = logging.getLogger(__name__)
 
 # --------------------------------------------------
 # Configuration & Constants
@@ -12,23 +19,9 @@ from pathlib import Path
 # This ensures you have access even before you set up custom admin claims.
 SUPER_ADMIN_EMAIL = "yugendharanmohan@gmail.com" 
 
-# Use absolute path logic to find the JSON file reliably
-# This looks for the JSON in the 'backend/' folder
-BASE_DIR = Path(__file__).resolve().parent.parent
-SERVICE_ACCOUNT_PATH = BASE_DIR / "firebase-service-account.json"
-
-# --------------------------------------------------
-# Firebase Admin Initialization (ONCE)
-# --------------------------------------------------
-if not firebase_admin._apps:
-    if not SERVICE_ACCOUNT_PATH.exists():
-        raise FileNotFoundError(
-            f"Firebase service account file not found at {SERVICE_ACCOUNT_PATH}. "
-            "Please download it from Project Settings > Service Accounts in Firebase."
-        )
-    
-    cred = credentials.Certificate(str(SERVICE_ACCOUNT_PATH))
-    firebase_admin.initialize_app(cred)
+# Firebase itself is initialised lazily by app.database.get_firebase_app()
+# (on the first token check, or earlier by the startup pre-warm), and
+# firebase_admin.auth is imported there too, to keep cold starts short.
 
 # --------------------------------------------------
 # SECURITY SCHEME
@@ -37,10 +30,132 @@ if not firebase_admin._apps:
 # It automatically adds the "Lock" icon to Swagger UI and handles the "Bearer " prefix.
 security = HTTPBearer()
 
+# --------------------------------------------------
+# VERIFIED TOKEN CACHE
+# --------------------------------------------------
+# The dashboard sends many requests per page with the same bearer token.
+# Decoded claims are cached (keyed by a SHA-256 of the token, never the token
+# itself) until the token's own 'exp' or TOKEN_CACHE_TTL, whichever is sooner.
+TOKEN_CACHE_MAX_SIZE = 1024
+TOKEN_CACHE_TTL = 300  # seconds
+
+class TokenCache:
+    """Bounded LRU cache of decoded Firebase claims with per-entry expiry."""
+
+    def __init__(self, max_size: int = TOKEN_CACHE_MAX_SIZE, ttl: int = TOKEN_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (expires_at, claims)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token: str):
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str):
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, token: str, claims: dict):
+        expires_at = min(claims.get("exp", 0), time.time() + self.ttl)
+        if expires_at <= time.time():
+            return
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (expires_at, claims)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._entries), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
+
+token_cache = TokenCache()
+
+# --------------------------------------------------
+# SIGNING CERTIFICATE WARMER
+# --------------------------------------------------
+# firebase_admin fetches Google's public signing certificates through an
+# HTTP-cached session. Re-requesting them in the background keeps that cache
+# fresh, so the first request after a cert rotation doesn't pay for the fetch.
+CERT_REFRESH_INTERVAL = 1800  # seconds
+
+_cert_warmer_started = threading.Event()
+
+def warm_signing_certs():
+    """Fetches the ID token certificates through the verifier's own cached session."""
+    from firebase_admin import auth as firebase_auth
+    from firebase_admin._token_gen import ID_TOKEN_CERT_URI
+
+    try:
+        get_firebase_app()
+        verifier = firebase_auth._get_client(None)._token_verifier
+        verifier.request(ID_TOKEN_CERT_URI)
+    except Exception as e:
+        logger.warning("Could not refresh Firebase signing certificates: %s", e)
+
+def _cert_warmer_loop():
+    while True:
+        warm_signing_certs()
+        time.sleep(CERT_REFRESH_INTERVAL)
+
+def start_cert_warmer():
+    """Starts the background refresh thread once per process."""
+    if _cert_warmer_started.is_set():
+        return
+    _cert_warmer_started.set()
+    threading.Thread(target=_cert_warmer_loop, name="firebase-cert-warmer", daemon=True).start()
+
 # --------------------------------------------------
 # 1. Base Token Verification (Internal Use)
 # --------------------------------------------------
-def verify_firebase_token(creds: HTTPAuthorizationCredentials = Depends(security)):
+async def claims_for_token(token: str):
+    """
+    Decoded claims of a Firebase ID token. Recently verified tokens are
+    answered from token_cache without leaving the event loop; a miss
+    verifies the JWT in a worker thread. Raises on an invalid token.
+    """
+    cached = token_cache.get(token)
+    if cached is not None:
+        return cached
+
+    start_cert_warmer()
+
+    # Verifies the token and returns a dict containing uid, email, etc.
+    decoded_token = await run_in_threadpool(_verify_id_token, token)
+    token_cache.put(token, decoded_token)
+    return decoded_token
+
+
+def _verify_id_token(token: str):
+    from firebase_admin import auth as firebase_auth
+
+    get_firebase_app()
+    return firebase_auth.verify_id_token(token)
+
+
+def is_admin(user: dict):
+    """Firebase custom 'admin' claim OR the fallback super admin email."""
+    return bool(user.get("admin", False)) or user.get("email") == SUPER_ADMIN_EMAIL
+
+
+async def verify_firebase_token(creds: HTTPAuthorizationCredentials = Depends(security)):
     """
     Extracts and verifies Firebase ID token.
     FastAPI (HTTPBearer) automatically extracts the token from the header.
@@ -48,9 +163,8 @@ def verify_firebase_token(creds: HTTPAuthorizationCredentials = Depends(security
     token = creds.credentials # This gets the clean token string
 
     try:
-        # Verifies the token and returns a dict containing uid, email, etc.
-        decoded_token = firebase_auth.verify_id_token(token)
-        return decoded_token  
+        with phase("auth"):
+            return await claims_for_token(token)
     except Exception:
         raise HTTPException(
             status_code=401,
@@ -61,7 +175,7 @@ def verify_firebase_token(creds: HTTPAuthorizationCredentials = Depends(security
 # --------------------------------------------------
 # 2. Regular User Dependency (Allows ANY logged-in user)
 # --------------------------------------------------
-def get_current_user(user=Depends(verify_firebase_token)):
+async def get_current_user(user=Depends(verify_firebase_token)):
     """
     Validates that the user is logged in. 
     Does NOT check for admin privileges.
@@ -73,20 +187,17 @@ def get_current_user(user=Depends(verify_firebase_token)):
 # --------------------------------------------------
 # 3. Admin-only Dependency
 # --------------------------------------------------
-def admin_required(user=Depends(verify_firebase_token)):
+async def admin_required(user=Depends(verify_firebase_token)):
     """
     Ensures the logged-in user is an admin.
     Checks for Firebase custom claims OR the fallback super admin email.
     Use this for endpoints accessible ONLY by 'Admin' role.
     """
-    is_admin_claim = user.get("admin", False)
-    user_email = user.get("email")
-
     # Grant access if they have the admin claim OR match the super admin email
-    if not is_admin_claim and user_email != SUPER_ADMIN_EMAIL:
+    if not is_admin(user):
         raise HTTPException(
             status_code=403,
-            detail=f"Access denied for {user_email}. Admin rights required."
+            detail=f"Access denied for {user.get('email')}. Admin rights required."
         )
 
     return user
\ No newline at end of file
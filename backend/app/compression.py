@@ -0,0 +1,144 @@
+import os
+import zlib
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # Optional: without it only gzip is offered
+    brotli = None
+
+# --------------------------------------------------
+# RESPONSE COMPRESSION (Brotli / gzip)
+# --------------------------------------------------
+# Text responses of at least COMPRESS_MIN_BYTES are compressed with the
+# best encoding the client accepts: br (if the 'brotli' package is
+# installed), then gzip. Streamed responses (exports) are compressed chunk
+# by chunk, and each chunk is flushed (Z_SYNC_FLUSH / brotli flush) so the
+# client gets it now instead of when the compressor's buffer fills.
+# Responses that already carry a Content-Encoding, 1xx/204/304 responses,
+# small non-streamed bodies and binary types (xlsx, images) pass through
+# untouched.
+#
+# A compressed body is a different representation, so its strong ETag gets
+# a suffix ("abc" -> "abc-br"); app.httpcache strips it when it compares
+# If-None-Match.
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4  # Fast setting suited to per-request compression
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "application/xml", "image/svg+xml")
+ETAG_SUFFIXES = {"br": "-br", "gzip": "-gzip"}
+
+
+def negotiate(accept_encoding: str):
+    """Output: "br", "gzip" or None from an Accept-Encoding header (q-values honoured)."""
+    offered = {"gzip": None, "br": None}  # None: not listed
+    wildcard = 0.0
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name == "*":
+            wildcard = q
+        elif name in offered:
+            offered[name] = q
+
+    offered = {name: wildcard if q is None else q for name, q in offered.items()}
+    if brotli is None:
+        offered["br"] = 0.0
+
+    # Brotli wins ties: smaller output for the same JSON
+    best = max(("br", "gzip"), key=lambda name: offered[name])
+    return best if offered[best] > 0 else None
+
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._impl = brotli.Compressor(quality=BROTLI_QUALITY)
+            self.compress, self._flush, self._finish = self._impl.process, self._impl.flush, self._impl.finish
+        else:
+            self._impl = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self.compress, self._finish = self._impl.compress, self._impl.flush
+            self._flush = lambda: self._impl.flush(zlib.Z_SYNC_FLUSH)
+
+    def flush(self):
+        """Everything compressed so far, decodable without the rest of the stream."""
+        return self._flush()
+
+    def finish(self):
+        return self._finish()
+
+
+class CompressionMiddleware:
+    """Plain ASGI so streamed responses stay streamed."""
+
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        state = {"start": None, "compressor": None, "passthrough": False}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state["start"] = message
+                return
+            if message["type"] != "http.response.body" or state["passthrough"]:
+                return await send(message)
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            compressor = state["compressor"]
+
+            if compressor is None:
+                start = state["start"]
+                headers = MutableHeaders(raw=start["headers"])
+                if not self._should_compress(start["status"], headers, body, more_body):
+                    state["passthrough"] = True
+                    await send(start)
+                    return await send(message)
+
+                compressor = state["compressor"] = _Compressor(encoding)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                etag = headers.get("etag")
+                if etag and etag.endswith('"'):
+                    headers["ETag"] = etag[:-1] + ETAG_SUFFIXES[encoding] + '"'
+                if "content-length" in headers:
+                    del headers["content-length"]
+
+                if not more_body:
+                    data = compressor.compress(body) + compressor.finish()
+                    headers["Content-Length"] = str(len(data))
+                    await send(start)
+                    return await send({"type": "http.response.body", "body": data})
+                await send(start)
+
+            data = compressor.compress(body)
+            data += compressor.flush() if more_body else compressor.finish()
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
+
+    def _should_compress(self, status: int, headers: MutableHeaders, body: bytes, more_body: bool):
+        if status < 200 or status in (204, 304) or "content-encoding" in headers:
+            return False
+        content_type = headers.get("content-type", "")
+        if not content_type.startswith(COMPRESSIBLE_TYPES):
+            return False
+        # Streams are compressed whatever their first chunk's size
+        return more_body or len(body) >= self.minimum_size
@@ -1,7 +1,347 @@
+import re
+import threading
+import time
 from datetime import date
-from .database import db # Import the Firestore client from your new database.py
+from anyio import to_thread
+from .refdata import refdata
+from .ratecard import ratecard, rate_id
+from .payroll import payroll_periods, period_id, now_iso, payroll_summary, PayrollConflict, FROZEN, OPEN
+from .pagination import page
+from .profiling import instrument_crud
+from .storage import get_engine, get_async_engine
+from .storage.base import SHIFTS, SLIP_FIELDS, production_key
+from .archive import archive
+from .search import SEARCH_LIMIT, WorkerIndex
+from . import writebehind
 
+# --------------------------------------------------
+# Shed/Loom hierarchy cache
+# --------------------------------------------------
+# The hierarchy is read on every page load but only changes when an admin
+# adds a shed or loom. create_shed/create_loom invalidate it; the TTL only
+# guards against writes made by another process.
+HIERARCHY_CACHE_TTL = 300  # seconds
+
+# Until reference data is loaded, worker search (typeahead: one call per
+# keystroke) runs on a WorkerIndex built from one storage read, kept for
+# WORKER_INDEX_TTL seconds; create_worker invalidates it.
+WORKER_INDEX_TTL = 60  # seconds
+
+_cache_lock = threading.Lock()
+# 'generation' is bumped on every invalidation, so a load that started
+# before a write cannot store its (stale) result afterwards
+_hierarchy_cache = {"data": None, "loaded_at": 0.0, "generation": 0, "ttl": HIERARCHY_CACHE_TTL}
+_worker_index_cache = {"data": None, "loaded_at": 0.0, "generation": 0, "ttl": WORKER_INDEX_TTL}
+
+
+def _invalidate(cache: dict):
+    with _cache_lock:
+        cache["data"] = None
+        cache["generation"] += 1
+
+def _cached(cache: dict):
+    """Output: (cached data or None if missing/expired, generation to pass to _store)."""
+    with _cache_lock:
+        data = cache["data"]
+        if data is not None and time.monotonic() - cache["loaded_at"] >= cache["ttl"]:
+            data = None
+        return data, cache["generation"]
+
+def _store(cache: dict, data, generation: int):
+    """Caches freshly loaded data unless the cache was invalidated while loading."""
+    with _cache_lock:
+        if cache["generation"] == generation:
+            cache["data"] = data
+            cache["loaded_at"] = time.monotonic()
+
+def invalidate_hierarchy_cache():
+    _invalidate(_hierarchy_cache)
+
+def _search_worker_index(index: WorkerIndex, query: str, limit: int, is_active: bool):
+    # WorkerIndex is not thread-safe; a cached one is shared by every request
+    with _cache_lock:
+        return index.search(query, limit, is_active)
+
+def _build_worker_index(workers: list):
+    index = WorkerIndex()
+    for worker in workers:
+        index.put(worker)
+    return index
+
+def _production_keys(worker_id: str, loom_id: str, day: str, shift: str = None):
+    """Ids of the records a worker can have on a loom for a day (one per shift)."""
+    return [
+        production_key({"worker_id": worker_id, "loom_id": loom_id, "date": day, "shift": s})
+        for s in ([shift] if shift else SHIFTS)
+    ]
+
+def _with_pending(keys: list, stored: list):
+    """Stored records overlaid with newer, not yet flushed write-behind entries."""
+    if writebehind.write_behind is None:
+        return stored
+    pending = writebehind.write_behind.pending_records(keys)
+    found = {record["id"]: record for record in stored}
+    found.update(pending)
+    return [found[key] for key in keys if key in found]
+
+def _stream_production(start: str, end: str, **filters):
+    """
+    stream_production with archived months read from Parquet (app.archive)
+    and the rest from storage, in date order.
+    """
+    for low, high, archived in archive.plan(start, end, filters.get("fields", SLIP_FIELDS)):
+        if archived:
+            yield from archive.records(low, high, **filters)
+        else:
+            yield from get_engine().stream_production(low, high, **filters)
+
+async def _astream_production(start: str, end: str, **filters):
+    """Async counterpart of _stream_production."""
+    for low, high, archived in archive.plan(start, end, filters.get("fields", SLIP_FIELDS)):
+        if archived:
+            # A Parquet segment is read in one call (columnar, local)
+            for record in await to_thread.run_sync(lambda: archive.records(low, high, **filters)):
+                yield record
+        else:
+            async for record in get_async_engine().stream_production(low, high, **filters):
+                yield record
+
+def _worker_sort_key(worker: dict):
+    return [worker.get("name") or "", worker["id"]]
+
+
+def _production_sort_key(record: dict):
+    return [record["date"], record["id"]]
+
+
+def _page_workers_in_memory(workers: list, limit: int, after: list = None, is_active: bool = None,
+                            name_prefix: str = None, shed_id: str = None):
+    """Same filters and (name, id) ordering as StorageEngine.query_workers."""
+    def keep(w):
+        # Workers saved before is_active was stored count as active
+        return (is_active is None or w.get("is_active", True) == is_active) \
+            and (shed_id is None or w.get("shed_id") == shed_id) \
+            and (not name_prefix or (w.get("name") or "").startswith(name_prefix)) \
+            and (not after or _worker_sort_key(w) > after)
+
+    return sorted((w for w in workers if keep(w)), key=_worker_sort_key)[:limit]
+
+
+def _ensure_rate_card():
+    """Loads the rate card from storage when its change feed is not running."""
+    if not ratecard.ready:
+        ratecard.load(get_engine().list_rates())
+
+
+def _ensure_payroll_periods():
+    """Loads the payroll period index from storage when its change feed is not running."""
+    if not payroll_periods.ready:
+        payroll_periods.load(get_engine().list_payroll_periods())
+
+
+def _frozen_period(start: str, end: str):
+    """The period document when exactly this period is frozen (see app.payroll), else None."""
+    _ensure_payroll_periods()
+    return payroll_periods.frozen(period_id(start, end))
+
+
+async def _aensure_payroll_periods():
+    """_ensure_payroll_periods for the async path: the fallback load runs in a worker thread."""
+    if not payroll_periods.ready:
+        await to_thread.run_sync(_ensure_payroll_periods)
+
+
+async def _afrozen_period(start: str, end: str):
+    await _aensure_payroll_periods()
+    return payroll_periods.frozen(period_id(start, end))
+
+
+def _reject_frozen(records: list, blocked: dict):
+    """
+    Splits new production records into [(index, record)] that may be
+    written and [{"index", "error"}] for those whose date is 'blocked'
+    (see PayrollPeriods.writing): paid salary must not change.
+    """
+    writable, rejected = [], []
+    for index, record in enumerate(records):
+        if record["date"] in blocked:
+            rejected.append({"index": index, "error": blocked[record["date"]]})
+        else:
+            writable.append((index, record))
+    return writable, rejected
+
+
+def _merge_results(writable: list, results: list, rejected: list):
+    """Maps insert results of the writable records back to the input rows, in order."""
+    for result in results:
+        result["index"] = writable[result["index"]][0]
+    return sorted(results + rejected, key=lambda r: r["index"])
+
+
+def _snapshot_read(frozen: dict, worker_id: str = None, shed_name: str = None):
+    """
+    Arguments for get_payroll_slips when a payroll is answered from the
+    frozen snapshot 'frozen', or None when it must be computed live (no
+    snapshot, or filtered by shed and the snapshot has no per-shed parts).
+    """
+    if frozen is None or (shed_name and not frozen.get("by_shed")):
+        return None
+    return frozen["id"], frozen["snapshot_id"], [worker_id] if worker_id else None
+
+
+def _snapshot_slips(slips: dict, shed_name: str = None):
+    """
+    Stored snapshot slips (freshly read, so changed in place) as a live
+    calculation returns them, cut down to one shed if asked.
+    """
+    if not shed_name:
+        for slip in slips.values():
+            slip.pop("sheds", None)
+        return slips
+    result = {}
+    for worker_id, slip in slips.items():
+        part = slip.get("sheds", {}).get(shed_name)
+        if part is not None:
+            result[worker_id] = {
+                "details": [slip["details"][i] for i in part["rows"]],
+                "summary": {"total_meters": part["total_meters"], "total_salary": part["total_salary"]},
+            }
+    return result
+
+
+class _SlipBuilder:
+    """Accumulates production dicts, one at a time, into a salary slip."""
+
+    __slots__ = ("details", "total_meters", "total_salary", "sheds")
+
+    def __init__(self):
+        self.details = []
+        self.total_meters = 0
+        self.total_salary = 0
+        self.sheds = {}  # shed_name -> [detail indexes, meters, salary]
+
+    def add(self, r: dict):
+        # Combine Shed Name and Loom Number for the UI display
+        # Assumes 'shed_name' and 'loom_number' were saved in the production record
+        loom_label = f"{r.get('shed_name', '')}{r.get('loom_number', '')}"
+
+        self.details.append({
+            "date": r.get("date"),
+            "shift": r.get("shift"),
+            "meters": r.get("meters"),
+            "loom": loom_label,
+            "loom_id": r.get("loom_id")
+        })
+
+        self.total_meters += r.get("meters", 0)
+        self.total_salary += r.get("total_amount", 0)
+
+        shed_name = r.get("shed_name")
+        if shed_name:
+            shed = self.sheds.get(shed_name)
+            if shed is None:
+                shed = self.sheds[shed_name] = [[], 0, 0]
+            shed[0].append(len(self.details) - 1)
+            shed[1] += r.get("meters", 0)
+            shed[2] += r.get("total_amount", 0)
+
+    def slip(self, by_shed: bool = False):
+        """by_shed adds "sheds": {shed_name: {"rows", "total_meters", "total_salary"}} (for snapshots)."""
+        slip = {
+            "details": self.details,
+            "summary": {
+                "total_meters": float(self.total_meters),
+                "total_salary": float(self.total_salary)
+            }
+        }
+        if by_shed:
+            slip["sheds"] = {
+                name: {"rows": rows, "total_meters": float(meters), "total_salary": float(salary)}
+                for name, (rows, meters, salary) in self.sheds.items()
+            }
+        return slip
+
+
+def _add_to_payroll(builders: dict, record: dict):
+    """Groups a record into its worker's slip ({worker_id: _SlipBuilder})."""
+    builder = builders.get(record.get("worker_id"))
+    if builder is None:
+        builder = builders[record.get("worker_id")] = _SlipBuilder()
+    builder.add(record)
+
+
+def _payroll_slips(builders: dict, by_shed: bool = False):
+    return {worker_id: builder.slip(by_shed) for worker_id, builder in builders.items()}
+
+
+def _rate_document(data: dict):
+    """(rate id, stored rate dict) of a new rate card entry."""
+    rate = {**data, "effective_from": str(data["effective_from"])}
+    return rate_id(rate["scope"], rate["key"], rate["effective_from"]), rate
+
+
+def _worker_created(worker_id: str, worker_data: dict):
+    worker = {"id": worker_id, **worker_data}
+    refdata.put_worker(worker)
+    _invalidate(_worker_index_cache)
+    return worker
+
+
+def _shed_created(shed_id: str, name: str):
+    refdata.put_shed(shed_id, name)
+    invalidate_hierarchy_cache()
+    return {"id": shed_id, "name": name}
+
+
+def _loom_created(shed_id: str, loom_id: str, loom_number: str):
+    refdata.put_loom(shed_id, loom_id, loom_number)
+    invalidate_hierarchy_cache()
+    return {"id": loom_id, "loom_number": loom_number}
+
+
+def _find_loom(loom_id: str):
+    """
+    {"shed_id", "shed_name", "loom_number"} of a loom, or None if unknown.
+    From the reference-data cache once it is loaded; until then (warm-up,
+    feed failure) from the cached hierarchy, reloaded once if the loom is
+    missing from it (it may have been added by another process).
+    """
+    if refdata.ready:
+        info = refdata.loom_info(loom_id)
+        if info is None:
+            return None
+        return {"shed_id": refdata.loom_shed_id(loom_id), "shed_name": info[0], "loom_number": info[1]}
+
+    for attempt in range(2):
+        for shed in CRUD.get_hierarchy():
+            for loom in shed["looms"]:
+                if loom["id"] == loom_id:
+                    return {"shed_id": shed["id"], "shed_name": shed["name"], "loom_number": loom["loom_number"]}
+        invalidate_hierarchy_cache()
+    return None
+
+
+def _loom_shed_id(loom_id: str):
+    loom = _find_loom(loom_id)
+    return loom["shed_id"] if loom is not None else None
+
+
+def _lookups_read_storage():
+    """True while pricing/enriching would read storage (a cache is not loaded yet)."""
+    return not (refdata.ready and ratecard.ready)
+
+
+def natural_key(label: str):
+    """Sort key that orders loom labels naturally: A1, A2, ... A10 (not A1, A10, A2)."""
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r"(\d+)", label or "")]
+
+
+@instrument_crud
 class CRUD:
+    """
+    Business rules of the API. Storage is delegated to the configured
+    engine (app.storage): Firestore by default, or embedded SQLite.
+    """
     # -------------------------------------------------
     # WORKER OPERATIONS
     # ------------------------------------------------- 
@@ -9,81 +349,192 @@ class CRUD:
     def create_worker(worker_data: dict):
         """
         Input: Dictionary containing worker details.
-        Output: The created worker document with its Firestore ID.
+        Output: The created worker document with its ID.
         """
-        doc_ref = db.collection("workers").document()
-        doc_ref.set(worker_data)
-        return {"id": doc_ref.id, **worker_data}
+        return _worker_created(get_engine().create_worker(worker_data), worker_data)
 
     @staticmethod
     def get_workers():
-        """Returns all workers from the 'workers' collection."""
-        docs = db.collection("workers").stream()
-        return [{"id": doc.id, **doc.to_dict()} for doc in docs]
+        """
+        Returns all workers from the 'workers' collection.
+        Served from the live reference-data cache once it is loaded.
+        """
+        if refdata.ready:
+            return refdata.get_workers()
+
+        return get_engine().list_workers()
+
+    @staticmethod
+    def list_workers_page(limit: int, after: list = None, **filters):
+        """
+        One page of workers ordered by name: {"items", "next_cursor"}.
+        filters: is_active, name_prefix, shed_id
+        """
+        if refdata.ready:
+            items = _page_workers_in_memory(refdata.get_workers(), limit + 1, after, **filters)
+        else:
+            items = get_engine().query_workers(limit + 1, after, **filters)
+        return page(items, limit, _worker_sort_key)
+
+    @staticmethod
+    def search_workers(query: str, limit: int = SEARCH_LIMIT, is_active: bool = None):
+        """
+        Typeahead matches (see app/search.py), from the reference-data index
+        once it is loaded; until then from a cached index of all workers.
+        """
+        if refdata.ready:
+            return refdata.search_workers(query, limit, is_active)
+
+        index, generation = _cached(_worker_index_cache)
+        if index is None:
+            index = _build_worker_index(get_engine().list_workers())
+            _store(_worker_index_cache, index, generation)
+        return _search_worker_index(index, query, limit, is_active)
 
     # -------------------------------------------------
     # SHED / LOOM OPERATIONS
     # -------------------------------------------------
     @staticmethod
     def create_shed(name: str):
-        doc_ref = db.collection("sheds").document()
-        doc_ref.set({"name": name.upper()})
-        return {"id": doc_ref.id, "name": name.upper()}
+        return _shed_created(get_engine().create_shed(name.upper()), name.upper())
 
     @staticmethod
     def create_loom(shed_id: str, loom_number: str):
-        # Looms are stored as a sub-collection inside a specific Shed document
-        doc_ref = db.collection("sheds").document(shed_id).collection("looms").document()
-        doc_ref.set({"loom_number": loom_number})
-        return {"id": doc_ref.id, "loom_number": loom_number}
+        return _loom_created(shed_id, get_engine().create_loom(shed_id, loom_number), loom_number)
 
     @staticmethod
     def get_hierarchy():
         """
         Output format MATCHES old SQL response.
-        Fetches sheds and then fetches looms for each shed.
-        """
-        sheds_docs = db.collection("sheds").stream()
-        hierarchy = []
-
-        for shed_doc in sheds_docs:
-            shed_data = shed_doc.to_dict()
-            shed_id = shed_doc.id
-            
-            # Fetch looms for this specific shed
-            looms_docs = db.collection("sheds").document(shed_id).collection("looms").stream()
-            looms_list = [
-                {"id": loom.id, "loom_number": loom.to_dict().get("loom_number")}
-                for loom in looms_docs
-            ]
-
-            hierarchy.append({
-                "id": shed_id,
-                "name": shed_data.get("name"),
-                "looms": looms_list
-            })
-        
-        return hierarchy
+        Served from the live reference-data cache once it is loaded;
+        otherwise from the in-process cache, reloaded from storage only
+        after a shed/loom write or when the TTL runs out.
+        """
+        if refdata.ready:
+            return refdata.get_hierarchy()
+
+        data, generation = _cached(_hierarchy_cache)
+        if data is None:
+            data = get_engine().load_hierarchy()
+            _store(_hierarchy_cache, data, generation)
+        return data
 
     # -------------------------------------------------
     # PRODUCTION ENTRY
     # -------------------------------------------------
     @staticmethod
-    def add_production(data: dict):
+    def enrich_production(data: dict):
         """
-        Calculates total_amount before saving to Firestore.
-        'data' should contain worker_id, loom_id, shed_name, etc.
+        Fills shed_name/loom_number from the reference-data cache (or the
+        hierarchy before it is loaded) when the client did not send them.
+        Raises ValueError for an unknown loom.
+        """
+        if data.get("shed_name") and data.get("loom_number"):
+            return data
+
+        loom = _find_loom(data["loom_id"])
+        if loom is None:
+            raise ValueError(f"Unknown loom_id '{data['loom_id']}'; send shed_name and loom_number")
+
+        return {
+            **data,
+            "shed_name": data.get("shed_name") or loom["shed_name"],
+            "loom_number": data.get("loom_number") or loom["loom_number"]
+        }
+
+    @staticmethod
+    def price_production(data: dict):
+        """
+        Sets 'rate' from the rate card entry in force on the record's date
+        (loom, then quality, then the loom's shed). A client-sent rate is
+        only kept where the card has no entry. Raises ValueError when
+        neither exists.
         """
+        _ensure_rate_card()
+        day = str(data["date"])
+        entry = ratecard.resolve(
+            day,
+            loom_id=data["loom_id"],
+            quality=data.get("quality"),
+            shed_id=_loom_shed_id(data["loom_id"])
+        )
+        data = {k: v for k, v in data.items() if not (k == "quality" and v is None)}
+        if entry is not None:
+            return {**data, "rate": entry["rate"]}
+        if data.get("rate"):
+            return data
+        raise ValueError(f"No rate card entry for loom '{data['loom_id']}' on {day}; add one or send rate")
+
+    @staticmethod
+    def _build_production_record(data: dict):
+        """Prices the record, adds the calculated total_amount and stringifies the date."""
+        return CRUD._production_record(CRUD.price_production(CRUD.enrich_production(data)))
+
+    @staticmethod
+    def _production_record(data: dict):
+        """The stored record of an enriched, priced entry: adds total_amount, stringifies the date."""
         total_amount = data['meters'] * data['rate']
-        record = {
+        return {
             **data,
             "total_amount": total_amount,
             "date": str(data['date']) # Ensure date is stored as string for querying
         }
-        
-        doc_ref = db.collection("production").document()
-        doc_ref.set(record)
-        return {"id": doc_ref.id, **record}
+
+    @staticmethod
+    def add_production(data: dict):
+        """
+        Calculates total_amount before saving.
+        'data' should contain worker_id, loom_id, shed_name, etc.
+        """
+        record = CRUD._build_production_record(data)
+        _ensure_payroll_periods()
+        with payroll_periods.writing([record["date"]]) as blocked:
+            if blocked:
+                raise PayrollConflict(blocked[record["date"]])
+            if writebehind.write_behind is not None:
+                # Acknowledged once journaled; the flusher stores it (see app.writebehind)
+                record_id = writebehind.write_behind.enqueue([record])[0]
+                return {"id": record_id, **record, "queued": True}
+
+            record_id = get_engine().insert_production(record)
+        # After the write, so an archive run cannot clear the mark without it
+        archive.touch([record["date"]])
+        return {"id": record_id, **record}
+
+    @staticmethod
+    def add_production_bulk(rows: list):
+        """
+        Input: List of already validated production dicts.
+        Output: One result per row, in order: {"index", "id"} or {"index", "error"}.
+        A storage failure only marks the affected rows as failed, and rows
+        dated inside a frozen payroll period are rejected.
+        """
+        _ensure_payroll_periods()
+        built = [CRUD._build_production_record(data) for data in rows]
+        with payroll_periods.writing(r["date"] for r in built) as blocked:
+            writable, rejected = _reject_frozen(built, blocked)
+            records = [record for _, record in writable]
+            if not records:
+                results = []
+            elif writebehind.write_behind is not None:
+                # Journaled too, so saves of a shift are stored in the order they were made
+                ids = writebehind.write_behind.enqueue(records)
+                results = [{"index": i, "id": record_id} for i, record_id in enumerate(ids)]
+            else:
+                results = get_engine().insert_production_many(records)
+                # Stored rows only; queued ones are marked by the flusher once stored
+                archive.touch(records[r["index"]]["date"] for r in results if "error" not in r)
+        return _merge_results(writable, results, rejected)
+
+    @staticmethod
+    def lookup_production(worker_id: str, loom_id: str, day: str, shift: str = None):
+        """
+        Point lookup of a worker's records on a loom for a day (all shifts
+        unless 'shift' is given) by their deterministic ids: no query.
+        Entries still waiting in the write-behind journal are included.
+        """
+        keys = _production_keys(worker_id, loom_id, day, shift)
+        return _with_pending(keys, get_engine().get_production(keys))
 
     # -------------------------------------------------
     # SALARY CALCULATION (CRITICAL)
@@ -93,43 +544,448 @@ class CRUD:
         """
         OUTPUT STRUCTURE UNCHANGED.
         Filters by worker_id and a date range (ISO strings: YYYY-MM-DD).
-        Requires a Firestore Index to run.
-        """
-        # Query Firestore production collection
-        query = db.collection("production") \
-            .where("worker_id", "==", worker_id) \
-            .where("date", ">=", start) \
-            .where("date", "<=", end) \
-            .order_by("date") \
-            .stream()
-
-        details = []
-        total_meters = 0
-        total_salary = 0
-
-        for doc in query:
-            r = doc.to_dict()
-            # Combine Shed Name and Loom Number for the UI display
-            # Assumes 'shed_name' and 'loom_number' were saved in the production record
-            loom_label = f"{r.get('shed_name', '')}{r.get('loom_number', '')}"
-            
-            details.append({
-                "date": r.get("date"),
-                "shift": r.get("shift"),
-                "meters": r.get("meters"),
-                "loom": loom_label,
-                "loom_id": r.get("loom_id")
-            })
-            
-            total_meters += r.get("meters", 0)
-            total_salary += r.get("total_amount", 0)
+        On Firestore this requires a composite index.
+        A frozen period is answered from its snapshot: one point read.
+        """
+        snapshot = _snapshot_read(_frozen_period(start, end), worker_id)
+        if snapshot is not None:
+            return _snapshot_slips(get_engine().get_payroll_slips(*snapshot)).get(worker_id) or _SlipBuilder().slip()
+
+        return CRUD._summarise_production(_stream_production(start, end, worker_id=worker_id))
+
+    @staticmethod
+    def list_production_page(limit: int, after: list = None, **filters):
+        """
+        One page of production records ordered by (date, id): {"items", "next_cursor"}.
+        filters: worker_id, loom_id, shed_name, start, end
+        """
+        items = get_engine().query_production(limit + 1, after, **filters)
+        return page(items, limit, _production_sort_key)
+
+    @staticmethod
+    def stream_production(start: str, end: str, archived: bool = True, **filters):
+        """
+        Lazily yields raw production dicts for exports.
+        filters: worker_id, shed_name, fields (see StorageEngine.stream_production)
+        archived=False reads storage even for months in the Parquet archive.
+        """
+        if not archived:
+            return get_engine().stream_production(start, end, **filters)
+        return _stream_production(start, end, **filters)
+
+    @staticmethod
+    def production_columns(start: str, end: str, fields: list, shed_name: str = None):
+        """Production in the range as {field: [values]} (see StorageEngine.production_columns)."""
+        parts = [
+            (archive.columns if archived else get_engine().production_columns)(low, high, fields, shed_name=shed_name)
+            for low, high, archived in archive.plan(start, end, fields)
+        ]
+        if len(parts) == 1:
+            return parts[0]
+        return {field: [value for part in parts for value in part[field]] for field in fields}
+
+    @staticmethod
+    def production_shift_columns(start: str, end: str, fields: list, shed_name: str = None):
+        """production_columns for analytics (see StorageEngine.production_shift_columns)."""
+        parts = [
+            (archive.columns if archived else get_engine().production_shift_columns)(low, high, fields, shed_name=shed_name)
+            for low, high, archived in archive.plan(start, end, fields)
+        ]
+        if len(parts) == 1:
+            return parts[0]
+        return {field: [value for part in parts for value in part[field]] for field in fields}
+
+    @staticmethod
+    def production_totals(worker_id: str, start: str, end: str):
+        """
+        Totals and per-loom breakdown for a worker over any date range,
+        answered from rollups (Firestore) or an indexed aggregate (SQLite).
+        """
+        return get_engine().production_totals(worker_id, start, end)
+
+    @staticmethod
+    def rebuild_rollups(start: str, end: str):
+        """Backfills the rollups for a date range from the raw records."""
+        return get_engine().rebuild_rollups(start, end)
+
+    # -------------------------------------------------
+    # RATE CARD
+    # -------------------------------------------------
+    @staticmethod
+    def create_rate(data: dict):
+        """Stores a rate card entry; re-posting the same scope/key/date replaces it."""
+        rid, rate = _rate_document(data)
+        get_engine().put_rate(rid, rate)
+        ratecard.put(rid, rate)
+        return {"id": rid, **rate}
+
+    @staticmethod
+    def get_rates(scope: str = None, key: str = None):
+        _ensure_rate_card()
+        return ratecard.list_rates(scope, key)
+
+    @staticmethod
+    def resolve_rate(loom_id: str, day: str, quality: str = None):
+        """The entry that would price a record for this loom and date, or None."""
+        _ensure_rate_card()
+        return ratecard.resolve(day, loom_id=loom_id, quality=quality, shed_id=_loom_shed_id(loom_id))
+
+    @staticmethod
+    def calculate_payroll(start: str, end: str, **filters):
+        """
+        Salary for EVERY worker over a date range in a single scan.
+        Streams the production records once (only the slip fields)
+        and groups them by worker_id. 'filters': worker_id / shed_name.
+        A frozen period is read from its snapshot (per-shed parts of it
+        when filtered by shed).
+        Output: {worker_id: {"details": [...], "summary": {...}}}
+        """
+        snapshot = _snapshot_read(_frozen_period(start, end), **filters)
+        if snapshot is not None:
+            return _snapshot_slips(get_engine().get_payroll_slips(*snapshot), filters.get("shed_name"))
+
+        return CRUD.compute_payroll(_stream_production(start, end, **filters))
+
+    @staticmethod
+    def compute_payroll(records, by_shed: bool = False):
+        """
+        Groups production records by worker_id and summarises each: {worker_id: slip}.
+        by_shed adds each slip's per-shed parts, which a frozen snapshot keeps.
+        """
+        builders = {}
+        for r in records:
+            _add_to_payroll(builders, r)
+        return _payroll_slips(builders, by_shed)
+
+    @staticmethod
+    def production_version(start: str, end: str):
+        """
+        Write counters of the dates in [start, end] (production_versions),
+        after queued write-behind entries are flushed. It changes whenever
+        a production record dated in the range is created or changed.
+        """
+        writebehind.ensure_flushed()
+        return get_engine().production_versions(start, end)
+
+    # -------------------------------------------------
+    # PAYROLL PERIODS (Frozen snapshots, see app.payroll)
+    # -------------------------------------------------
+    @staticmethod
+    def get_payroll_periods():
+        _ensure_payroll_periods()
+        return payroll_periods.list_periods()
+
+    @staticmethod
+    def get_payroll_period(start: str, end: str):
+        """The period document (frozen or reopened), or None if never frozen."""
+        _ensure_payroll_periods()
+        return payroll_periods.get(period_id(start, end))
+
+    @staticmethod
+    def freeze_payroll(start: str, end: str, snapshot_id: str, slips: dict, computed_at: str = None):
+        """
+        Stores 'slips' (output of compute_payroll) as the period's next
+        snapshot version, then points the period document at it.
+        Raises PayrollConflict if the period is frozen or changed meanwhile.
+        """
+        _ensure_payroll_periods()
+        pid = period_id(start, end)
+        current = payroll_periods.get(pid) or {}
+        if current.get("status") == FROZEN:
+            raise PayrollConflict(f"Payroll period {pid} is already frozen (version {current['version']}); reopen it first")
+
+        # Slips first: until the period document points at them they are unused
+        get_engine().save_payroll_slips(pid, snapshot_id, slips)
+
+        frozen_at = now_iso()
+        version = current.get("version", 0) + 1
+        period = {
+            "start": start,
+            "end": end,
+            "status": FROZEN,
+            "version": version,
+            "snapshot_id": snapshot_id,
+            "revision": current.get("revision", 0) + 1,
+            "frozen_at": frozen_at,
+            "computed_at": computed_at or frozen_at,
+            "reopened_at": None,
+            "workers": len(slips),
+            "summary": payroll_summary(slips),
+            # Shed-filtered reads can use the snapshot only if it has per-shed parts
+            "by_shed": all("sheds" in slip for slip in slips.values()),
+            "history": current.get("history", []) + [
+                {"version": version, "snapshot_id": snapshot_id, "frozen_at": frozen_at, "reopened_at": None}
+            ],
+        }
+        get_engine().put_payroll_period(pid, period, current.get("revision", 0))
+        payroll_periods.put(pid, period)
+        return {"id": pid, **period}
+
+    @staticmethod
+    def undo_freeze(frozen: dict, previous: dict = None):
+        """
+        Puts the period document 'previous' (None: there was none) back in
+        place of 'frozen' (output of freeze_payroll). The slips stay unused.
+        """
+        pid = frozen["id"]
+        if previous is None:
+            get_engine().delete_payroll_period(pid, frozen["revision"])
+            payroll_periods.remove(pid)
+            return None
+        period = {k: v for k, v in previous.items() if k != "id"}
+        period["revision"] = frozen["revision"] + 1
+        get_engine().put_payroll_period(pid, period, frozen["revision"])
+        payroll_periods.put(pid, period)
+        return {"id": pid, **period}
+
+    @staticmethod
+    def reopen_payroll(start: str, end: str):
+        """
+        Unfreezes a period: its salary is computed live again until the
+        next freeze. Output: The period document, or None if never frozen.
+        """
+        _ensure_payroll_periods()
+        pid = period_id(start, end)
+        current = payroll_periods.get(pid)
+        if current is None:
+            return None
+        if current.get("status") != FROZEN:
+            raise PayrollConflict(f"Payroll period {pid} is not frozen")
+
+        reopened_at = now_iso()
+        period = {k: v for k, v in current.items() if k != "id"}
+        period.update(status=OPEN, revision=current["revision"] + 1, reopened_at=reopened_at)
+        period["history"] = [dict(h) for h in current.get("history", [])]
+        if period["history"]:
+            period["history"][-1]["reopened_at"] = reopened_at
+
+        get_engine().put_payroll_period(pid, period, current["revision"])
+        payroll_periods.put(pid, period)
+        return {"id": pid, **period}
+
+    @staticmethod
+    def _summarise_production(records):
+        """Builds the salary slip 'details' and 'summary' from production dicts."""
+        builder = _SlipBuilder()
+        for r in records:
+            builder.add(r)
+        return builder.slip()
+
+    @staticmethod
+    def salary_grid(slip: dict):
+        """
+        Pivots a salary slip into the date x loom grid the dashboard prints.
+        Input: Output of calculate_salary ('details' + 'summary').
+        Output: Parallel arrays - 'meters[i][j]' is the meters on dates[i] at looms[j].
+        """
+        details = slip["details"]
+        dates = sorted({d["date"] for d in details})
+        looms = sorted({d["loom"] for d in details}, key=natural_key)
+
+        date_index = {d: i for i, d in enumerate(dates)}
+        loom_index = {l: j for j, l in enumerate(looms)}
+        meters = [[0.0] * len(looms) for _ in dates]
+
+        for d in details:
+            meters[date_index[d["date"]]][loom_index[d["loom"]]] += d.get("meters") or 0
+
+        meters = [[round(value, 2) for value in row] for row in meters]
 
         return {
-            "details": details,
-            "summary": {
-                "total_meters": float(total_meters),
-                "total_salary": float(total_salary)
-            }
+            "dates": dates,
+            "looms": looms,
+            "meters": meters,
+            "loom_totals": [round(sum(row[j] for row in meters), 2) for j in range(len(looms))],
+            "date_totals": [round(sum(row), 2) for row in meters],
+            "summary": slip["summary"]
         }
 
-crud = CRUD()
\ No newline at end of file
+crud = CRUD()
+
+
+@instrument_crud
+class AsyncCRUD:
+    """
+    Async twin of CRUD for 'async def' routes. Same rules and output shapes:
+    everything but the storage calls lives in the module helpers both
+    classes call. Storage calls are awaited on the async engine, so slow
+    Firestore calls don't hold a pool thread, and production is streamed.
+    """
+
+    # -------------------------------------------------
+    # WORKER OPERATIONS
+    # -------------------------------------------------
+    @staticmethod
+    async def create_worker(worker_data: dict):
+        return _worker_created(await get_async_engine().create_worker(worker_data), worker_data)
+
+    @staticmethod
+    async def get_workers():
+        if refdata.ready:
+            return refdata.get_workers()
+
+        return await get_async_engine().list_workers()
+
+    @staticmethod
+    async def list_workers_page(limit: int, after: list = None, **filters):
+        if refdata.ready:
+            items = _page_workers_in_memory(refdata.get_workers(), limit + 1, after, **filters)
+        else:
+            items = await get_async_engine().query_workers(limit + 1, after, **filters)
+        return page(items, limit, _worker_sort_key)
+
+    @staticmethod
+    async def search_workers(query: str, limit: int = SEARCH_LIMIT, is_active: bool = None):
+        if refdata.ready:
+            return refdata.search_workers(query, limit, is_active)
+
+        index, generation = _cached(_worker_index_cache)
+        if index is None:
+            index = _build_worker_index(await get_async_engine().list_workers())
+            _store(_worker_index_cache, index, generation)
+        return _search_worker_index(index, query, limit, is_active)
+
+    # -------------------------------------------------
+    # SHED / LOOM OPERATIONS
+    # -------------------------------------------------
+    @staticmethod
+    async def create_shed(name: str):
+        return _shed_created(await get_async_engine().create_shed(name.upper()), name.upper())
+
+    @staticmethod
+    async def create_loom(shed_id: str, loom_number: str):
+        return _loom_created(shed_id, await get_async_engine().create_loom(shed_id, loom_number), loom_number)
+
+    @staticmethod
+    async def get_hierarchy():
+        if refdata.ready:
+            return refdata.get_hierarchy()
+
+        data, generation = _cached(_hierarchy_cache)
+        if data is None:
+            data = await get_async_engine().load_hierarchy()
+            _store(_hierarchy_cache, data, generation)
+        return data
+
+    # -------------------------------------------------
+    # PRODUCTION ENTRY
+    # -------------------------------------------------
+    @staticmethod
+    async def prepare_production(data: dict):
+        """
+        enrich_production + price_production. Until reference data and the
+        rate card are loaded they read storage, so then they run in a worker thread.
+        """
+        if not _lookups_read_storage():
+            return CRUD.price_production(CRUD.enrich_production(data))
+        return await to_thread.run_sync(lambda: CRUD.price_production(CRUD.enrich_production(data)))
+
+    @staticmethod
+    async def add_production(data: dict):
+        """'data' is an entry prepare_production already enriched and priced."""
+        record = CRUD._production_record(data)
+        await _aensure_payroll_periods()
+        with payroll_periods.writing([record["date"]]) as blocked:
+            if blocked:
+                raise PayrollConflict(blocked[record["date"]])
+            if writebehind.write_behind is not None:
+                # The journal append fsyncs, so it runs off the event loop
+                record_id = (await to_thread.run_sync(writebehind.write_behind.enqueue, [record]))[0]
+                return {"id": record_id, **record, "queued": True}
+
+            record_id = await get_async_engine().insert_production(record)
+        archive.touch([record["date"]])
+        return {"id": record_id, **record}
+
+    @staticmethod
+    async def add_production_bulk(rows: list):
+        """'rows' are entries prepare_production already enriched and priced."""
+        await _aensure_payroll_periods()
+        built = [CRUD._production_record(data) for data in rows]
+        with payroll_periods.writing(r["date"] for r in built) as blocked:
+            writable, rejected = _reject_frozen(built, blocked)
+            records = [record for _, record in writable]
+            if not records:
+                results = []
+            elif writebehind.write_behind is not None:
+                ids = await to_thread.run_sync(writebehind.write_behind.enqueue, records)
+                results = [{"index": i, "id": record_id} for i, record_id in enumerate(ids)]
+            else:
+                results = await get_async_engine().insert_production_many(records)
+                # Stored rows only; queued ones are marked by the flusher once stored
+                archive.touch(records[r["index"]]["date"] for r in results if "error" not in r)
+        return _merge_results(writable, results, rejected)
+
+    @staticmethod
+    async def lookup_production(worker_id: str, loom_id: str, day: str, shift: str = None):
+        keys = _production_keys(worker_id, loom_id, day, shift)
+        return _with_pending(keys, await get_async_engine().get_production(keys))
+
+    # -------------------------------------------------
+    # SALARY CALCULATION
+    # -------------------------------------------------
+    @staticmethod
+    async def calculate_salary(worker_id: str, start: str, end: str):
+        snapshot = _snapshot_read(await _afrozen_period(start, end), worker_id)
+        if snapshot is not None:
+            slips = await get_async_engine().get_payroll_slips(*snapshot)
+            return _snapshot_slips(slips).get(worker_id) or _SlipBuilder().slip()
+
+        builder = _SlipBuilder()
+        async for r in _astream_production(start, end, worker_id=worker_id):
+            builder.add(r)
+        return builder.slip()
+
+    @staticmethod
+    async def list_production_page(limit: int, after: list = None, **filters):
+        items = await get_async_engine().query_production(limit + 1, after, **filters)
+        return page(items, limit, _production_sort_key)
+
+    @staticmethod
+    async def production_totals(worker_id: str, start: str, end: str):
+        return await get_async_engine().production_totals(worker_id, start, end)
+
+    @staticmethod
+    async def rebuild_rollups(start: str, end: str):
+        return await get_async_engine().rebuild_rollups(start, end)
+
+    # -------------------------------------------------
+    # RATE CARD
+    # -------------------------------------------------
+    @staticmethod
+    async def create_rate(data: dict):
+        rid, rate = _rate_document(data)
+        await get_async_engine().put_rate(rid, rate)
+        ratecard.put(rid, rate)
+        return {"id": rid, **rate}
+
+    @staticmethod
+    async def get_rates(scope: str = None, key: str = None):
+        if ratecard.ready:
+            return CRUD.get_rates(scope, key)
+        return await to_thread.run_sync(CRUD.get_rates, scope, key)
+
+    @staticmethod
+    async def resolve_rate(loom_id: str, day: str, quality: str = None):
+        if not _lookups_read_storage():
+            return CRUD.resolve_rate(loom_id, day, quality)
+        return await to_thread.run_sync(CRUD.resolve_rate, loom_id, day, quality)
+
+    @staticmethod
+    async def calculate_payroll(start: str, end: str, **filters):
+        snapshot = _snapshot_read(await _afrozen_period(start, end), **filters)
+        if snapshot is not None:
+            slips = await get_async_engine().get_payroll_slips(*snapshot)
+            return _snapshot_slips(slips, filters.get("shed_name"))
+
+        builders = {}
+        async for r in _astream_production(start, end, **filters):
+            _add_to_payroll(builders, r)
+        return _payroll_slips(builders)
+
+    # Pure helpers are shared with the sync CRUD
+    enrich_production = staticmethod(CRUD.enrich_production)
+    price_production = staticmethod(CRUD.price_production)
+    salary_grid = staticmethod(CRUD.salary_grid)
+
+acrud = AsyncCRUD()
\ No newline at end of file
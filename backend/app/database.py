@@ -1,38 +1,101 @@
-import os
-import firebase_admin
-from firebase_admin import credentials, firestore
+import logging
+import threading
 from pathlib import Path
 
+logger = logging.getLogger(__name__)
+
 # --------------------------------------------------
-# Firebase Firestore Initialization
+# Firebase Initialization (Lazy, once per process)
 # --------------------------------------------------
+# This is the only place Firebase is initialised. Nothing happens at import
+# time: firebase_admin, google-cloud-firestore and gRPC are imported and the
+# app / clients created on first use, so importing the API stays cheap on a
+# cold start. app.startup pre-warms them in the background after startup.
 
 # Get the absolute path to the service account JSON
 # This assumes the JSON is in the 'backend/' folder (one level up from 'app/')
 base_dir = Path(__file__).resolve().parent.parent
 cred_path = base_dir / "firebase-service-account.json"
 
-# Initialize the Firebase app only if it hasn't been initialized already
-if not firebase_admin._apps:
+_init_lock = threading.Lock()
+_db = None
+_async_db = None
+
+
+def get_firebase_app():
+    """
+    The default firebase_admin App, initialised on first call.
+    Without the service account file only Firestore is unusable: token
+    verification needs just the project id (GOOGLE_CLOUD_PROJECT) and
+    Google's public certificates, so local (e.g. SQLite) runs still work.
+    """
+    import firebase_admin
+    from firebase_admin import credentials
+
+    with _init_lock:
+        if not firebase_admin._apps:
+            if cred_path.exists():
+                firebase_admin.initialize_app(credentials.Certificate(str(cred_path)))
+            else:
+                logger.warning("Firebase service account file not found at %s; using default credentials", cred_path)
+                firebase_admin.initialize_app()
+        return firebase_admin.get_app()
+
+
+def _require_credentials():
     if not cred_path.exists():
         raise FileNotFoundError(
             f"Firebase service account file not found at: {cred_path}. "
             "Please ensure you have downloaded it from the Firebase Console."
         )
-    
-    cred = credentials.Certificate(str(cred_path))
-    firebase_admin.initialize_app(cred)
+
 
 # --------------------------------------------------
 # Firestore Database Client
 # --------------------------------------------------
-# This 'db' object replaces your old 'engine' and 'SessionLocal'
-# You will use this directly in your crud.py and main.py
-db = firestore.client()
-
+# Wrapped so every call is counted in /metrics (see app/metrics.py) and
+# runs behind the concurrency cap and circuit breaker (app/resilience.py)
 def get_firestore_db():
     """
-    Returns the Firestore client. 
+    Returns the Firestore client, creating it on first use.
     Unlike the old SQL get_db, this does not need to be closed.
     """
-    return db
\ No newline at end of file
+    global _db
+    if _db is None:
+        from firebase_admin import firestore
+        from .metrics import instrument_client
+        from .resilience import protect_client
+
+        _require_credentials()
+        app = get_firebase_app()
+        with _init_lock:
+            if _db is None:
+                _db = protect_client(instrument_client(firestore.client(app)))
+    return _db
+
+
+# --------------------------------------------------
+# Async Firestore Client (for the async request path)
+# --------------------------------------------------
+# Created on first use inside the event loop so its gRPC channel binds to it.
+def get_async_firestore_db():
+    """Returns the shared firestore.AsyncClient."""
+    global _async_db
+    if _async_db is None:
+        from firebase_admin import firestore_async
+        from .metrics import instrument_client
+        from .resilience import protect_client
+
+        _require_credentials()
+        app = get_firebase_app()
+        with _init_lock:
+            if _async_db is None:
+                _async_db = protect_client(instrument_client(firestore_async.client(app)), is_async=True)
+    return _async_db
+
+
+def use_clients(db, async_db=None):
+    """Installs ready-made clients (benchmarks' in-memory Firestore)."""
+    global _db, _async_db
+    with _init_lock:
+        _db, _async_db = db, async_db
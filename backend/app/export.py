@@ -0,0 +1,183 @@
+import csv
+import io
+import json
+from datetime import date
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import FileResponse, StreamingResponse
+from .auth import admin_required
+from .crud import crud
+from .refdata import refdata
+from .slips import slip_jobs
+from .storage.base import PRODUCTION_FIELDS
+
+# We define the router here to be included in main.py
+router = APIRouter()
+
+# These routes are plain 'def': StreamingResponse iterates the sync
+# storage cursor in the thread pool, keeping the event loop free.
+
+# Rows are flushed to the client in chunks of this size
+EXPORT_CHUNK_ROWS = 500
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+PRODUCTION_COLUMNS = ["date", "shift", "worker_id", "worker_name", "loom_id",
+                      "shed_name", "loom_number", "meters", "rate", "total_amount"]
+
+SALARY_COLUMNS = ["worker_id", "worker_name", "shifts", "total_meters", "total_salary"]
+
+
+# --------------------------------------------------
+# ENCODERS
+# --------------------------------------------------
+def _encode(rows, columns: list, fmt: str):
+    """
+    Turns an iterator of dicts into CSV or NDJSON text chunks.
+    Nothing is buffered beyond one chunk, so memory stays constant.
+    """
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+    if fmt == "csv":
+        # Send the header at once so the download starts immediately
+        writer.writeheader()
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    count = 0
+    for row in rows:
+        if fmt == "csv":
+            writer.writerow(row)
+        else:
+            buffer.write(json.dumps({col: row.get(col) for col in columns}) + "\n")
+
+        count += 1
+        if count % EXPORT_CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue()
+
+
+def _worker_name(worker_id: str):
+    worker = refdata.get_worker(worker_id)
+    return worker.get("name") if worker else None
+
+
+def _streaming_response(rows, columns: list, fmt: str, filename: str):
+    return StreamingResponse(
+        _encode(rows, columns, fmt),
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'}
+    )
+
+
+# --------------------------------------------------
+# PRODUCTION REGISTER EXPORT
+# --------------------------------------------------
+@router.get("/export/production")
+def export_production(
+    start_date: date = Query(..., description="Format: YYYY-MM-DD"),
+    end_date: date = Query(..., description="Format: YYYY-MM-DD"),
+    worker_id: Optional[str] = None,
+    shed_name: Optional[str] = None,
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    admin=Depends(admin_required)
+):
+    """
+    Streams every production record in the range, straight from the
+    storage cursor, as CSV or NDJSON. Filter by worker and/or shed.
+    """
+    records = crud.stream_production(
+        str(start_date), str(end_date),
+        worker_id=worker_id,
+        shed_name=shed_name.upper() if shed_name else None,
+        fields=PRODUCTION_FIELDS
+    )
+    rows = ({**r, "worker_name": _worker_name(r.get("worker_id"))} for r in records)
+
+    return _streaming_response(rows, PRODUCTION_COLUMNS, format, f"production_{start_date}_{end_date}")
+
+
+# --------------------------------------------------
+# SALARY EXPORT
+# --------------------------------------------------
+@router.get("/export/salary")
+def export_salary(
+    start_date: date = Query(..., description="Format: YYYY-MM-DD"),
+    end_date: date = Query(..., description="Format: YYYY-MM-DD"),
+    worker_id: Optional[str] = None,
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    admin=Depends(admin_required)
+):
+    """
+    Streams one salary line per worker for the period. Each line is
+    computed from the production totals (rollups on Firestore) as it is
+    sent, so the first rows arrive before the last worker is summed.
+    """
+    worker_ids = [worker_id] if worker_id else [w["id"] for w in crud.get_workers()]
+
+    def rows():
+        for wid in worker_ids:
+            summary = crud.production_totals(wid, str(start_date), str(end_date))["summary"]
+            if not summary["shifts"]:
+                continue
+            yield {"worker_id": wid, "worker_name": _worker_name(wid), **summary}
+
+    return _streaming_response(rows(), SALARY_COLUMNS, format, f"salary_{start_date}_{end_date}")
+
+
+# --------------------------------------------------
+# SALARY SLIP PDFs (Background job, see app/slips.py)
+# --------------------------------------------------
+@router.post("/export/slips", status_code=202)
+def start_slip_export(
+    start_date: date = Query(..., description="Format: YYYY-MM-DD"),
+    end_date: date = Query(..., description="Format: YYYY-MM-DD"),
+    worker_id: Optional[str] = None,
+    shed_name: Optional[str] = None,
+    format: str = Query("pdf", pattern="^(pdf|zip)$", description="One merged PDF or a zip of one PDF per worker"),
+    admin=Depends(admin_required)
+):
+    """
+    Starts rendering the printed salary slip of every worker with production
+    in the period (optionally one shed or worker). Returns the job at once:
+    poll /export/slips/{job_id} and download when 'download' is true.
+    """
+    return slip_jobs.submit(
+        str(start_date), str(end_date), format,
+        worker_id=worker_id,
+        shed_name=shed_name.upper() if shed_name else None
+    )
+
+
+@router.get("/export/slips/{job_id}")
+def slip_export_status(job_id: str, admin=Depends(admin_required)):
+    """Job status and progress: 'done' of 'total' slips rendered."""
+    job = slip_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired slip job")
+    return job
+
+
+@router.get("/export/slips/{job_id}/download")
+def download_slip_export(job_id: str, admin=Depends(admin_required)):
+    """The finished PDF or zip. 409 while the job is still running."""
+    job = slip_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired slip job")
+    if job["status"] == "failed":
+        raise HTTPException(status_code=500, detail=f"Slip job failed: {job['error']}")
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Slip job is {job['status']} ({job['done']}/{job['total']})")
+
+    result = slip_jobs.result(job_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="No production records in this period")
+    path, media_type, filename = result
+    return FileResponse(path, media_type=media_type, filename=filename)
@@ -0,0 +1,32 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from .auth import admin_required
+from .archive import archive, ArchiveDisabled
+
+# We define the router here to be included in main.py
+router = APIRouter()
+
+
+# --------------------------------------------------
+# PRODUCTION ARCHIVE (see app/archive.py)
+# --------------------------------------------------
+@router.get("/archive")
+async def archive_status(admin=Depends(admin_required)):
+    """Archived months (rows, size, when written) and the last run (Admin only)."""
+    return archive.status()
+
+
+@router.post("/archive/run")
+def run_archive(
+    force: bool = Query(False, description="Rewrite every closed month, changed or not"),
+    admin=Depends(admin_required)
+):
+    """
+    Archives closed months to Parquet now; months whose totals are
+    unchanged since the last run (and not written through the API) are
+    skipped. Use force after editing production outside the API.
+    Runs in the thread pool.
+    """
+    try:
+        return archive.run(force=force)
+    except ArchiveDisabled as e:
+        raise HTTPException(status_code=409, detail=str(e))
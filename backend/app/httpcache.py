@@ -0,0 +1,89 @@
+import hashlib
+import json
+import threading
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from .compression import ETAG_SUFFIXES
+
+# --------------------------------------------------
+# CONDITIONAL GET (ETag / If-None-Match -> 304)
+# --------------------------------------------------
+# Read routes answer with a strong ETag: a hash of the exact JSON body, so
+# it is the same on every server instance. A client that sends it back in
+# If-None-Match gets an empty 304 (a few hundred bytes of headers).
+#
+# Responses built from app.refdata (worker list, hierarchy) are also
+# memoised per refdata.version: a repeat request costs a dict lookup, not
+# a rebuild + serialise + hash.
+#
+# Everything is behind auth, so shared caches must not store it (private),
+# and browsers must revalidate before reuse (no-cache).
+REVALIDATE = "private, no-cache"
+
+_memo_lock = threading.Lock()
+_memo = {}  # key -> (version, body, etag)
+
+
+def render_json(content):
+    """
+    Same bytes as FastAPI's default JSONResponse. Content that is plain JSON
+    already (most of it: slips, pages) skips jsonable_encoder's walk.
+    """
+    try:
+        text = json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":"))
+    except TypeError:
+        text = json.dumps(
+            jsonable_encoder(content), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+        )
+    return text.encode("utf-8")
+
+
+def etag_for(body: bytes):
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def _matches(if_none_match: str, etag: str):
+    """Weak comparison (RFC 9110): W/ and our compression suffixes are ignored."""
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        for suffix in ETAG_SUFFIXES.values():
+            if candidate.endswith(suffix + '"'):
+                candidate = candidate[:-len(suffix) - 1] + '"'
+                break
+        if candidate == etag:
+            return True
+    return False
+
+
+def _respond(request: Request, body: bytes, etag: str, cache_control: str):
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def json_response(request: Request, content, cache_control: str = REVALIDATE):
+    """'content' as JSON with an ETag, or a 304 if the client already has it."""
+    body = render_json(content)
+    return _respond(request, body, etag_for(body), cache_control)
+
+
+async def versioned_json_response(request: Request, key: str, version: int, build,
+                                  cache_control: str = REVALIDATE):
+    """
+    Like json_response for content that only changes with 'version'.
+    'build' is an async callable producing the content on a cache miss.
+    """
+    with _memo_lock:
+        cached = _memo.get(key)
+    if cached is None or cached[0] != version:
+        body = render_json(await build())
+        cached = (version, body, etag_for(body))
+        with _memo_lock:
+            _memo[key] = cached
+    return _respond(request, cached[1], cached[2], cache_control)
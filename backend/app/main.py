@@ -1,21 +1,123 @@
-from fastapi import FastAPI, Depends, HTTPException
+from .startup import startup, WarmUpStep  # First: starts the boot timer
+
+import logging
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 
 # Updated Imports: Including get_current_user for role management
-from .database import db 
-from .auth import admin_required, get_current_user 
-from .crud import crud
+from .storage import get_engine, STORAGE_ENGINE
+from .auth import admin_required, get_current_user, token_cache, warm_signing_certs
+from .crud import acrud
 from .schemas import WorkerCreate
+from .pagination import decode_cursor, WORKER_CURSOR, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 from .salary import router as salary_router
+from .export import router as export_router
+from .rates import router as rates_router
+from .periods import router as periods_router
+from .reports import router as reports_router
+from .history import router as history_router
+from .refdata import refdata
+from .search import SEARCH_LIMIT, SEARCH_MAX_LIMIT
+from .ratecard import ratecard
+from .payroll import payroll_periods
+from .payroll_runs import payroll_runs
+from .writebehind import write_behind
+from .slips import slip_jobs
+from .archive import archive
+from . import resilience
+from .metrics import MetricsMiddleware, render as render_metrics
+from .profiling import ProfilingMiddleware
+from .compression import CompressionMiddleware
+from .httpcache import json_response, versioned_json_response
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------
+# WARM-UP STEPS (Run in the background, see app/startup.py)
+# --------------------------------------------------
+def load_reference_data():
+    # Load workers/sheds/looms into memory and keep them live via the engine's
+    # change feed. If it cannot start, CRUD falls back to reading storage.
+    try:
+        feed = get_engine().reference_feed()
+        refdata.start(feed)
+        ratecard.start(feed)
+        payroll_periods.start(feed)
+    except Exception as e:
+        logger.warning("Reference data listeners not started: %s", e)
+
+    # Production entries are priced from the rate card on the event loop, so
+    # it must be in memory even without a feed (until then CRUD loads it).
+    if not ratecard.ready:
+        ratecard.load(get_engine().list_rates())
+    # Salary reads check it for frozen periods
+    if not payroll_periods.ready:
+        payroll_periods.load(get_engine().list_payroll_periods())
+
+
+async def open_firestore_channel():
+    """Opens the AsyncClient's gRPC channel on the serving loop (one small read)."""
+    if get_engine().name == "firestore":
+        from .database import get_async_firestore_db
+        await get_async_firestore_db().collection("sheds").limit(1).get()
+
+
+WARM_UP_STEPS = [
+    WarmUpStep("storage", get_engine),
+    WarmUpStep("reference_data", load_reference_data),
+    WarmUpStep("firestore_channel", open_firestore_channel, required=False),
+    WarmUpStep("auth_certificates", warm_signing_certs, required=False),
+]
+
+# --------------------------------------------------
+# LIFESPAN (Startup / Shutdown)
+# --------------------------------------------------
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Optional write-behind journal: re-queues entries a crash left unflushed
+    if write_behind is not None:
+        write_behind.start()
+    # Parquet archive of closed months (no-op unless ARCHIVE_DIR is set)
+    archive.start()
+
+    # Nothing slow before the server accepts connections: /ready reports it
+    startup.begin(WARM_UP_STEPS)
+    yield
+    await startup.stop()
+    slip_jobs.stop()
+    payroll_runs.stop()
+    archive.stop()
+    if write_behind is not None:
+        write_behind.stop()
+    payroll_periods.stop()
+    ratecard.stop()
+    refdata.stop()
 
 # --------------------------------------------------
 # APP INITIALIZATION
 # --------------------------------------------------
-app = FastAPI(title="ASM Loom Management - Firestore Edition")
+app = FastAPI(title="ASM Loom Management - Firestore Edition", lifespan=lifespan)
 
 # --------------------------------------------------
-# CORS (REQUIRED FOR REACT & VERCEL)
+# MIDDLEWARE
 # --------------------------------------------------
+# Each add_middleware wraps the ones added before it, so they are added
+# innermost first. Request order: CORS -> compression -> metrics -> profiling.
+
+# Slow-request log with per-phase timing; admin opt-in profiles (X-Profile: 1).
+# Inside CORS and compression, so a profile is readable cross-origin and compressed.
+app.add_middleware(ProfilingMiddleware)
+
+# Per-route latency and in-flight requests, served at /metrics
+app.add_middleware(MetricsMiddleware)
+
+# Brotli/gzip for text responses above COMPRESS_MIN_BYTES
+app.add_middleware(CompressionMiddleware)
+
+# CORS (REQUIRED FOR REACT & VERCEL)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -29,19 +131,54 @@ app.add_middleware(
 # --------------------------------------------------
 # Connects production entry and salary logic
 app.include_router(salary_router, prefix="/api/v1", tags=["Salary & Production"])
+app.include_router(export_router, prefix="/api/v1", tags=["Export"])
+app.include_router(rates_router, prefix="/api/v1", tags=["Rate Card"])
+app.include_router(periods_router, prefix="/api/v1", tags=["Payroll Periods"])
+app.include_router(reports_router, prefix="/api/v1", tags=["Analytics"])
+app.include_router(history_router, prefix="/api/v1", tags=["Archive"])
+
+# --------------------------------------------------
+# BACKPRESSURE (see app/resilience.py)
+# --------------------------------------------------
+@app.exception_handler(resilience.StorageUnavailable)
+async def storage_unavailable(request: Request, exc: resilience.StorageUnavailable):
+    """Shed load / open circuit: clients back off instead of waiting on a timeout."""
+    return JSONResponse(
+        {"detail": str(exc)},
+        status_code=503,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 
 # --------------------------------------------------
 # HEALTH CHECK
 # --------------------------------------------------
 @app.get("/health")
-def health_check():
-    return {"status": "ok", "database": "firestore"}
+async def health_check():
+    """
+    Liveness: the process is serving (see /ready for readiness). Stays 200
+    during a Firestore outage; 'firestore' shows the circuit breaker.
+    """
+    return {"status": "ok", "database": STORAGE_ENGINE, "firestore": resilience.status()}
+
+@app.get("/ready")
+async def readiness_check():
+    """Readiness: 200 once the background warm-up succeeded, 503 until then."""
+    status = startup.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+# --------------------------------------------------
+# METRICS (Prometheus scrape target)
+# --------------------------------------------------
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
 
 # --------------------------------------------------
 # AUTH TEST ENDPOINT (Use this to test Admin vs User)
 # --------------------------------------------------
 @app.get("/api/v1/auth/me", tags=["Authentication"])
-def get_my_role(user=Depends(get_current_user)):
+async def get_my_role(user=Depends(get_current_user)):
     """
     Returns the current user's role info.
     Accessible by ANY logged-in user.
@@ -60,47 +197,90 @@ def get_my_role(user=Depends(get_current_user)):
         "uid": user.get("uid")
     }
 
+@app.get("/api/v1/auth/token-cache", tags=["Authentication"])
+async def get_token_cache_stats(admin=Depends(admin_required)):
+    """Hit/miss counters of the verified-token cache (Admin only)."""
+    return token_cache.stats()
+
 # --------------------------------------------------
 # WORKERS
 # --------------------------------------------------
 @app.post("/api/v1/workers/")
-def create_worker(
+async def create_worker(
     worker: WorkerCreate,
     admin=Depends(admin_required) # Security check: Only Admins can create
 ):
     """Creates a worker in the 'workers' collection."""
-    return crud.create_worker(worker.dict())
+    return await acrud.create_worker(worker.dict())
 
 @app.get("/api/v1/workers/")
-def list_workers(
+async def list_workers(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description=f"Page size (default {DEFAULT_PAGE_SIZE})"),
+    start_after: Optional[str] = Query(None, description="'next_cursor' of the previous page"),
+    is_active: Optional[bool] = None,
+    name_prefix: Optional[str] = None,
+    shed_id: Optional[str] = None,
     user=Depends(get_current_user) # CHANGED: Regular users can now VIEW workers
 ):
-    """Fetches all worker documents."""
-    return crud.get_workers()
+    """
+    Without any paging/filter parameter: all workers as a plain list (legacy).
+    Otherwise: one page {"items", "next_cursor"} ordered by name.
+    Send the ETag back in If-None-Match to get a 304 when nothing changed.
+    """
+    filters = {"is_active": is_active, "name_prefix": name_prefix, "shed_id": shed_id}
+    if limit is None and start_after is None and not any(v is not None for v in filters.values()):
+        if refdata.ready:
+            return await versioned_json_response(request, "workers", refdata.version, acrud.get_workers)
+        return json_response(request, await acrud.get_workers())
+
+    try:
+        after = decode_cursor(start_after, WORKER_CURSOR)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return json_response(request, await acrud.list_workers_page(limit or DEFAULT_PAGE_SIZE, after, **filters))
+
+@app.get("/api/v1/workers/search")
+async def search_workers(
+    q: str = Query(..., min_length=1, max_length=100, description="Start of a name, part of a name or phone digits"),
+    limit: int = Query(SEARCH_LIMIT, ge=1, le=SEARCH_MAX_LIMIT),
+    is_active: Optional[bool] = None,
+    user=Depends(get_current_user)
+):
+    """
+    Typeahead: the best `limit` workers for what has been typed so far,
+    ranked by app/search.py. Served from memory; no storage read per call
+    (before reference data is loaded, one read per WORKER_INDEX_TTL).
+    """
+    return await acrud.search_workers(q, limit, is_active)
 
 # --------------------------------------------------
 # SHEDS & LOOMS
 # --------------------------------------------------
 @app.post("/api/v1/sheds/")
-def add_shed(
+async def add_shed(
     name: str,
     admin=Depends(admin_required) # Security check: Only Admins can create
 ):
     """Creates a new Shed document."""
-    return crud.create_shed(name)
+    return await acrud.create_shed(name)
 
 @app.get("/api/v1/sheds-looms/")
-def get_shed_hierarchy(
+async def get_shed_hierarchy(
+    request: Request,
     user=Depends(get_current_user) # CHANGED: Regular users can VIEW hierarchy
 ):
-    """Returns sheds with their nested looms sub-collection."""
-    return crud.get_hierarchy()
+    """Returns sheds with their nested looms sub-collection (ETag / 304 like /workers/)."""
+    if refdata.ready:
+        return await versioned_json_response(request, "hierarchy", refdata.version, acrud.get_hierarchy)
+    return json_response(request, await acrud.get_hierarchy())
 
 @app.post("/api/v1/looms/")
-def add_loom(
+async def add_loom(
     shed_id: str, # Firestore IDs are strings
     loom_num: str,
     admin=Depends(admin_required) # Security check: Only Admins can create
 ):
     """Adds a loom document to a specific shed's sub-collection."""
-    return crud.create_loom(shed_id, loom_num)
\ No newline at end of file
+    return await acrud.create_loom(shed_id, loom_num)
\ No newline at end of file
@@ -0,0 +1,407 @@
+import time
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+from starlette.routing import Match
+from .profiling import add_phase
+
+try:
+    from fastapi.routing import iter_route_contexts
+except ImportError:  # Older FastAPI copies included routes into app.routes
+    iter_route_contexts = None
+
+# --------------------------------------------------
+# PROMETHEUS METRICS
+# --------------------------------------------------
+# Served as text at GET /metrics:
+#   asm_http_request_duration_seconds{method, route, status}  histogram
+#   asm_http_requests_in_flight{method, route}                gauge
+#   asm_firestore_operations_total{collection, op}            counter
+#   asm_firestore_documents_read_total{collection, op}        counter (billed reads)
+#   asm_firestore_documents_written_total{collection, op}     counter
+#   asm_firestore_operation_seconds{collection, op}           histogram
+#   asm_firestore_in_flight{client} / asm_firestore_queued{client}  gauges (see app/resilience.py)
+#   asm_firestore_open_streams{client}                         gauge
+#   asm_firestore_rejected_total{reason}                      counter (answered 503)
+#   asm_firestore_retries_total{op}                           counter (read retries)
+#   asm_firestore_circuit_state                               gauge (0 closed, 1 half open, 2 open)
+#   asm_firestore_circuit_opened_total                        counter
+#   asm_write_behind_pending                                  gauge (journaled, not yet stored)
+#   asm_write_behind_flushed_total / _flush_failures_total    counters
+#   asm_startup_seconds{phase}                                gauge (see app/startup.py)
+# 'route' is the route template (e.g. /api/v1/salary/calculate), never the
+# raw path, so label cardinality stays bounded. Subcollections are labelled
+# by their id ('looms'), not by their full path.
+
+HTTP_REQUEST_DURATION = Histogram(
+    "asm_http_request_duration_seconds",
+    "HTTP request latency, until the last body byte is sent",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "asm_http_requests_in_flight",
+    "HTTP requests currently being served",
+    ["method", "route"],
+)
+FIRESTORE_OPERATIONS = Counter(
+    "asm_firestore_operations",
+    "Firestore calls by collection and type",
+    ["collection", "op"],
+)
+FIRESTORE_DOCUMENTS_READ = Counter(
+    "asm_firestore_documents_read",
+    "Documents returned by Firestore (each one is a billed read)",
+    ["collection", "op"],
+)
+FIRESTORE_DOCUMENTS_WRITTEN = Counter(
+    "asm_firestore_documents_written",
+    "Documents written to Firestore",
+    ["collection", "op"],
+)
+FIRESTORE_OPERATION_SECONDS = Histogram(
+    "asm_firestore_operation_seconds",
+    "Firestore call latency (streams: until the last document)",
+    ["collection", "op"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 10.0),
+)
+FIRESTORE_IN_FLIGHT = Gauge(
+    "asm_firestore_in_flight",
+    "Firestore operations running, per client (sync / async)",
+    ["client"],
+)
+FIRESTORE_QUEUED = Gauge(
+    "asm_firestore_queued",
+    "Firestore operations waiting for a free slot, per client",
+    ["client"],
+)
+FIRESTORE_OPEN_STREAMS = Gauge(
+    "asm_firestore_open_streams",
+    "Firestore streams past their first document (they no longer hold a slot), per client",
+    ["client"],
+)
+FIRESTORE_REJECTED = Counter(
+    "asm_firestore_rejected",
+    "Firestore operations refused without calling Firestore (queue full or timed out, circuit open)",
+    ["reason"],
+)
+FIRESTORE_RETRIES = Counter(
+    "asm_firestore_retries",
+    "Firestore reads retried after a transient error",
+    ["op"],
+)
+FIRESTORE_CIRCUIT_STATE = Gauge(
+    "asm_firestore_circuit_state",
+    "Firestore circuit breaker: 0 closed, 1 half open (probing), 2 open (failing fast)",
+)
+FIRESTORE_CIRCUIT_OPENED = Counter(
+    "asm_firestore_circuit_opened",
+    "Times the Firestore circuit breaker opened",
+)
+WRITE_BEHIND_PENDING = Gauge(
+    "asm_write_behind_pending",
+    "Production records in the write-behind journal waiting to be stored",
+)
+WRITE_BEHIND_FLUSHED = Counter(
+    "asm_write_behind_flushed",
+    "Production records group-committed by the write-behind flusher",
+)
+WRITE_BEHIND_FLUSH_FAILURES = Counter(
+    "asm_write_behind_flush_failures",
+    "Write-behind batches that failed to commit (and were retried)",
+)
+WRITE_BEHIND_DEAD_LETTERS = Counter(
+    "asm_write_behind_dead_letters",
+    "Write-behind records storage rejected for good (moved to the dead-letter file)",
+)
+STARTUP_SECONDS = Gauge(
+    "asm_startup_seconds",
+    "Seconds from app import to a startup phase (lifespan, ready, first_response)",
+    ["phase"],
+)
+
+UNMATCHED_ROUTE = "unmatched"
+
+
+def render():
+    """Output: (body, content type) of the Prometheus text exposition."""
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def record_firestore_call(collection: str, op: str, seconds: float, reads: int = 0, writes: int = 0):
+    add_phase(f"firestore.{op}:{collection}", seconds)
+    FIRESTORE_OPERATIONS.labels(collection, op).inc()
+    FIRESTORE_OPERATION_SECONDS.labels(collection, op).observe(seconds)
+    if reads:
+        FIRESTORE_DOCUMENTS_READ.labels(collection, op).inc(reads)
+    if writes:
+        FIRESTORE_DOCUMENTS_WRITTEN.labels(collection, op).inc(writes)
+
+
+# --------------------------------------------------
+# HTTP MIDDLEWARE
+# --------------------------------------------------
+def flat_routes(routes):
+    """App routes with included routers expanded to their full-path routes."""
+    return list(iter_route_contexts(routes)) if iter_route_contexts else list(routes)
+
+
+def route_template(routes, scope):
+    """The path template of the route that will serve this request."""
+    for route in routes:
+        match, _ = route.matches(scope)
+        if match != Match.NONE:
+            return route.path
+    return UNMATCHED_ROUTE
+
+
+class MetricsMiddleware:
+    """
+    Plain ASGI middleware (not BaseHTTPMiddleware) so streamed responses
+    pass through untouched and are timed until their last chunk.
+    """
+
+    def __init__(self, app):
+        from .startup import startup
+
+        self.app = app
+        self._routes = None
+        self._startup = startup
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        if self._routes is None:
+            self._routes = flat_routes(scope["app"].routes)
+        method, route = scope["method"], route_template(self._routes, scope)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                self._startup.mark_first_response()
+            await send(message)
+
+        in_flight = HTTP_REQUESTS_IN_FLIGHT.labels(method, route)
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            HTTP_REQUEST_DURATION.labels(method, route, str(status["code"])).observe(time.perf_counter() - started)
+
+
+# --------------------------------------------------
+# FIRESTORE CLIENT WRAPPER
+# --------------------------------------------------
+# instrument_client() wraps a firestore.Client or AsyncClient. Collections,
+# queries, document references and batches it hands out are wrapped too,
+# so every call is recorded without touching the code that makes it.
+# Sync and async clients share the wrappers: results that are coroutines or
+# async iterators are recorded when they complete.
+
+# Query builders: their result is wrapped again with the same label
+QUERY_BUILDERS = {
+    "where", "order_by", "limit", "limit_to_last", "offset", "select",
+    "start_at", "start_after", "end_at", "end_before",
+}
+
+
+def _unwrap(obj):
+    return obj._target if isinstance(obj, _Wrapper) else obj
+
+
+def _collection_label(path: str):
+    """'sheds/abc/looms' -> 'looms'"""
+    return path.strip("/").split("/")[-1]
+
+
+def _record_docs(result, collection: str, op: str, started: float, count=lambda doc: 1):
+    """Records a stream of snapshots when it is exhausted or closed."""
+    if hasattr(result, "__aiter__"):
+        async def agen():
+            docs = 0
+            try:
+                async for doc in result:
+                    docs += count(doc)
+                    yield doc
+            finally:
+                record_firestore_call(collection, op, time.perf_counter() - started, reads=docs)
+        return agen()
+
+    def gen():
+        docs = 0
+        try:
+            for doc in result:
+                docs += count(doc)
+                yield doc
+        finally:
+            record_firestore_call(collection, op, time.perf_counter() - started, reads=docs)
+    return gen()
+
+
+def _record_result(result, collection: str, op: str, started: float, reads=None, writes: int = 0):
+    """
+    Records a single call. 'reads' maps the call's result to a document
+    count; awaitables are recorded once awaited.
+    """
+    def finish(value):
+        count = reads(value) if reads else 0
+        record_firestore_call(collection, op, time.perf_counter() - started, reads=count, writes=writes)
+        return value
+
+    if hasattr(result, "__await__"):
+        async def wait():
+            return finish(await result)
+        return wait()
+    return finish(result)
+
+
+def _exists(snapshot):
+    return 1 if getattr(snapshot, "exists", False) else 0
+
+
+class _Wrapper:
+    __slots__ = ("_target", "_collection")
+
+    def __init__(self, target, collection: str = None):
+        self._target = target
+        self._collection = collection
+
+    def __getattr__(self, name):
+        return getattr(self._target, name)
+
+    def __repr__(self):
+        return f"Instrumented({self._target!r})"
+
+
+class _InstrumentedQuery(_Wrapper):
+    """CollectionReference / Query / CollectionGroup."""
+    __slots__ = ()
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if name in QUERY_BUILDERS:
+            return lambda *args, **kwargs: _InstrumentedQuery(attr(*args, **kwargs), self._collection)
+        return attr
+
+    def stream(self, *args, **kwargs):
+        started = time.perf_counter()
+        return _record_docs(self._target.stream(*args, **kwargs), self._collection, "stream", started)
+
+    def get(self, *args, **kwargs):
+        started = time.perf_counter()
+        return _record_result(self._target.get(*args, **kwargs), self._collection, "get", started, reads=len)
+
+    def document(self, *args, **kwargs):
+        return _InstrumentedDocument(self._target.document(*args, **kwargs), self._collection)
+
+    def on_snapshot(self, callback):
+        """Listener snapshots are billed per changed document."""
+        collection = self._collection
+
+        def wrapped(docs, changes, read_time):
+            record_firestore_call(collection, "listen", 0.0, reads=len(changes))
+            return callback(docs, changes, read_time)
+
+        return self._target.on_snapshot(wrapped)
+
+
+class _InstrumentedDocument(_Wrapper):
+    __slots__ = ()
+
+    def get(self, *args, **kwargs):
+        started = time.perf_counter()
+        return _record_result(self._target.get(*args, **kwargs), self._collection, "get", started, reads=_exists)
+
+    def _write(self, op, *args, **kwargs):
+        started = time.perf_counter()
+        return _record_result(getattr(self._target, op)(*args, **kwargs), self._collection, op, started, writes=1)
+
+    def set(self, *args, **kwargs):
+        return self._write("set", *args, **kwargs)
+
+    def create(self, *args, **kwargs):
+        return self._write("create", *args, **kwargs)
+
+    def update(self, *args, **kwargs):
+        return self._write("update", *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self._write("delete", *args, **kwargs)
+
+    def collection(self, collection_id: str):
+        return _InstrumentedQuery(self._target.collection(collection_id), collection_id)
+
+
+class _InstrumentedBatch(_Wrapper):
+    """Queued writes are recorded per collection when the batch commits."""
+    __slots__ = ("_pending",)
+
+    def __init__(self, target):
+        super().__init__(target)
+        self._pending = {}
+
+    def _queue(self, op, reference, *args, **kwargs):
+        key = (getattr(reference, "_collection", None) or "unknown", op)
+        self._pending[key] = self._pending.get(key, 0) + 1
+        return getattr(self._target, op)(_unwrap(reference), *args, **kwargs)
+
+    def set(self, reference, *args, **kwargs):
+        return self._queue("set", reference, *args, **kwargs)
+
+    def create(self, reference, *args, **kwargs):
+        return self._queue("create", reference, *args, **kwargs)
+
+    def update(self, reference, *args, **kwargs):
+        return self._queue("update", reference, *args, **kwargs)
+
+    def delete(self, reference, *args, **kwargs):
+        return self._queue("delete", reference, *args, **kwargs)
+
+    def commit(self, *args, **kwargs):
+        started = time.perf_counter()
+        pending, self._pending = self._pending, {}
+
+        def finish(value):
+            seconds = time.perf_counter() - started
+            for (collection, op), writes in pending.items():
+                record_firestore_call(collection, f"batch_{op}", seconds, writes=writes)
+            return value
+
+        result = self._target.commit(*args, **kwargs)
+        if hasattr(result, "__await__"):
+            async def wait():
+                return finish(await result)
+            return wait()
+        return finish(result)
+
+
+class _InstrumentedClient(_Wrapper):
+    __slots__ = ()
+
+    def collection(self, path: str, *args):
+        return _InstrumentedQuery(self._target.collection(path, *args), _collection_label(path))
+
+    def collection_group(self, collection_id: str):
+        return _InstrumentedQuery(self._target.collection_group(collection_id), collection_id)
+
+    def document(self, path: str, *args):
+        target = self._target.document(path, *args)
+        return _InstrumentedDocument(target, _collection_label(target.path.rsplit("/", 1)[0]))
+
+    def batch(self):
+        return _InstrumentedBatch(self._target.batch())
+
+    def get_all(self, references, *args, **kwargs):
+        references = list(references)
+        collection = getattr(references[0], "_collection", None) if references else None
+        started = time.perf_counter()
+        result = self._target.get_all([_unwrap(r) for r in references], *args, **kwargs)
+        # Missing documents come back too; only existing ones are billed reads
+        return _record_docs(result, collection or "unknown", "get_all", started, count=_exists)
+
+
+def instrument_client(client):
+    """Wraps a Firestore Client/AsyncClient so every call is recorded."""
+    return _InstrumentedClient(client)
@@ -18,6 +18,7 @@ class WorkerModel(FirestoreModel):
     name: str
     phone: Optional[str] = None
     is_active: bool = True
+    shed_id: Optional[str] = None
 
 # --------------------------------------------------
 # SHED MODEL
@@ -45,7 +46,8 @@ class ProductionRecordModel(FirestoreModel):
     
     meters: float
     rate: float
-    total_amount: float # Calculated as meters * rate
+    total_amount: float # Calculated as meters * rate (rate from the rate card)
+    quality: Optional[str] = None # Fabric quality, when sent with the entry
 
     worker_id: str  # Reference to Worker Document ID
     loom_id: str    # Reference to Loom Document ID
@@ -61,4 +63,32 @@ class AdminModel(FirestoreModel):
     uid: str
     email: str
     is_active: bool = True
-    created_at: datetime = Field(default_factory=datetime.now)
\ No newline at end of file
+    created_at: datetime = Field(default_factory=datetime.now)
+
+# --------------------------------------------------
+# RATE CARD ENTRY MODEL
+# --------------------------------------------------
+class RateModel(FirestoreModel):
+    id: Optional[str] = None  # "{scope}_{key}_{effective_from}"
+    scope: str                # "loom" | "quality" | "shed"
+    key: str                  # loom_id, quality name or shed_id
+    effective_from: str       # "YYYY-MM-DD"
+    rate: float
+
+# --------------------------------------------------
+# PAYROLL PERIOD MODEL (Frozen snapshot pointer)
+# --------------------------------------------------
+class PayrollPeriodModel(FirestoreModel):
+    id: Optional[str] = None  # "{start}_{end}"
+    start: str                # "YYYY-MM-DD"
+    end: str
+    status: str               # "frozen" | "open" (reopened)
+    version: int              # Number of freezes so far
+    snapshot_id: str          # Run id: snapshots/{snapshot_id}/slips/{worker_id}
+    revision: int             # Compare-and-set token, bumped on every write
+    frozen_at: str
+    computed_at: str
+    reopened_at: Optional[str] = None
+    workers: int
+    summary: dict             # {"total_meters", "total_salary"}
+    history: List[dict] = []  # [{"version", "snapshot_id", "frozen_at", "reopened_at"}]
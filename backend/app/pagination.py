@@ -0,0 +1,53 @@
+import base64
+import json
+
+# --------------------------------------------------
+# CURSOR PAGINATION
+# --------------------------------------------------
+# A cursor is the sort key of the last item on a page (e.g. [name, id]),
+# JSON-encoded and base64url'd so clients treat it as an opaque string
+# and pass it back as 'start_after'.
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(values: list):
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+# Sort keys of the paged lists; the last value is always the document id
+WORKER_CURSOR = (str, str)      # [name, id]
+PRODUCTION_CURSOR = (str, str)  # [date, id]
+
+
+def decode_cursor(cursor: str, key: tuple):
+    """
+    Output: The list of sort-key values, checked against 'key' (the value
+    types of the list's sort key). Raises ValueError for a bad cursor.
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise ValueError("Invalid 'start_after' cursor")
+    if not isinstance(values, list) or len(values) != len(key) \
+            or not all(isinstance(value, kind) for value, kind in zip(values, key)):
+        raise ValueError("Invalid 'start_after' cursor")
+    # A document id: Firestore rejects empty ones and paths
+    if not values[-1] or "/" in values[-1]:
+        raise ValueError("Invalid 'start_after' cursor")
+    return values
+
+
+def page(items: list, limit: int, sort_key):
+    """
+    Wraps one fetched page. 'items' may hold limit + 1 rows: the extra row
+    only signals that another page exists and is not returned.
+    """
+    has_more = len(items) > limit
+    items = items[:limit]
+    next_cursor = encode_cursor(sort_key(items[-1])) if has_more and items else None
+    return {"items": items, "next_cursor": next_cursor}
@@ -0,0 +1,210 @@
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------
+# PAYROLL PERIODS (Frozen salary snapshots)
+# --------------------------------------------------
+# Salary for a paid period must not change, so once a payroll run for a
+# period is frozen its slips are stored as an immutable snapshot and every
+# later read of that period is served from it:
+#   payroll_periods/{start}_{end}                         period document
+#   payroll_periods/{start}_{end}/snapshots/{run}/slips/{worker_id}
+# (SQLite: the payroll_periods and payroll_slips tables.)
+#
+# The period document says which snapshot is current:
+#   {"start", "end", "status": "frozen" | "open", "version", "snapshot_id",
+#    "revision", "frozen_at", "computed_at", "workers", "summary", "by_shed",
+#    "history"}
+# 'version' counts freezes; 'revision' counts every write and is the
+# compare-and-set token, so two admins cannot freeze or reopen at once.
+# Reopening only flips the status (salary is computed live again); the
+# next freeze writes a new snapshot as version + 1. Old snapshots stay.
+# While a period is frozen, production dated inside it is rejected.
+# Each snapshot slip also keeps its per-shed parts ("sheds", see 'by_shed'),
+# so a shed-filtered payroll of a frozen period is read from the snapshot.
+#
+# Period documents are few and tiny, so like the rate card they are held
+# in memory and kept current by the change feed: deciding whether a read
+# is frozen costs no storage read, and a frozen worker slip is one read.
+#
+# Production writes run inside PayrollPeriods.writing(), and a freeze inside
+# PayrollPeriods.freezing(): once a freeze starts, new writes dated in its
+# period are refused and it waits for the ones in flight, so the production
+# it checks cannot change before the period is frozen. This holds within
+# the process; a write another process admitted before it saw the freeze
+# is caught by checking production again after it (app.payroll_runs).
+
+PAYROLL_PERIODS = "payroll_periods"
+FROZEN, OPEN = "frozen", "open"
+
+
+class PayrollConflict(Exception):
+    """The period changed underneath the caller (or is in the wrong state)."""
+
+
+def period_id(start: str, end: str):
+    return f"{start}_{end}"
+
+
+def now_iso():
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+def frozen_error(period: dict, day: str):
+    """Why production dated 'day' inside the frozen 'period' is rejected."""
+    return f"Payroll period {period['id']} is frozen; reopen it to change production on {day}"
+
+
+def payroll_summary(slips: dict):
+    """Totals over {worker_id: slip}."""
+    return {
+        "total_meters": round(sum(s["summary"]["total_meters"] for s in slips.values()), 2),
+        "total_salary": round(sum(s["summary"]["total_salary"] for s in slips.values()), 2),
+    }
+
+
+class PayrollPeriods:
+    """Process-wide copy of the payroll_periods documents."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._freezing = {}     # period id -> (start, end) of freezes in progress
+        self._writes = {}       # token -> dates of production writes in flight
+        self._loaded = threading.Event()
+        self._unsubscribe = None
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._periods = {}  # period id -> period document
+        self._loaded.clear()
+
+    # ---------------- Lifecycle ----------------
+    def start(self, feed, timeout: float = 10.0):
+        """Subscribes to the feed and waits (up to timeout) for the initial snapshot."""
+        self.stop()
+        self.clear()
+        self._unsubscribe = feed.subscribe(PAYROLL_PERIODS, self._apply_changes)
+        if not self.wait_ready(timeout):
+            logger.warning("Payroll periods not loaded after %ss; they will be read from storage", timeout)
+
+    def stop(self):
+        if self._unsubscribe is not None:
+            try:
+                self._unsubscribe()
+            except Exception as e:
+                logger.warning("Failed to stop payroll period listener: %s", e)
+        self._unsubscribe = None
+
+    def wait_ready(self, timeout: float = None):
+        return self._loaded.wait(timeout)
+
+    @property
+    def ready(self):
+        return self._loaded.is_set()
+
+    def load(self, periods: list):
+        """Fills the index from a storage snapshot ([{"id", ...}]) when no feed runs."""
+        self._apply_changes([("ADDED", p["id"], None, p) for p in periods])
+
+    # ---------------- Change handling ----------------
+    def _apply_changes(self, changes):
+        with self._lock:
+            for kind, doc_id, _, data in changes:
+                current = self._periods.get(doc_id)
+                if kind == "REMOVED":
+                    self._periods.pop(doc_id, None)
+                # A late snapshot must not undo a newer write-through
+                elif current is None or data.get("revision", 0) >= current.get("revision", 0):
+                    self._periods[doc_id] = {**data, "id": doc_id}
+        self._loaded.set()
+
+    def put(self, doc_id: str, data: dict):
+        """Write-through so a freeze/reopen applies before its snapshot arrives."""
+        self._apply_changes([("MODIFIED", doc_id, None, data)])
+
+    def remove(self, doc_id: str):
+        self._apply_changes([("REMOVED", doc_id, None, None)])
+
+    # ---------------- Reads ----------------
+    def get(self, doc_id: str):
+        with self._lock:
+            period = self._periods.get(doc_id)
+            return dict(period) if period is not None else None
+
+    def frozen(self, doc_id: str):
+        """The period document if the period is frozen, else None."""
+        period = self.get(doc_id)
+        return period if period is not None and period.get("status") == FROZEN else None
+
+    def _blocked(self, day: str, admit_freezing: bool):
+        """Why production dated 'day' may not be written, else None (lock held)."""
+        for doc_id, period in self._periods.items():
+            if period.get("status") == FROZEN and period.get("start", "") <= day <= period.get("end", ""):
+                return frozen_error({**period, "id": doc_id}, day)
+        if not admit_freezing:
+            for doc_id, (start, end) in self._freezing.items():
+                if start <= day <= end:
+                    return f"Payroll period {doc_id} is being frozen; production on {day} can be saved once it is done"
+        return None
+
+    def list_periods(self):
+        """Newest period first."""
+        with self._lock:
+            periods = [dict(p) for p in self._periods.values()]
+        return sorted(periods, key=lambda p: (p.get("start", ""), p.get("end", "")), reverse=True)
+
+    # ---------------- Writes and freezes ----------------
+    @contextmanager
+    def writing(self, days, admit_freezing: bool = False):
+        """
+        Registers a production write of these dates until the block exits.
+        Yields {day: error} for the dates that must not be written: inside a
+        frozen period, or one being frozen unless admit_freezing (for rows
+        acknowledged before the freeze began, which it waits for).
+        """
+        days, token = set(days), object()
+        with self._cond:
+            blocked = {}
+            for day in days:
+                error = self._blocked(day, admit_freezing)
+                if error is not None:
+                    blocked[day] = error
+            self._writes[token] = [day for day in days if day not in blocked]
+        try:
+            yield blocked
+        finally:
+            with self._cond:
+                del self._writes[token]
+                self._cond.notify_all()
+
+    @contextmanager
+    def freezing(self, doc_id: str, start: str, end: str, timeout: float = 30.0):
+        """
+        Refuses new production writes dated in [start, end] until the block
+        exits, after waiting for those in flight. Raises PayrollConflict if
+        the period is already being frozen or the writes did not finish.
+        """
+        def in_flight():
+            return any(start <= day <= end for days in self._writes.values() for day in days)
+
+        with self._cond:
+            if doc_id in self._freezing:
+                raise PayrollConflict(f"Payroll period {doc_id} is already being frozen")
+            self._freezing[doc_id] = (start, end)
+            if not self._cond.wait_for(lambda: not in_flight(), timeout):
+                del self._freezing[doc_id]
+                raise PayrollConflict(f"Production writes to payroll period {doc_id} did not finish; try again")
+        try:
+            yield
+        finally:
+            with self._cond:
+                del self._freezing[doc_id]
+
+
+payroll_periods = PayrollPeriods()
@@ -0,0 +1,186 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from .crud import crud
+from .payroll import PayrollConflict, FROZEN, payroll_periods, period_id, now_iso, payroll_summary
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------
+# PAYROLL RUNS (Background jobs)
+# --------------------------------------------------
+# POST /payroll/runs computes every worker's slip for a period in a job
+# thread (one production scan, CRUD.compute_payroll) and returns at once.
+# Poll GET /payroll/runs/{id}; once it is 'done' the admin can review the
+# totals and POST /payroll/runs/{id}/freeze to store the result as the
+# period's next snapshot version (see app.payroll).
+#
+#   queued -> running -> done -> frozen
+#                    \-> failed \-> stale
+#
+# A run notes the production version of its period (CRUD.production_version:
+# a write counter per date) before it scans. If production dated inside the
+# period was created or changed before the freeze, the run is 'stale' and
+# cannot be frozen: start another. Writes to other dates do not matter.
+# The freeze refuses new writes to the period before it compares (see
+# PayrollPeriods.freezing) and compares again once the period is frozen,
+# putting the period back if a write from another process got in between.
+#
+# Runs live in memory until frozen (a restart loses unfrozen runs: start
+# another). Only the newest PAYROLL_RUNS_KEEP runs are kept.
+PAYROLL_RUNS_KEEP = int(os.getenv("PAYROLL_RUNS_KEEP", "10"))
+PAYROLL_CONCURRENT_RUNS = int(os.getenv("PAYROLL_CONCURRENT_RUNS", "2"))
+PROGRESS_EVERY = 1000  # records scanned between progress updates
+
+
+class PayrollRuns:
+    """Registry of payroll runs and the threads that compute them."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._runs = {}         # id -> run dict, oldest first
+        self._runner = None
+
+    # ---------------- Lifecycle ----------------
+    def _ensure_started(self):
+        with self._lock:
+            if self._runner is None:
+                self._runner = ThreadPoolExecutor(PAYROLL_CONCURRENT_RUNS, thread_name_prefix="payroll-run")
+
+    def stop(self):
+        """Called from the lifespan: running runs are abandoned, not awaited."""
+        with self._lock:
+            runner, self._runner = self._runner, None
+        if runner is not None:
+            runner.shutdown(wait=False, cancel_futures=True)
+
+    # ---------------- Runs ----------------
+    def submit(self, start: str, end: str):
+        """Queues a run. Raises PayrollConflict if the period is frozen."""
+        period = crud.get_payroll_period(start, end)
+        if period is not None and period["status"] == FROZEN:
+            raise PayrollConflict(f"Payroll period {period_id(start, end)} is frozen; reopen it first")
+
+        self._ensure_started()
+        run = {
+            "id": uuid.uuid4().hex,
+            "status": "queued",
+            "period": {"start": start, "end": end},
+            "scanned": 0,           # production records read so far
+            "workers": None,
+            "summary": None,
+            "version": None,        # snapshot version once frozen
+            "error": None,
+            "created_at": now_iso(),
+            "computed_at": None,
+            "slips": None,
+            "production": None,     # production_version taken before the scan
+        }
+        with self._lock:
+            self._runs[run["id"]] = run
+            self._evict()
+        self._runner.submit(self._run, run)
+        return self.get(run["id"])
+
+    def get(self, run_id: str):
+        """Output: Public status of a run (without its slips), or None if unknown."""
+        with self._lock:
+            run = self._runs.get(run_id)
+            return {k: v for k, v in run.items() if k not in ("slips", "production")} if run is not None else None
+
+    def busy(self):
+        """Output: Number of runs queued or running."""
+        with self._lock:
+            return sum(1 for r in self._runs.values() if r["status"] in ("queued", "running"))
+
+    def freeze(self, run_id: str):
+        """
+        Stores a finished run as the period's snapshot.
+        Output: The period document, or None if the run is unknown.
+        Raises PayrollConflict if the run is not 'done', production changed
+        since it was computed, or the period is frozen; StorageUnavailable
+        if queued write-behind entries could not be stored first.
+        """
+        with self._lock:
+            run = self._runs.get(run_id)
+            if run is None:
+                return None
+            if run["status"] != "done":
+                raise PayrollConflict(f"Payroll run is {run['status']}, not done")
+            run["status"] = "freezing"
+
+        start, end = run["period"]["start"], run["period"]["end"]
+        try:
+            with payroll_periods.freezing(period_id(start, end), start, end):
+                previous = crud.get_payroll_period(start, end)
+                self._check_unchanged(run)
+                frozen = crud.freeze_payroll(start, end, run_id, run["slips"], run["computed_at"])
+                try:
+                    self._check_unchanged(run)
+                except Exception:
+                    crud.undo_freeze(frozen, previous)
+                    raise
+        except Exception:
+            if run["status"] == "freezing":
+                self._update(run, status="done")
+            raise
+        # The slips now live in storage
+        self._update(run, status="frozen", version=frozen["version"], slips=None)
+        return frozen
+
+    def _check_unchanged(self, run: dict):
+        """Marks the run stale and raises PayrollConflict if its period's production changed."""
+        period = run["period"]
+        if crud.production_version(period["start"], period["end"]) != run["production"]:
+            self._update(run, status="stale", error="Production changed after this run was computed")
+            raise PayrollConflict("Production of this period changed after the run was computed; start a new run")
+
+    def _evict(self):
+        finished = [r for r in self._runs.values() if r["status"] in ("done", "frozen", "failed", "stale")]
+        for run in finished[:max(0, len(self._runs) - PAYROLL_RUNS_KEEP)]:
+            del self._runs[run["id"]]
+
+    def _update(self, run: dict, **changes):
+        with self._lock:
+            run.update(changes)
+
+    # ---------------- Execution (run thread) ----------------
+    def _run(self, run: dict):
+        started = time.perf_counter()
+        period = run["period"]
+
+        def counted(records):
+            count = 0
+            for record in records:
+                count += 1
+                if count % PROGRESS_EVERY == 0:
+                    self._update(run, scanned=count)
+                yield record
+            self._update(run, scanned=count)
+
+        try:
+            self._update(run, status="running")
+            # Before the scan, so a write during it makes the run stale too
+            production = crud.production_version(period["start"], period["end"])
+            # Always live (no snapshot, no archive): the run is what a freeze will store
+            records = crud.stream_production(period["start"], period["end"], archived=False)
+            slips = crud.compute_payroll(counted(records), by_shed=True)
+            self._update(
+                run,
+                status="done",
+                slips=slips,
+                workers=len(slips),
+                summary=payroll_summary(slips),
+                computed_at=now_iso(),
+                production=production,
+            )
+            logger.info("Payroll run %s: %d workers in %.1fs", run["id"], len(slips), time.perf_counter() - started)
+        except Exception as e:
+            logger.warning("Payroll run %s failed: %s", run["id"], e)
+            self._update(run, status="failed", error=str(e))
+
+
+payroll_runs = PayrollRuns()
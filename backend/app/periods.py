@@ -0,0 +1,84 @@
+from datetime import date
+from fastapi import APIRouter, Depends, HTTPException, Query
+from .auth import admin_required
+from .crud import crud
+from .payroll import PayrollConflict
+from .payroll_runs import payroll_runs
+
+# We define the router here to be included in main.py
+router = APIRouter()
+
+# Plain 'def' routes: loading the period index and freezing hit storage,
+# so they run in the thread pool rather than on the event loop.
+
+
+# --------------------------------------------------
+# PAYROLL RUNS (Background job, see app/payroll_runs.py)
+# --------------------------------------------------
+@router.post("/payroll/runs", status_code=202)
+def start_payroll_run(
+    start_date: date = Query(..., description="Format: YYYY-MM-DD"),
+    end_date: date = Query(..., description="Format: YYYY-MM-DD"),
+    admin=Depends(admin_required)
+):
+    """
+    Starts computing every worker's salary for the period and returns the
+    run at once. Poll /payroll/runs/{run_id}; freeze it once it is 'done'.
+    409 if the period is frozen (reopen it first).
+    """
+    try:
+        return payroll_runs.submit(str(start_date), str(end_date))
+    except PayrollConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@router.get("/payroll/runs/{run_id}")
+def payroll_run_status(run_id: str, admin=Depends(admin_required)):
+    """Run status: records scanned, then worker count and totals once done."""
+    run = payroll_runs.get(run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired payroll run")
+    return run
+
+
+@router.post("/payroll/runs/{run_id}/freeze")
+def freeze_payroll_run(run_id: str, admin=Depends(admin_required)):
+    """
+    Stores the run's slips as the period's next snapshot version. From then
+    on salary reads of exactly this period come from the snapshot.
+    """
+    try:
+        period = payroll_runs.freeze(run_id)
+    except PayrollConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if period is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired payroll run")
+    return period
+
+
+# --------------------------------------------------
+# PAYROLL PERIODS
+# --------------------------------------------------
+@router.get("/payroll/periods")
+def list_payroll_periods(admin=Depends(admin_required)):
+    """Every frozen or reopened period with its current version, newest first."""
+    return crud.get_payroll_periods()
+
+
+@router.post("/payroll/periods/reopen")
+def reopen_payroll_period(
+    start_date: date = Query(..., description="Format: YYYY-MM-DD"),
+    end_date: date = Query(..., description="Format: YYYY-MM-DD"),
+    admin=Depends(admin_required)
+):
+    """
+    Unfreezes a period so its salary is computed live again. The snapshot
+    is kept; the next freeze of the period becomes a new version.
+    """
+    try:
+        period = crud.reopen_payroll(str(start_date), str(end_date))
+    except PayrollConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if period is None:
+        raise HTTPException(status_code=404, detail=f"Payroll period {start_date} to {end_date} was never frozen")
+    return period
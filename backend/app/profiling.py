@@ -0,0 +1,271 @@
+import functools
+import inspect
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from urllib.parse import parse_qs
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------
+# REQUEST PHASE TIMING
+# --------------------------------------------------
+# Every HTTP request carries a RequestTrace in a context variable. The auth
+# dependency, each CRUD method (instrument_crud) and each Firestore call
+# (app/metrics.py) add their time to it as named phases:
+#   auth, crud.<method>, firestore.<op>:<collection>, serialize
+# Phases nest (a crud.* phase includes its Firestore calls). 'serialize'
+# runs from the last CRUD call returning to the response headers being sent.
+# Thread-pool work is traced too: anyio copies the context into the thread.
+#
+# Requests slower than SLOW_REQUEST_MS are logged with their breakdown.
+# Admins can add 'X-Profile: 1' (or '?profile=1', '?profile=html') to get
+# a pyinstrument sampling profile of that one request instead of its body.
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "1000"))
+PROFILE_HEADER = b"x-profile"
+PROFILE_QUERY = "profile"
+PROFILE_INTERVAL = 0.001  # seconds between samples
+
+_current_trace = ContextVar("request_trace", default=None)
+
+
+class RequestTrace:
+    """Per-request phase totals: {name: [calls, seconds]}."""
+
+    __slots__ = ("started", "phases", "last_crud_end")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.last_crud_end = None
+
+    def add(self, name: str, seconds: float):
+        entry = self.phases.setdefault(name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+    def breakdown(self):
+        """Output: [{"phase", "calls", "ms"}, ...], slowest first."""
+        rows = [{"phase": name, "calls": calls, "ms": round(seconds * 1000, 2)}
+                for name, (calls, seconds) in self.phases.items()]
+        return sorted(rows, key=lambda r: r["ms"], reverse=True)
+
+
+def add_phase(name: str, seconds: float):
+    """Adds time to the current request's trace (no-op outside a request)."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(name, seconds)
+
+
+@contextmanager
+def phase(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_phase(name, time.perf_counter() - started)
+
+
+# --------------------------------------------------
+# CRUD INSTRUMENTATION
+# --------------------------------------------------
+def _timed(name: str, func):
+    def done(seconds):
+        add_phase(name, seconds)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.last_crud_end = time.perf_counter()
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                done(time.perf_counter() - started)
+        async_wrapper.__phase__ = name
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except BaseException:
+            done(time.perf_counter() - started)
+            raise
+        # A generator (e.g. stream_production feeding a streamed export) is
+        # timed while it is consumed, not when it is created
+        if inspect.isgenerator(result):
+            return _timed_generator(result, time.perf_counter() - started, done)
+        if inspect.isasyncgen(result):
+            return _timed_async_generator(result, time.perf_counter() - started, done)
+        done(time.perf_counter() - started)
+        return result
+    wrapper.__phase__ = name
+    return wrapper
+
+
+def _timed_generator(gen, spent: float, done):
+    """Yields from gen; only the time spent producing items is counted."""
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(gen)
+            except StopIteration:
+                return
+            finally:
+                spent += time.perf_counter() - started
+            yield item
+    finally:
+        gen.close()
+        done(spent)
+
+
+async def _timed_async_generator(gen, spent: float, done):
+    """Async counterpart of _timed_generator."""
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                item = await gen.__anext__()
+            except StopAsyncIteration:
+                return
+            finally:
+                spent += time.perf_counter() - started
+            yield item
+    finally:
+        await gen.aclose()
+        done(spent)
+
+
+def instrument_crud(cls):
+    """
+    Class decorator: times every public static method as 'crud.<name>'
+    (generators returned by one: the time spent iterating them).
+    Methods already wrapped (aliases shared between classes) are left alone.
+    """
+    for name, attr in list(vars(cls).items()):
+        if name.startswith("_") or not isinstance(attr, staticmethod):
+            continue
+        func = attr.__func__
+        if not hasattr(func, "__phase__"):
+            setattr(cls, name, staticmethod(_timed(f"crud.{name}", func)))
+    return cls
+
+
+# --------------------------------------------------
+# MIDDLEWARE
+# --------------------------------------------------
+def _profile_mode(scope):
+    """Output: None, "text" or "html" from the header or query flag."""
+    for key, value in scope.get("headers", []):
+        if key == PROFILE_HEADER and value not in (b"", b"0"):
+            return "html" if value == b"html" else "text"
+    values = parse_qs(scope.get("query_string", b"").decode()).get(PROFILE_QUERY)
+    if values and values[0] not in ("", "0"):
+        return "html" if values[0] == "html" else "text"
+    return None
+
+
+def _bearer_token(scope):
+    for key, value in scope.get("headers", []):
+        if key == b"authorization":
+            scheme, _, token = value.decode().partition(" ")
+            if scheme.lower() == "bearer" and token:
+                return token
+    return None
+
+
+class ProfilingMiddleware:
+    """Slow-request log for every request; sampling profiles on admin opt-in."""
+
+    def __init__(self, app, slow_request_ms: float = SLOW_REQUEST_MS):
+        self.app = app
+        self.slow_request_ms = slow_request_ms
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        mode = _profile_mode(scope)
+        if mode and await self._is_admin(scope):
+            return await self._profile(scope, receive, send, mode)
+
+        trace = RequestTrace()
+        token = _current_trace.set(trace)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                if trace.last_crud_end is not None:
+                    trace.add("serialize", time.perf_counter() - trace.last_crud_end)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_trace.reset(token)
+            elapsed_ms = (time.perf_counter() - trace.started) * 1000
+            if elapsed_ms >= self.slow_request_ms:
+                logger.warning(
+                    "Slow request %s %s -> %s in %.1fms: %s",
+                    scope["method"], scope["path"], status["code"], elapsed_ms,
+                    ", ".join(f"{p['phase']}={p['ms']}ms x{p['calls']}" for p in trace.breakdown())
+                )
+
+    @staticmethod
+    async def _is_admin(scope):
+        from .auth import claims_for_token, is_admin
+
+        token = _bearer_token(scope)
+        if token is None:
+            return False
+        try:
+            return is_admin(await claims_for_token(token))
+        except Exception:
+            return False
+
+    async def _profile(self, scope, receive, send, mode: str):
+        """Runs the request under pyinstrument and answers with the profile."""
+        from pyinstrument import Profiler
+
+        trace = RequestTrace()
+        token = _current_trace.set(trace)
+        status = {"code": 500}
+
+        async def discard(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                if trace.last_crud_end is not None:
+                    trace.add("serialize", time.perf_counter() - trace.last_crud_end)
+
+        profiler = Profiler(interval=PROFILE_INTERVAL, async_mode="enabled")
+        profiler.start()
+        try:
+            await self.app(scope, receive, discard)
+        finally:
+            profiler.stop()
+            _current_trace.reset(token)
+
+        if mode == "html":
+            body, content_type = profiler.output_html(), b"text/html; charset=utf-8"
+        else:
+            phases = "\n".join(f"  {p['phase']:<40} {p['ms']:>10.2f}ms  x{p['calls']}" for p in trace.breakdown())
+            body = (f"{scope['method']} {scope['path']} -> {status['code']}\n\nPhases:\n{phases}\n\n"
+                    + profiler.output_text(unicode=True, color=False))
+            content_type = b"text/plain; charset=utf-8"
+
+        body = body.encode()
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", content_type), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
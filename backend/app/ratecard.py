@@ -0,0 +1,146 @@
+import logging
+import threading
+from bisect import bisect_right
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------
+# RATE CARD (Effective-dated piece rates)
+# --------------------------------------------------
+# A rate applies to one loom, one fabric quality or a whole shed from its
+# 'effective_from' date until the next entry for the same key takes over.
+# When a production record is priced the most specific match wins:
+#   loom -> quality -> shed
+#
+# Entries live in the 'rate_card' collection with a deterministic id
+# ({scope}_{key}_{effective_from}), so re-posting a date corrects it.
+# In memory every (scope, key) holds its entries sorted by date, and a
+# lookup is one bisect: O(log n), no storage read. The card is kept
+# current by the same change feed as app.refdata.
+
+RATES = "rate_card"
+RATE_SCOPES = ("loom", "quality", "shed")  # Most specific first
+
+
+def rate_id(scope: str, key: str, effective_from: str):
+    # '/' would make the id a Firestore path (a quality like "2/40"), so it
+    # is percent-escaped; other keys keep the ids they always had
+    key = key.replace("%", "%25").replace("/", "%2F")
+    return f"{scope}_{key}_{effective_from}"
+
+
+class RateCard:
+    """Process-wide sorted interval index of rate card entries."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded = threading.Event()
+        self._unsubscribe = None
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}  # rate id -> entry dict
+            self._by_key = {}   # (scope, key) -> {rate id: entry}
+            self._index = {}    # (scope, key) -> ([effective_from, ...], [entry, ...])
+        self._loaded.clear()
+
+    # ---------------- Lifecycle ----------------
+    def start(self, feed, timeout: float = 10.0):
+        """Subscribes to the feed and waits (up to timeout) for the initial snapshot."""
+        self.stop()
+        self.clear()
+        self._unsubscribe = feed.subscribe(RATES, self._apply_changes)
+        if not self.wait_ready(timeout):
+            logger.warning("Rate card not loaded after %ss; it will be read from storage", timeout)
+
+    def stop(self):
+        if self._unsubscribe is not None:
+            try:
+                self._unsubscribe()
+            except Exception as e:
+                logger.warning("Failed to stop rate card listener: %s", e)
+        self._unsubscribe = None
+
+    def wait_ready(self, timeout: float = None):
+        return self._loaded.wait(timeout)
+
+    @property
+    def ready(self):
+        return self._loaded.is_set()
+
+    def load(self, rates: list):
+        """Fills the card from a storage snapshot ([{"id", ...}]) when no feed runs."""
+        self._apply_changes([("ADDED", r["id"], None, r) for r in rates])
+
+    # ---------------- Change handling ----------------
+    def _apply_changes(self, changes):
+        with self._lock:
+            touched = set()
+            for kind, doc_id, _, data in changes:
+                old = self._entries.pop(doc_id, None)
+                if old is not None:
+                    self._by_key[(old["scope"], old["key"])].pop(doc_id, None)
+                    touched.add((old["scope"], old["key"]))
+                if kind != "REMOVED":
+                    entry = self._entry(doc_id, data)
+                    self._entries[doc_id] = entry
+                    self._by_key.setdefault((entry["scope"], entry["key"]), {})[doc_id] = entry
+                    touched.add((entry["scope"], entry["key"]))
+            for index_key in touched:
+                self._reindex(index_key)
+        self._loaded.set()
+
+    @staticmethod
+    def _entry(doc_id: str, data: dict):
+        return {
+            "id": doc_id,
+            "scope": data["scope"],
+            "key": data["key"],
+            "effective_from": str(data["effective_from"]),
+            "rate": float(data["rate"]),
+        }
+
+    def _reindex(self, index_key):
+        entries = sorted(self._by_key.get(index_key, {}).values(), key=lambda e: e["effective_from"])
+        if entries:
+            self._index[index_key] = ([e["effective_from"] for e in entries], entries)
+        else:
+            self._index.pop(index_key, None)
+            self._by_key.pop(index_key, None)
+
+    def put(self, doc_id: str, data: dict):
+        """Write-through so a new rate applies before its snapshot arrives."""
+        self._apply_changes([("ADDED", doc_id, None, data)])
+
+    # ---------------- Reads ----------------
+    def lookup(self, scope: str, key: str, day: str):
+        """The entry for (scope, key) in force on 'day' (YYYY-MM-DD), or None."""
+        with self._lock:
+            found = self._index.get((scope, key))
+            if found is None:
+                return None
+            dates, entries = found
+            position = bisect_right(dates, day) - 1
+            return dict(entries[position]) if position >= 0 else None
+
+    def resolve(self, day: str, loom_id: str = None, quality: str = None, shed_id: str = None):
+        """Most specific entry in force on 'day': loom, then quality, then shed."""
+        for scope, key in zip(RATE_SCOPES, (loom_id, quality, shed_id)):
+            if key:
+                entry = self.lookup(scope, key, day)
+                if entry is not None:
+                    return entry
+        return None
+
+    def list_rates(self, scope: str = None, key: str = None):
+        """Entries ordered by (scope, key, effective_from)."""
+        with self._lock:
+            rates = [
+                dict(e) for e in self._entries.values()
+                if (scope is None or e["scope"] == scope) and (key is None or e["key"] == key)
+            ]
+        return sorted(rates, key=lambda e: (e["scope"], e["key"], e["effective_from"]))
+
+
+ratecard = RateCard()
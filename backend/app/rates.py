@@ -0,0 +1,47 @@
+from datetime import date
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from .auth import admin_required, get_current_user
+from .crud import acrud
+from .schemas import RateCreate
+
+# We define the router here to be included in main.py
+router = APIRouter()
+
+# --------------------------------------------------
+# RATE CARD
+# --------------------------------------------------
+@router.post("/rates/")
+async def add_rate(
+    rate: RateCreate,
+    admin=Depends(admin_required)
+):
+    """
+    Adds a rate for a loom, fabric quality or shed from 'effective_from'.
+    Posting the same scope/key/date again corrects that entry.
+    """
+    return await acrud.create_rate(rate.dict())
+
+
+@router.get("/rates/")
+async def list_rates(
+    scope: Optional[str] = Query(None, pattern="^(loom|quality|shed)$"),
+    key: Optional[str] = None,
+    user=Depends(get_current_user)
+):
+    """Rate card entries ordered by scope, key and effective date."""
+    return await acrud.get_rates(scope, key)
+
+
+@router.get("/rates/resolve")
+async def resolve_rate(
+    loom_id: str,
+    date: date = Query(..., description="Format: YYYY-MM-DD"),
+    quality: Optional[str] = None,
+    user=Depends(get_current_user)
+):
+    """The entry that prices production on this loom and date (loom > quality > shed)."""
+    entry = await acrud.resolve_rate(loom_id, str(date), quality)
+    if entry is None:
+        raise HTTPException(status_code=404, detail=f"No rate for loom '{loom_id}' on {date}")
+    return entry
@@ -0,0 +1,203 @@
+import logging
+import threading
+from .search import SEARCH_LIMIT, WorkerIndex
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------
+# REFERENCE DATA CACHE (Workers, Sheds, Looms)
+# --------------------------------------------------
+# Workers, sheds and looms change rarely but are read on every page load
+# and needed to label every production record. They are loaded once at
+# startup and kept current by a change feed:
+#   - FirestoreChangeFeed: Firestore snapshot listeners (production)
+#   - LocalChangeFeed:     in-process fake, driven by emit() (tests/benchmarks)
+#
+# A change feed calls callback(changes) where every change is a tuple
+#   (kind, doc_id, parent_id, data)   kind: "ADDED" | "MODIFIED" | "REMOVED"
+# parent_id is the shed id for looms and None otherwise. The first call per
+# collection is the full initial snapshot.
+#
+# Workers are also indexed for typeahead (app/search.py); the index is
+# updated under the same lock, so it always matches self.workers.
+
+WORKERS, SHEDS, LOOMS = "workers", "sheds", "looms"
+
+
+class FirestoreChangeFeed:
+    """Change feed backed by Firestore on_snapshot listeners."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def subscribe(self, name: str, callback):
+        # Looms live in sheds/{shed_id}/looms, so they are watched as a group
+        query = self.db.collection_group(name) if name == LOOMS else self.db.collection(name)
+
+        def on_snapshot(doc_snapshots, changes, read_time):
+            batch = []
+            for change in changes:
+                doc = change.document
+                parent = doc.reference.parent.parent
+                batch.append((
+                    change.type.name,
+                    doc.id,
+                    parent.id if parent is not None else None,
+                    doc.to_dict() or {}
+                ))
+            callback(batch)
+
+        watch = query.on_snapshot(on_snapshot)
+        return watch.unsubscribe
+
+
+class LocalChangeFeed:
+    """In-process change feed; tests push changes with emit()."""
+
+    def __init__(self, initial: dict = None):
+        self._initial = initial or {}
+        self._callbacks = {}
+
+    def subscribe(self, name: str, callback):
+        self._callbacks[name] = callback
+        callback(list(self._initial.get(name, [])))
+        return lambda: self._callbacks.pop(name, None)
+
+    def emit(self, name: str, kind: str, doc_id: str, data: dict = None, parent_id: str = None):
+        callback = self._callbacks.get(name)
+        if callback is not None:
+            callback([(kind, doc_id, parent_id, data or {})])
+
+
+class ReferenceData:
+    """Process-wide in-memory copy of workers, sheds and looms."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded = {WORKERS: threading.Event(), SHEDS: threading.Event(), LOOMS: threading.Event()}
+        self._unsubscribers = []
+        self.version = 0  # Bumped on every change; keys caches of derived responses
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self.workers = {}   # worker_id -> worker dict
+            self.worker_index = WorkerIndex()  # typeahead over self.workers
+            self.sheds = {}     # shed_id -> shed name
+            self.looms = {}     # loom_id -> {"shed_id", "loom_number"}
+            self.version += 1
+        for event in self._loaded.values():
+            event.clear()
+
+    # ---------------- Lifecycle ----------------
+    def start(self, feed, timeout: float = 10.0):
+        """Subscribes to the feed and waits (up to timeout) for the initial snapshots."""
+        self.stop()
+        self.clear()
+        for name in (WORKERS, SHEDS, LOOMS):
+            self._unsubscribers.append(feed.subscribe(name, self._handler(name)))
+        if not self.wait_ready(timeout):
+            logger.warning("Reference data not loaded after %ss; falling back to Firestore reads", timeout)
+
+    def stop(self):
+        for unsubscribe in self._unsubscribers:
+            try:
+                unsubscribe()
+            except Exception as e:
+                logger.warning("Failed to stop reference data listener: %s", e)
+        self._unsubscribers = []
+
+    def wait_ready(self, timeout: float = None):
+        return all(event.wait(timeout) for event in self._loaded.values())
+
+    @property
+    def ready(self):
+        return all(event.is_set() for event in self._loaded.values())
+
+    # ---------------- Change handling ----------------
+    def _handler(self, name: str):
+        def apply(changes):
+            with self._lock:
+                for kind, doc_id, parent_id, data in changes:
+                    if name == WORKERS:
+                        worker = {"id": doc_id, **data}
+                        self._apply(self.workers, kind, doc_id, worker)
+                        if kind == "REMOVED":
+                            self.worker_index.remove(doc_id)
+                        else:
+                            self.worker_index.put(worker)
+                    elif name == SHEDS:
+                        self._apply(self.sheds, kind, doc_id, data.get("name"))
+                    else:
+                        self._apply(self.looms, kind, doc_id, {"shed_id": parent_id, "loom_number": data.get("loom_number")})
+                self.version += 1
+            self._loaded[name].set()
+        return apply
+
+    @staticmethod
+    def _apply(target: dict, kind: str, doc_id: str, value):
+        if kind == "REMOVED":
+            target.pop(doc_id, None)
+        else:
+            target[doc_id] = value
+
+    # Write-through helpers so a write is visible before its snapshot arrives
+    def put_worker(self, worker: dict):
+        with self._lock:
+            self.workers[worker["id"]] = dict(worker)
+            self.worker_index.put(worker)
+            self.version += 1
+
+    def put_shed(self, shed_id: str, name: str):
+        with self._lock:
+            self.sheds[shed_id] = name
+            self.version += 1
+
+    def put_loom(self, shed_id: str, loom_id: str, loom_number: str):
+        with self._lock:
+            self.looms[loom_id] = {"shed_id": shed_id, "loom_number": loom_number}
+            self.version += 1
+
+    # ---------------- Reads ----------------
+    def get_workers(self):
+        with self._lock:
+            return [dict(w) for w in self.workers.values()]
+
+    def get_worker(self, worker_id: str):
+        with self._lock:
+            worker = self.workers.get(worker_id)
+            return dict(worker) if worker is not None else None
+
+    def search_workers(self, query: str, limit: int = SEARCH_LIMIT, is_active: bool = None):
+        """Typeahead matches from the in-memory index (see app/search.py)."""
+        with self._lock:
+            return self.worker_index.search(query, limit, is_active)
+
+    def loom_info(self, loom_id: str):
+        """Output: (shed_name, loom_number) or None if the loom is unknown."""
+        with self._lock:
+            loom = self.looms.get(loom_id)
+            if loom is None:
+                return None
+            return self.sheds.get(loom["shed_id"]), loom["loom_number"]
+
+    def loom_shed_id(self, loom_id: str):
+        with self._lock:
+            loom = self.looms.get(loom_id)
+            return loom["shed_id"] if loom is not None else None
+
+    def get_hierarchy(self):
+        """Same shape as CRUD.get_hierarchy."""
+        with self._lock:
+            hierarchy = {
+                shed_id: {"id": shed_id, "name": name, "looms": []}
+                for shed_id, name in self.sheds.items()
+            }
+            for loom_id, loom in self.looms.items():
+                shed = hierarchy.get(loom["shed_id"])
+                if shed is not None:
+                    shed["looms"].append({"id": loom_id, "loom_number": loom["loom_number"]})
+            return list(hierarchy.values())
+
+
+refdata = ReferenceData()
@@ -0,0 +1,69 @@
+from datetime import date
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from .auth import admin_required
+from .httpcache import json_response
+
+# We define the router here to be included in main.py
+router = APIRouter()
+
+# The figures are computed by app/analytics.py (NumPy), imported on the
+# first request. These routes are plain 'def': loading and crunching a
+# year of records runs in the thread pool, not on the event loop.
+
+ANALYTICS_MAX_DAYS = 731
+
+
+def _check_period(start_date: date, end_date: date):
+    days = (end_date - start_date).days + 1
+    if days < 1:
+        raise HTTPException(status_code=400, detail="end_date must not be before start_date")
+    if days > ANALYTICS_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Analytics cover at most {ANALYTICS_MAX_DAYS} days")
+
+
+# --------------------------------------------------
+# LOOM UTILISATION
+# --------------------------------------------------
+@router.get("/analytics/looms")
+def loom_utilisation(
+    request: Request,
+    start_date: date = Query(..., description="Format: YYYY-MM-DD"),
+    end_date: date = Query(..., description="Format: YYYY-MM-DD"),
+    shed_name: Optional[str] = None,
+    admin=Depends(admin_required)
+):
+    """
+    Meters per loom per shift and utilisation (shifts with output / shifts
+    available) for every loom in the hierarchy; 'idle' lists the looms
+    that produced nothing in the period.
+    """
+    from . import analytics
+
+    _check_period(start_date, end_date)
+    report = analytics.loom_report(str(start_date), str(end_date), shed_name.upper() if shed_name else None)
+    return json_response(request, report)
+
+
+# --------------------------------------------------
+# SHED TRENDS AND SHIFT PERFORMANCE
+# --------------------------------------------------
+@router.get("/analytics/sheds")
+def shed_trends(
+    request: Request,
+    start_date: date = Query(..., description="Format: YYYY-MM-DD"),
+    end_date: date = Query(..., description="Format: YYYY-MM-DD"),
+    shed_name: Optional[str] = None,
+    window: int = Query(7, ge=1, le=90, description="Moving average window in days"),
+    admin=Depends(admin_required)
+):
+    """
+    Daily meters per shed with a trailing moving average (parallel to
+    'dates'), and Day vs Night output per active loom-shift, naming the
+    shift that underperforms.
+    """
+    from . import analytics
+
+    _check_period(start_date, end_date)
+    report = analytics.shed_report(str(start_date), str(end_date), shed_name.upper() if shed_name else None, window)
+    return json_response(request, report)
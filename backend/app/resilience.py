@@ -0,0 +1,586 @@
+import asyncio
+import collections
+import logging
+import math
+import os
+import random
+import threading
+import time
+from .metrics import (
+    QUERY_BUILDERS, FIRESTORE_IN_FLIGHT, FIRESTORE_QUEUED, FIRESTORE_OPEN_STREAMS, FIRESTORE_REJECTED,
+    FIRESTORE_RETRIES, FIRESTORE_CIRCUIT_STATE, FIRESTORE_CIRCUIT_OPENED,
+)
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------
+# FIRESTORE RESILIENCE (Concurrency cap, retries, circuit breaker)
+# --------------------------------------------------
+# protect_client() wraps the Firestore clients of app.database (outside the
+# metrics wrapper), so every call the storage engines make goes through:
+#   1. the circuit breaker: after FIRESTORE_BREAKER_FAILURES operations in a
+#      row failed with an outage error (unavailable, deadline exceeded, ...)
+#      calls fail at once for FIRESTORE_BREAKER_COOLDOWN seconds; then one
+#      probe call decides whether it closes again;
+#   2. the concurrency cap: at most FIRESTORE_MAX_IN_FLIGHT operations per
+#      client (sync / async) run at once, FIRESTORE_MAX_QUEUE more may wait
+#      up to FIRESTORE_QUEUE_TIMEOUT seconds for a slot; the rest are refused.
+#      A stream (query, get_all) gives its slot back once its first document
+#      arrives: from then on it waits on its consumer (an export writing to
+#      a slow client), not on Firestore. Open streams are counted apart
+#      (open_streams in /health, asm_firestore_open_streams);
+#   3. retries: reads (get, stream, get_all) are retried on outage errors
+#      with full-jitter exponential backoff; a stream only until its first
+#      document. Writes are never retried here.
+# A refused or failed operation raises StorageUnavailable, which main.py
+# answers with 503 + Retry-After. Under overload requests are shed in
+# microseconds instead of each holding a thread until the client deadline,
+# so the thread pool (and /health) stays responsive. The breaker state is
+# in /health and /metrics.
+FIRESTORE_MAX_IN_FLIGHT = int(os.getenv("FIRESTORE_MAX_IN_FLIGHT", "32"))
+FIRESTORE_MAX_QUEUE = int(os.getenv("FIRESTORE_MAX_QUEUE", "64"))
+FIRESTORE_QUEUE_TIMEOUT = float(os.getenv("FIRESTORE_QUEUE_TIMEOUT", "2"))
+FIRESTORE_READ_TIMEOUT = float(os.getenv("FIRESTORE_READ_TIMEOUT", "15"))  # get / get_all deadline
+FIRESTORE_READ_RETRIES = int(os.getenv("FIRESTORE_READ_RETRIES", "2"))
+FIRESTORE_BREAKER_FAILURES = int(os.getenv("FIRESTORE_BREAKER_FAILURES", "5"))
+FIRESTORE_BREAKER_COOLDOWN = float(os.getenv("FIRESTORE_BREAKER_COOLDOWN", "30"))
+RETRY_BASE = 0.1   # seconds; attempt n sleeps up to RETRY_BASE * 2**n
+RETRY_MAX = 2.0
+OVERLOAD_RETRY_AFTER = 1  # seconds a shed request is asked to wait
+
+
+class StorageUnavailable(Exception):
+    """Firestore did not (or could not) serve the call; answered with 503."""
+
+    def __init__(self, message: str, retry_after: float = OVERLOAD_RETRY_AFTER):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+_outage_errors = None
+
+
+def outage_errors():
+    """Errors that mean Firestore is down or overloaded (not that the call was wrong)."""
+    global _outage_errors
+    if _outage_errors is None:
+        errors = [ConnectionError, TimeoutError]
+        try:
+            from google.api_core import exceptions as api
+
+            errors += [api.ServiceUnavailable, api.DeadlineExceeded, api.InternalServerError,
+                       api.ResourceExhausted, api.Unknown, api.RetryError]
+        except ImportError:
+            pass
+        _outage_errors = tuple(errors)
+    return _outage_errors
+
+
+def _backoff(attempt: int):
+    """Full jitter: uniform over [0, base * 2**attempt], capped."""
+    return random.uniform(0, min(RETRY_MAX, RETRY_BASE * 2 ** attempt))
+
+
+def _rejected(reason: str, message: str, retry_after: float = OVERLOAD_RETRY_AFTER):
+    FIRESTORE_REJECTED.labels(reason).inc()
+    return StorageUnavailable(message, retry_after)
+
+
+# --------------------------------------------------
+# CIRCUIT BREAKER
+# --------------------------------------------------
+class CircuitBreaker:
+    """Consecutive-failure breaker shared by the sync and async clients."""
+
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+    _GAUGE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, failures: int = FIRESTORE_BREAKER_FAILURES, cooldown: float = FIRESTORE_BREAKER_COOLDOWN):
+        self.threshold = failures
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self.opened = 0
+
+    def before(self):
+        """
+        Output: True if this call is the half-open probe.
+        Raises StorageUnavailable while the circuit is open.
+        """
+        with self._lock:
+            if self._state == self.OPEN:
+                remaining = self._opened_at + self.cooldown - time.monotonic()
+                if remaining > 0:
+                    raise _rejected("circuit_open", "Firestore is unavailable (circuit open)", remaining)
+                self._set(self.HALF_OPEN)
+            if self._state == self.HALF_OPEN:
+                if self._probing:
+                    raise _rejected("circuit_open", "Firestore is unavailable (probing)")
+                self._probing = True
+                return True
+            return False
+
+    def success(self, probe: bool):
+        with self._lock:
+            self._failures = 0
+            if probe:
+                self._probing = False
+            if self._state != self.CLOSED:
+                logger.info("Firestore circuit closed")
+                self._set(self.CLOSED)
+
+    def failure(self, probe: bool):
+        with self._lock:
+            self._failures += 1
+            if probe:
+                self._probing = False
+            if self._state == self.HALF_OPEN or self._failures >= self.threshold:
+                if self._state != self.OPEN:
+                    logger.warning("Firestore circuit open after %d failures; failing fast for %ss",
+                                   self._failures, self.cooldown)
+                    self.opened += 1
+                    FIRESTORE_CIRCUIT_OPENED.inc()
+                self._opened_at = time.monotonic()
+                self._set(self.OPEN)
+
+    def abandon(self, probe: bool):
+        """The call never reached Firestore: lets another call probe."""
+        if probe:
+            with self._lock:
+                self._probing = False
+
+    def _set(self, state: str):
+        self._state = state
+        FIRESTORE_CIRCUIT_STATE.set(self._GAUGE[state])
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() >= self._opened_at + self.cooldown:
+                return self.HALF_OPEN  # the next call probes
+            return self._state
+
+    def status(self):
+        with self._lock:
+            retry_in = self._opened_at + self.cooldown - time.monotonic() if self._state == self.OPEN else 0
+        return {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "opened": self.opened,
+            "retry_in": round(max(0.0, retry_in), 1),
+        }
+
+
+# --------------------------------------------------
+# CONCURRENCY GATES (Bounded wait queue)
+# --------------------------------------------------
+class _ThreadGate:
+    """Slots for the sync client, shared by every request thread."""
+
+    def __init__(self, limit: int, queue: int, wait: float):
+        self.limit, self.queue, self.wait = limit, queue, wait
+        self._cond = threading.Condition()
+        self.active = 0
+        self.waiting = 0
+        self.streams = 0        # streams past their first document, holding no slot
+        self._in_flight, self._queued = FIRESTORE_IN_FLIGHT.labels("sync"), FIRESTORE_QUEUED.labels("sync")
+        self._streams = FIRESTORE_OPEN_STREAMS.labels("sync")
+
+    def acquire(self):
+        with self._cond:
+            # Newcomers queue behind waiters instead of barging past them
+            if self.active >= self.limit or self.waiting:
+                if self.waiting >= self.queue:
+                    raise _rejected("queue_full", "Too many Firestore operations queued")
+                self.waiting += 1
+                self._queued.set(self.waiting)
+                try:
+                    if not self._cond.wait_for(lambda: self.active < self.limit, self.wait):
+                        raise _rejected("queue_timeout", f"No Firestore slot within {self.wait}s")
+                finally:
+                    self.waiting -= 1
+                    self._queued.set(self.waiting)
+            self.active += 1
+            self._in_flight.set(self.active)
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._in_flight.set(self.active)
+            self._cond.notify()
+
+    def stream_opened(self):
+        """A stream got its first document: its slot goes to the next operation."""
+        with self._cond:
+            self.streams += 1
+            self._streams.set(self.streams)
+        self.release()
+
+    def stream_closed(self):
+        with self._cond:
+            self.streams -= 1
+            self._streams.set(self.streams)
+
+
+class _AsyncGate:
+    """Slots for the AsyncClient; used only from its event loop, so no lock."""
+
+    def __init__(self, limit: int, queue: int, wait: float):
+        self.limit, self.queue, self.wait = limit, queue, wait
+        self._waiters = collections.deque()
+        self.active = 0
+        self.streams = 0
+        self._in_flight, self._queued = FIRESTORE_IN_FLIGHT.labels("async"), FIRESTORE_QUEUED.labels("async")
+        self._streams = FIRESTORE_OPEN_STREAMS.labels("async")
+
+    @property
+    def waiting(self):
+        return len(self._waiters)
+
+    async def acquire(self):
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            self._in_flight.set(self.active)
+            return
+        if len(self._waiters) >= self.queue:
+            raise _rejected("queue_full", "Too many Firestore operations queued")
+
+        slot = asyncio.get_running_loop().create_future()
+        self._waiters.append(slot)
+        self._queued.set(len(self._waiters))
+        try:
+            await asyncio.wait_for(asyncio.shield(slot), self.wait)
+        except BaseException as e:
+            if slot.done() and not slot.cancelled():
+                self.release()  # handed over just as we gave up: pass it on
+            else:
+                slot.cancel()
+            if isinstance(e, asyncio.TimeoutError):
+                raise _rejected("queue_timeout", f"No Firestore slot within {self.wait}s") from None
+            raise
+        finally:
+            if slot in self._waiters:
+                self._waiters.remove(slot)
+            self._queued.set(len(self._waiters))
+
+    def release(self):
+        # A releasing operation hands its slot straight to the oldest waiter
+        while self._waiters:
+            slot = self._waiters.popleft()
+            if not slot.done():
+                slot.set_result(None)
+                return
+        self.active -= 1
+        self._in_flight.set(self.active)
+
+    def stream_opened(self):
+        self.streams += 1
+        self._streams.set(self.streams)
+        self.release()
+
+    def stream_closed(self):
+        self.streams -= 1
+        self._streams.set(self.streams)
+
+
+# --------------------------------------------------
+# GUARDS (Breaker + gate + retries around one call)
+# --------------------------------------------------
+class _Guard:
+    """Runs sync client calls: blocking gate, time.sleep between retries."""
+
+    def __init__(self, breaker: CircuitBreaker, gate):
+        self.breaker = breaker
+        self.gate = gate
+
+    def _enter(self):
+        probe = self.breaker.before()
+        try:
+            self.gate.acquire()
+        except StorageUnavailable:
+            self.breaker.abandon(probe)
+            raise
+        return probe
+
+    def call(self, op: str, factory, retries: int = 0):
+        probe = self._enter()
+        try:
+            attempt = 0
+            while True:
+                try:
+                    result = factory()
+                except outage_errors() as e:
+                    if attempt >= retries:
+                        self.breaker.failure(probe)
+                        raise StorageUnavailable(f"Firestore {op} failed: {e}") from e
+                    FIRESTORE_RETRIES.labels(op).inc()
+                    time.sleep(_backoff(attempt))
+                    attempt += 1
+                    continue
+                except BaseException:
+                    self.breaker.success(probe)  # Firestore answered; the call was wrong
+                    raise
+                self.breaker.success(probe)
+                return result
+        finally:
+            self.gate.release()
+
+    def stream(self, op: str, factory, retries: int = 0):
+        """
+        The slot is held until the first document arrives (or the stream
+        ends or fails); after that the stream counts as open instead.
+        """
+        probe = self._enter()
+        resolved, held = False, True
+        try:
+            attempt = 0
+            while True:
+                received = False
+                try:
+                    for doc in factory():
+                        if not received:
+                            received = resolved = True
+                            self.breaker.success(probe)
+                            held = False
+                            self.gate.stream_opened()
+                        yield doc
+                    break
+                except outage_errors() as e:
+                    if received or attempt >= retries:
+                        if not resolved:
+                            resolved = True
+                            self.breaker.failure(probe)
+                        raise StorageUnavailable(f"Firestore {op} failed: {e}") from e
+                    FIRESTORE_RETRIES.labels(op).inc()
+                    time.sleep(_backoff(attempt))
+                    attempt += 1
+            if not resolved:
+                resolved = True
+                self.breaker.success(probe)  # an empty result is an answer too
+        finally:
+            if not resolved:
+                self.breaker.abandon(probe)
+            if held:
+                self.gate.release()
+            else:
+                self.gate.stream_closed()
+
+
+class _AsyncGuard(_Guard):
+    """Runs AsyncClient calls: awaits the gate and asyncio.sleep between retries."""
+
+    async def _enter(self):
+        probe = self.breaker.before()
+        try:
+            await self.gate.acquire()
+        except BaseException:
+            self.breaker.abandon(probe)
+            raise
+        return probe
+
+    async def call(self, op: str, factory, retries: int = 0):
+        probe = await self._enter()
+        try:
+            attempt = 0
+            while True:
+                try:
+                    result = await factory()
+                except outage_errors() as e:
+                    if attempt >= retries:
+                        self.breaker.failure(probe)
+                        raise StorageUnavailable(f"Firestore {op} failed: {e}") from e
+                    FIRESTORE_RETRIES.labels(op).inc()
+                    await asyncio.sleep(_backoff(attempt))
+                    attempt += 1
+                    continue
+                except asyncio.CancelledError:
+                    self.breaker.abandon(probe)
+                    raise
+                except BaseException:
+                    self.breaker.success(probe)
+                    raise
+                self.breaker.success(probe)
+                return result
+        finally:
+            self.gate.release()
+
+    async def stream(self, op: str, factory, retries: int = 0):
+        probe = await self._enter()
+        resolved, held = False, True
+        try:
+            attempt = 0
+            while True:
+                received = False
+                try:
+                    async for doc in factory():
+                        if not received:
+                            received = resolved = True
+                            self.breaker.success(probe)
+                            held = False
+                            self.gate.stream_opened()
+                        yield doc
+                    break
+                except outage_errors() as e:
+                    if received or attempt >= retries:
+                        if not resolved:
+                            resolved = True
+                            self.breaker.failure(probe)
+                        raise StorageUnavailable(f"Firestore {op} failed: {e}") from e
+                    FIRESTORE_RETRIES.labels(op).inc()
+                    await asyncio.sleep(_backoff(attempt))
+                    attempt += 1
+            if not resolved:
+                resolved = True
+                self.breaker.success(probe)
+        finally:
+            if not resolved:
+                self.breaker.abandon(probe)
+            if held:
+                self.gate.release()
+            else:
+                self.gate.stream_closed()
+
+
+# --------------------------------------------------
+# FIRESTORE CLIENT WRAPPER
+# --------------------------------------------------
+# Same shape as the metrics wrapper: collections, queries, documents and
+# batches handed out by a protected client are protected too. Listeners
+# (on_snapshot) pass through: they reconnect on their own.
+breaker = CircuitBreaker()
+_gates = {}
+
+
+def _read_kwargs(kwargs: dict):
+    kwargs.setdefault("timeout", FIRESTORE_READ_TIMEOUT)
+    return kwargs
+
+
+def _unguard(obj):
+    return obj._target if isinstance(obj, _Guarded) else obj
+
+
+class _Guarded:
+    __slots__ = ("_target", "_guard")
+
+    def __init__(self, target, guard: _Guard):
+        self._target = target
+        self._guard = guard
+
+    def __getattr__(self, name):
+        return getattr(self._target, name)
+
+    def __repr__(self):
+        return f"Protected({self._target!r})"
+
+
+class _GuardedQuery(_Guarded):
+    """CollectionReference / Query / CollectionGroup."""
+    __slots__ = ()
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if name in QUERY_BUILDERS:
+            return lambda *args, **kwargs: _GuardedQuery(attr(*args, **kwargs), self._guard)
+        return attr
+
+    def stream(self, *args, **kwargs):
+        return self._guard.stream("stream", lambda: self._target.stream(*args, **kwargs), FIRESTORE_READ_RETRIES)
+
+    def get(self, *args, **kwargs):
+        kwargs = _read_kwargs(kwargs)
+        return self._guard.call("get", lambda: self._target.get(*args, **kwargs), FIRESTORE_READ_RETRIES)
+
+    def document(self, *args, **kwargs):
+        return _GuardedDocument(self._target.document(*args, **kwargs), self._guard)
+
+
+class _GuardedDocument(_Guarded):
+    __slots__ = ()
+
+    def get(self, *args, **kwargs):
+        kwargs = _read_kwargs(kwargs)
+        return self._guard.call("get", lambda: self._target.get(*args, **kwargs), FIRESTORE_READ_RETRIES)
+
+    def _write(self, op, *args, **kwargs):
+        return self._guard.call(op, lambda: getattr(self._target, op)(*args, **kwargs))
+
+    def set(self, *args, **kwargs):
+        return self._write("set", *args, **kwargs)
+
+    def create(self, *args, **kwargs):
+        return self._write("create", *args, **kwargs)
+
+    def update(self, *args, **kwargs):
+        return self._write("update", *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self._write("delete", *args, **kwargs)
+
+    def collection(self, collection_id: str):
+        return _GuardedQuery(self._target.collection(collection_id), self._guard)
+
+
+class _GuardedBatch(_Guarded):
+    """Queuing writes is local; only the commit is guarded (and never retried)."""
+    __slots__ = ()
+
+    def set(self, reference, *args, **kwargs):
+        return self._target.set(_unguard(reference), *args, **kwargs)
+
+    def create(self, reference, *args, **kwargs):
+        return self._target.create(_unguard(reference), *args, **kwargs)
+
+    def update(self, reference, *args, **kwargs):
+        return self._target.update(_unguard(reference), *args, **kwargs)
+
+    def delete(self, reference, *args, **kwargs):
+        return self._target.delete(_unguard(reference), *args, **kwargs)
+
+    def commit(self, *args, **kwargs):
+        return self._guard.call("commit", lambda: self._target.commit(*args, **kwargs))
+
+
+class _GuardedClient(_Guarded):
+    __slots__ = ()
+
+    def collection(self, *args):
+        return _GuardedQuery(self._target.collection(*args), self._guard)
+
+    def collection_group(self, collection_id: str):
+        return _GuardedQuery(self._target.collection_group(collection_id), self._guard)
+
+    def document(self, *args):
+        return _GuardedDocument(self._target.document(*args), self._guard)
+
+    def batch(self):
+        return _GuardedBatch(self._target.batch(), self._guard)
+
+    def get_all(self, references, *args, **kwargs):
+        references = [_unguard(r) for r in references]
+        kwargs = _read_kwargs(kwargs)
+        return self._guard.stream("get_all", lambda: self._target.get_all(references, *args, **kwargs),
+                                  FIRESTORE_READ_RETRIES)
+
+
+def protect_client(client, is_async: bool = False):
+    """Wraps a (metrics-instrumented) Firestore Client or AsyncClient."""
+    kind = "async" if is_async else "sync"
+    if kind not in _gates:
+        gate_type = _AsyncGate if is_async else _ThreadGate
+        _gates[kind] = gate_type(FIRESTORE_MAX_IN_FLIGHT, FIRESTORE_MAX_QUEUE, FIRESTORE_QUEUE_TIMEOUT)
+    guard = (_AsyncGuard if is_async else _Guard)(breaker, _gates[kind])
+    return _GuardedClient(client, guard)
+
+
+def status():
+    """Breaker state and slot usage, for /health."""
+    return {
+        "circuit": breaker.status(),
+        "in_flight": {kind: gate.active for kind, gate in _gates.items()},
+        "queued": {kind: gate.waiting for kind, gate in _gates.items()},
+        "open_streams": {kind: gate.streams for kind, gate in _gates.items()},
+    }
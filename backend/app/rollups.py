@@ -0,0 +1,296 @@
+from datetime import date, timedelta
+from firebase_admin import firestore
+from .database import get_firestore_db
+
+# --------------------------------------------------
+# PRODUCTION ROLLUPS
+# --------------------------------------------------
+# Per-worker totals maintained alongside every raw production record:
+#   production_daily/{worker_id}_{YYYY-MM-DD}
+#   production_monthly/{worker_id}_{YYYY-MM}
+# Each holds meters, amount, shift count and a per-loom breakdown, updated
+# with Firestore Increment transforms in the same batch as the raw record.
+# A range total then costs one read per whole month plus one per edge day.
+# A monthly loom entry also keeps its shed, loom number and the meters of
+# every shift the worker ran it ("slots": {"DD_<shift>": meters}), so loom
+# and shed analytics read one document per worker-month (shift_columns).
+#
+# Alongside them, one small counter per date of the writes that created or
+# changed its records (StorageEngine.production_versions):
+#   production_versions/{YYYY-MM-DD}     {"date", "writes"}
+# Unlike totals it moves on every edit, even one that keeps the totals
+# (meters moved between two workers). A batch bumps it once per date.
+
+DAILY_COLLECTION = "production_daily"
+MONTHLY_COLLECTION = "production_monthly"
+VERSIONS_COLLECTION = "production_versions"
+
+# Firestore rejects a WriteBatch with more than 500 operations
+BATCH_LIMIT = 500
+
+
+def daily_ref(worker_id: str, day: str, client=None):
+    return (client or get_firestore_db()).collection(DAILY_COLLECTION).document(f"{worker_id}_{day}")
+
+
+def monthly_ref(worker_id: str, month: str, client=None):
+    return (client or get_firestore_db()).collection(MONTHLY_COLLECTION).document(f"{worker_id}_{month}")
+
+
+def version_ref(day: str, client=None):
+    return (client or get_firestore_db()).collection(VERSIONS_COLLECTION).document(day)
+
+
+def _increments(record: dict, sign: int = 1, previous: dict = None):
+    """
+    The rollup fields one production record adds (sign=-1 removes it).
+    With 'previous' (the stored version of the same record, which has the
+    same worker, loom and date) only the difference is applied.
+    """
+    meters = record.get("meters", 0) * sign
+    amount = record.get("total_amount", 0) * sign
+    shifts = sign
+    if previous is not None:
+        meters -= previous.get("meters", 0)
+        amount -= previous.get("total_amount", 0)
+        shifts = 0
+    return {
+        "worker_id": record["worker_id"],
+        "meters": firestore.Increment(meters),
+        "amount": firestore.Increment(amount),
+        "shifts": firestore.Increment(shifts),
+        "looms": {
+            record["loom_id"]: {
+                "label": f"{record.get('shed_name', '')}{record.get('loom_number', '')}",
+                "meters": firestore.Increment(meters),
+                "amount": firestore.Increment(amount),
+            }
+        },
+    }
+
+
+def _slot(record: dict):
+    """Key of a record's shift in its monthly loom entry: day of month and shift."""
+    return f"{record['date'][8:]}_{record['shift']}"
+
+
+def _monthly_loom(record: dict, meters):
+    """The monthly-only part of a record's loom entry (see shift_columns)."""
+    return {
+        "shed_name": record.get("shed_name"),
+        "loom_number": record.get("loom_number"),
+        "slots": {_slot(record): meters},
+    }
+
+
+def add_rollup_writes(batch, record: dict, sign: int = 1, client=None, previous: dict = None):
+    """
+    Queues the daily and monthly rollup updates for a production record
+    on an existing WriteBatch, so they commit atomically with the record.
+    Pass the batch's client when it is not the default (e.g. AsyncClient),
+    and 'previous' when the record replaces a stored one.
+    """
+    day = record["date"]
+    fields = _increments(record, sign, previous)
+    batch.set(daily_ref(record["worker_id"], day, client), {**fields, "date": day}, merge=True)
+    loom = fields["looms"][record["loom_id"]]
+    monthly = {**fields, "looms": {record["loom_id"]: {**loom, **_monthly_loom(record, loom["meters"])}}}
+    batch.set(monthly_ref(record["worker_id"], day[:7], client), {**monthly, "month": day[:7]}, merge=True)
+
+
+def add_version_writes(batch, days: dict, client=None):
+    """Queues the version counter bumps for {day: records written} on a WriteBatch."""
+    for day, writes in days.items():
+        batch.set(version_ref(day, client), {"date": day, "writes": firestore.Increment(writes)}, merge=True)
+
+
+def date_versions(start: str, end: str):
+    """{day: writes} of the dates in [start, end] with a version counter: one read per date."""
+    query = get_firestore_db().collection(VERSIONS_COLLECTION) \
+        .where("date", ">=", start) \
+        .where("date", "<=", end)
+    return {r["date"]: r.get("writes", 0) for r in (snap.to_dict() for snap in query.stream())}
+
+
+def _month_end(day: date):
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+
+
+def _plan_range(start: str, end: str):
+    """
+    Splits an inclusive date range into whole months and leftover edge days.
+    Output: (["YYYY-MM", ...], ["YYYY-MM-DD", ...])
+    """
+    first, last = date.fromisoformat(start), date.fromisoformat(end)
+    months, days = [], []
+
+    month_start = first.replace(day=1)
+    while month_start <= last:
+        month_end = _month_end(month_start)
+
+        if first <= month_start and month_end <= last:
+            months.append(month_start.strftime("%Y-%m"))
+        else:
+            day = max(first, month_start)
+            while day <= min(last, month_end):
+                days.append(day.isoformat())
+                day += timedelta(days=1)
+
+        month_start = month_end + timedelta(days=1)
+
+    return months, days
+
+
+def range_refs(worker_id: str, start: str, end: str, client=None):
+    """Rollup documents covering a date range: whole months, then edge days."""
+    months, days = _plan_range(start, end)
+    return [monthly_ref(worker_id, m, client) for m in months] + [daily_ref(worker_id, d, client) for d in days]
+
+
+def range_totals(worker_id: str, start: str, end: str):
+    """
+    Meters, salary and per-loom breakdown for a worker over a date range,
+    read from the rollup documents instead of the raw shift records.
+    """
+    refs = range_refs(worker_id, start, end)
+    return sum_rollups(get_firestore_db().get_all(refs) if refs else [])
+
+
+def sum_rollups(snapshots):
+    """Adds up fetched rollup snapshots (missing documents are skipped)."""
+    total_meters = 0
+    total_salary = 0
+    shifts = 0
+    looms = {}
+
+    for snap in snapshots:
+        if not snap.exists:
+            continue
+        r = snap.to_dict()
+        total_meters += r.get("meters", 0)
+        total_salary += r.get("amount", 0)
+        shifts += r.get("shifts", 0)
+
+        for loom_id, loom in (r.get("looms") or {}).items():
+            entry = looms.setdefault(loom_id, {"loom_id": loom_id, "loom": loom.get("label"), "meters": 0, "amount": 0})
+            entry["meters"] += loom.get("meters", 0)
+            entry["amount"] += loom.get("amount", 0)
+
+    return {
+        "summary": {
+            "total_meters": float(total_meters),
+            "total_salary": float(total_salary),
+            "shifts": shifts
+        },
+        "looms": [loom for loom in looms.values() if loom["meters"] or loom["amount"]]
+    }
+
+
+def month_stats(first: str = None, last: str = None):
+    """
+    Records, meters and amount per month ("YYYY-MM"), summed from the
+    monthly rollups: one read per worker-month instead of one per shift.
+    """
+    query = get_firestore_db().collection(MONTHLY_COLLECTION)
+    if first is not None:
+        query = query.where("month", ">=", first)
+    if last is not None:
+        query = query.where("month", "<=", last)
+
+    stats = {}
+    for snap in query.select(["month", "shifts", "meters", "amount"]).stream():
+        r = snap.to_dict()
+        month = stats.setdefault(r["month"], {"records": 0, "meters": 0.0, "amount": 0.0})
+        month["records"] += r.get("shifts", 0)
+        month["meters"] += r.get("meters", 0)
+        month["amount"] += r.get("amount", 0)
+    # Months whose records were all deleted keep a zeroed rollup
+    return {m: s for m, s in stats.items() if s["records"]}
+
+
+def shift_columns(start: str, end: str, fields: list, shed_name: str = None):
+    """
+    Production of [start, end] as {field: [values]} of 'fields' (date,
+    shift, loom_id, shed_name, loom_number, meters), one row per record,
+    from the monthly loom slots: one read per worker-month. Output:
+    (columns, months whose rollups miss slots and must be read live).
+    """
+    query = get_firestore_db().collection(MONTHLY_COLLECTION) \
+        .where("month", ">=", start[:7]) \
+        .where("month", "<=", end[:7])
+
+    rows, stale = {}, set()
+    for snap in query.select(["month", "looms"]).stream():
+        r = snap.to_dict()
+        month = r["month"]
+        for loom_id, loom in (r.get("looms") or {}).items():
+            slots = loom.get("slots") or {}
+            # Written (in part) before slots were kept: rebuild_rollups fills them
+            if abs(sum(slots.values()) - loom.get("meters", 0)) > 0.005:
+                stale.add(month)
+                continue
+            if shed_name is not None and loom.get("shed_name") != shed_name:
+                continue
+            for slot, meters in slots.items():
+                day = f"{month}-{slot[:2]}"
+                # A zero slot is a deleted record
+                if meters and start <= day <= end:
+                    values = {"date": day, "shift": slot[3:], "loom_id": loom_id, "shed_name": loom.get("shed_name"),
+                              "loom_number": loom.get("loom_number"), "meters": meters}
+                    rows.setdefault(month, []).append([values[field] for field in fields])
+
+    kept = [row for month, month_rows in rows.items() if month not in stale for row in month_rows]
+    values = list(zip(*kept)) if kept else [()] * len(fields)
+    return {field: list(column) for field, column in zip(fields, values)}, stale
+
+
+def rebuild_rollups(start: str, end: str):
+    """
+    Recomputes the rollups for a date range from the raw production records.
+    Used to backfill records saved before rollups existed.
+    The range is widened to whole months so monthly totals stay complete.
+    Output: Number of daily and monthly rollup documents written.
+    """
+    start = date.fromisoformat(start).replace(day=1).isoformat()
+    end = _month_end(date.fromisoformat(end)).isoformat()
+    daily, monthly = {}, {}
+    db = get_firestore_db()
+
+    query = db.collection("production") \
+        .where("date", ">=", start) \
+        .where("date", "<=", end) \
+        .stream()
+
+    for doc in query:
+        r = doc.to_dict()
+        for totals, key in (
+            (daily, (r["worker_id"], r["date"])),
+            (monthly, (r["worker_id"], r["date"][:7])),
+        ):
+            entry = totals.setdefault(key, {"worker_id": r["worker_id"], "meters": 0, "amount": 0, "shifts": 0, "looms": {}})
+            entry["meters"] += r.get("meters", 0)
+            entry["amount"] += r.get("total_amount", 0)
+            entry["shifts"] += 1
+            loom = entry["looms"].setdefault(r["loom_id"], {
+                "label": f"{r.get('shed_name', '')}{r.get('loom_number', '')}",
+                "meters": 0,
+                "amount": 0
+            })
+            loom["meters"] += r.get("meters", 0)
+            loom["amount"] += r.get("total_amount", 0)
+        # Monthly loom entries also keep their slots (see shift_columns)
+        loom = monthly[(r["worker_id"], r["date"][:7])]["looms"][r["loom_id"]]
+        slots = loom.setdefault("slots", {})
+        slots[_slot(r)] = slots.get(_slot(r), 0) + r.get("meters", 0)
+        loom.update(shed_name=r.get("shed_name"), loom_number=r.get("loom_number"))
+
+    writes = [(daily_ref(w, d), {**v, "date": d}) for (w, d), v in daily.items()]
+    writes += [(monthly_ref(w, m), {**v, "month": m}) for (w, m), v in monthly.items()]
+
+    for i in range(0, len(writes), BATCH_LIMIT):
+        batch = db.batch()
+        for ref, data in writes[i:i + BATCH_LIMIT]:
+            batch.set(ref, data)
+        batch.commit()
+
+    return {"daily": len(daily), "monthly": len(monthly)}
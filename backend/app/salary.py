@@ -1,8 +1,14 @@
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, Query, Body, HTTPException, Request
+from pydantic import ValidationError
 from datetime import date
-from .crud import crud # Ensure relative import if in the same package
+from typing import List, Dict, Any, Optional
+from .crud import acrud # Ensure relative import if in the same package
 from .auth import admin_required, get_current_user
 from .schemas import ProductionCreate # Keep for request validation
+from .pagination import decode_cursor, PRODUCTION_CURSOR, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from .payroll import PayrollConflict
+from .writebehind import status as writebehind_status
+from .httpcache import json_response
 
 # We define the router here to be included in main.py
 router = APIRouter()
@@ -11,7 +17,7 @@ router = APIRouter()
 # ADD PRODUCTION ENTRY
 # --------------------------------------------------
 @router.post("/production/")
-def add_production(
+async def add_production(
     entry: ProductionCreate,
     # REMOVED: db=Depends(get_db)
     admin=Depends(admin_required) # Keep security check
@@ -19,29 +25,222 @@ def add_production(
     """
     Adds a new production record for a worker.
     Converts Pydantic model to dict for Firestore.
+    shed_name/loom_number are looked up from loom_id when omitted, and the
+    rate comes from the rate card (see /rates/).
+    409 if the date falls inside a frozen payroll period.
     """
-    return crud.add_production(entry.dict())
+    try:
+        data = await acrud.prepare_production(entry.dict())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        return await acrud.add_production(data)
+    except PayrollConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+# --------------------------------------------------
+# LIST PRODUCTION RECORDS (Paginated)
+# --------------------------------------------------
+@router.get("/production/")
+async def list_production(
+    worker_id: Optional[str] = None,
+    loom_id: Optional[str] = None,
+    shed_name: Optional[str] = None,
+    start_date: Optional[date] = Query(None, description="Format: YYYY-MM-DD"),
+    end_date: Optional[date] = Query(None, description="Format: YYYY-MM-DD"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    start_after: Optional[str] = Query(None, description="'next_cursor' of the previous page"),
+    user=Depends(get_current_user)
+):
+    """
+    One page of production records ordered by date: {"items", "next_cursor"}.
+    Pass 'next_cursor' back as 'start_after' for the next page.
+    """
+    try:
+        after = decode_cursor(start_after, PRODUCTION_CURSOR)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return await acrud.list_production_page(
+        limit, after,
+        worker_id=worker_id,
+        loom_id=loom_id,
+        shed_name=shed_name.upper() if shed_name else None,
+        start=str(start_date) if start_date else None,
+        end=str(end_date) if end_date else None
+    )
+
+
+# --------------------------------------------------
+# WRITE-BEHIND FLUSH STATUS
+# --------------------------------------------------
+@router.get("/production/flush-status")
+async def production_flush_status(user=Depends(get_current_user)):
+    """
+    State of the write-behind journal (WRITE_BEHIND=1): queued entries not
+    yet in storage, the age of the oldest, and the last flush or error.
+    """
+    return writebehind_status()
+
+
+# --------------------------------------------------
+# PRODUCTION LOOKUP (worker, loom, date)
+# --------------------------------------------------
+@router.get("/production_records/")
+async def get_production_record(
+    worker_id: str,
+    loom_id: str,
+    date: date = Query(..., description="Format: YYYY-MM-DD"),
+    shift: Optional[str] = Query(None, pattern="^(Day|Night)$", description="Both shifts when omitted"),
+    user=Depends(get_current_user)
+):
+    """
+    Meters a worker produced on a loom for a day: {"meters_produced", "records"}.
+    Records are keyed by (worker, loom, date, shift), so this is a point
+    read of at most two documents rather than a query.
+    """
+    records = await acrud.lookup_production(worker_id, loom_id, str(date), shift)
+    if not records:
+        raise HTTPException(status_code=404, detail="No production record found for these criteria")
+
+    return {
+        "meters_produced": sum(float(r.get("meters") or 0) for r in records),
+        "records": records
+    }
+
+
+# --------------------------------------------------
+# BULK PRODUCTION ENTRY (Shift change sheet)
+# --------------------------------------------------
+@router.post("/production/bulk")
+async def add_production_bulk(
+    rows: List[Dict[str, Any]] = Body(..., description="List of ProductionCreate rows"),
+    admin=Depends(admin_required)
+):
+    """
+    Adds many production records in one request.
+    Every row is validated up front; valid rows are committed in
+    Firestore batches and invalid rows are reported back by index,
+    so one bad row doesn't reject the whole sheet. Rows dated inside a
+    frozen payroll period are reported the same way.
+    """
+    valid_rows = []
+    valid_indexes = []
+    results = []
+
+    for index, row in enumerate(rows):
+        try:
+            valid_rows.append(await acrud.prepare_production(ProductionCreate(**row).dict()))
+            valid_indexes.append(index)
+        except ValidationError as e:
+            message = "; ".join(
+                f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}"
+                for err in e.errors()
+            )
+            results.append({"index": index, "error": message})
+        except ValueError as e:
+            results.append({"index": index, "error": str(e)})
+
+    # Map batch results back to the row positions of the original sheet
+    for result in await acrud.add_production_bulk(valid_rows):
+        result["index"] = valid_indexes[result["index"]]
+        results.append(result)
+
+    results.sort(key=lambda r: r["index"])
+    created = sum(1 for r in results if "id" in r)
+
+    return {
+        "created": created,
+        "failed": len(results) - created,
+        "results": results
+    }
 
 
 # --------------------------------------------------
 # SALARY CALCULATION
 # --------------------------------------------------
 @router.get("/salary/calculate")
-def calculate_salary(
+async def calculate_salary(
+    request: Request,
     # Firestore IDs are strings (e.g., "zX9yW2...")
     worker_id: str, 
     start_date: date = Query(..., description="Format: YYYY-MM-DD"),
     end_date: date = Query(..., description="Format: YYYY-MM-DD"),
+    format: str = Query("rows", pattern="^(rows|grid)$", description="'rows' (default) or 'grid' for the pivoted slip"),
     # REMOVED: db=Depends(get_db)
     admin=Depends(get_current_user)
 ):
     """
     Calculates total meters and salary for a specific date range.
     Output structure is UNCHANGED for frontend compatibility.
+    With format=grid the date x loom slip matrix is built on the server
+    and returned as compact parallel arrays.
+    Carries an ETag; If-None-Match with it returns 304 when nothing changed.
     """
     # Convert date objects to strings as Firestore queries work best with ISO strings
-    return crud.calculate_salary(
+    slip = await acrud.calculate_salary(
         worker_id=worker_id, 
         start=str(start_date), 
         end=str(end_date)
-    )
\ No newline at end of file
+    )
+
+    if format == "grid":
+        return json_response(request, acrud.salary_grid(slip))
+
+    return json_response(request, slip)
+
+
+# --------------------------------------------------
+# PRODUCTION TOTALS (From rollups)
+# --------------------------------------------------
+@router.get("/salary/totals")
+async def production_totals(
+    request: Request,
+    worker_id: str,
+    start_date: date = Query(..., description="Format: YYYY-MM-DD"),
+    end_date: date = Query(..., description="Format: YYYY-MM-DD"),
+    user=Depends(get_current_user)
+):
+    """
+    Total meters, salary and per-loom breakdown for a worker.
+    Read from the daily/monthly rollups, so long ranges (e.g. year-to-date)
+    cost one read per month instead of one per shift.
+    """
+    return json_response(request, await acrud.production_totals(worker_id, str(start_date), str(end_date)))
+
+
+@router.post("/salary/rollups/rebuild")
+async def rebuild_rollups(
+    start_date: date = Query(..., description="Format: YYYY-MM-DD"),
+    end_date: date = Query(..., description="Format: YYYY-MM-DD"),
+    admin=Depends(admin_required)
+):
+    """Recomputes the rollups from raw production records (widened to whole months)."""
+    return await acrud.rebuild_rollups(str(start_date), str(end_date))
+
+
+# --------------------------------------------------
+# PAYROLL RUN (All workers, one scan)
+# --------------------------------------------------
+@router.get("/salary/payroll")
+async def run_payroll(
+    request: Request,
+    start_date: date = Query(..., description="Format: YYYY-MM-DD"),
+    end_date: date = Query(..., description="Format: YYYY-MM-DD"),
+    admin=Depends(admin_required)
+):
+    """
+    Calculates salary for every worker with production in the period.
+    Each worker gets the same 'details'/'summary' shape as /salary/calculate.
+    """
+    payroll = await acrud.calculate_payroll(start=str(start_date), end=str(end_date))
+
+    return json_response(request, {
+        "period": {"start": str(start_date), "end": str(end_date)},
+        "workers": [
+            {"worker_id": worker_id, **slip}
+            for worker_id, slip in payroll.items()
+        ]
+    })
@@ -8,6 +8,9 @@ from typing import Optional
 class WorkerCreate(BaseModel):
     name: str
     phone: Optional[str] = None
+    # Stored explicitly so list filters can match on them in the database
+    is_active: bool = True
+    shed_id: Optional[str] = None  # Shed the worker is usually assigned to
 
 
 # --------------------------------------------------
@@ -32,15 +35,29 @@ class ProductionCreate(BaseModel):
     loom_id: str
     
     # Denormalization: Including these helps generate the Salary Slip 
-    # without extra database lookups in NoSQL
-    shed_name: str 
-    loom_number: str
+    # without extra database lookups in NoSQL.
+    # Optional: the server fills them from its reference-data cache.
+    shed_name: Optional[str] = None
+    loom_number: Optional[str] = None
     
     date: date # Pydantic will validate this and we convert to str in crud.py
     
     # Strict validation remains unchanged
     shift: str = Field(..., pattern="^(Day|Night)$") 
     meters: float = Field(..., gt=0)
+    # Optional: the server prices the entry from the rate card. A sent rate
+    # is only used where the card has no entry for this loom and date.
+    rate: Optional[float] = Field(None, gt=0)
+    quality: Optional[str] = None  # Fabric quality, for quality-specific rates
+
+
+# --------------------------------------------------
+# RATE CARD
+# --------------------------------------------------
+class RateCreate(BaseModel):
+    scope: str = Field(..., pattern="^(loom|quality|shed)$")
+    key: str = Field(..., min_length=1, max_length=200)  # loom_id, quality name or shed_id
+    effective_from: date
     rate: float = Field(..., gt=0)
 
 
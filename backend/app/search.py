@@ -0,0 +1,180 @@
+import heapq
+import re
+import unicodedata
+from bisect import bisect_left, insort
+from collections import Counter
+
+# --------------------------------------------------
+# WORKER TYPEAHEAD INDEX
+# --------------------------------------------------
+# GET /api/v1/workers/search?q= is called on every keystroke, so it is
+# answered from memory: app.refdata keeps a WorkerIndex next to its worker
+# dict and updates both from the same change feed (and the write-through
+# in create_worker). A lookup never reads storage.
+#
+# Per worker the index holds:
+#   - every word of the name, and the phone digits (with and without the
+#     country code), in sorted lists of (term, worker_id): a prefix lookup
+#     is one bisect plus a short walk;
+#   - trigram postings of the name and phone: substrings ("ugan" in
+#     "Murugan") and spelling variants of names ("Saravanan" / "Sarvanan")
+#     are found by counting shared trigrams, without looking at every worker.
+#
+# Names are NFKC-normalised and casefolded. Words are split on whitespace
+# and punctuation only: Tamil vowel signs are not alphanumeric, so
+# splitting on \W would cut Tamil names apart.
+#
+# Ranking (best first), ties -> active workers, shorter names, then A-Z:
+#   exact name > name starts with q > every word of q starts a name word
+#   = phone starts with q > q inside name/phone > similarly spelt name
+SEARCH_LIMIT = 10       # default matches per query
+SEARCH_MAX_LIMIT = 50
+FUZZY_MIN = 0.5         # minimum trigram similarity (Dice) for a near-miss
+PHONE_LOCAL_DIGITS = 10 # a phone is also indexed without its country code
+
+_SEPARATORS = re.compile(r"[\s.,;:/()_\-'\"]+")
+_PHONE_CHARS = re.compile(r"[\s+\-()]")
+
+EXACT, NAME_PREFIX, WORD_PREFIX, CONTAINS, SIMILAR = 5, 4, 3, 2, 1
+
+
+def normalize(text: str) -> str:
+    """Casefolded NFKC text with single spaces between words."""
+    words = _SEPARATORS.split(unicodedata.normalize("NFKC", text or "").casefold())
+    return " ".join(w for w in words if w)
+
+
+def _phone_digits(query: str):
+    """The digits of a phone-like query ('+91 98430-12345'), else None."""
+    compact = _PHONE_CHARS.sub("", query)
+    return compact if compact.isdigit() else None
+
+
+def _trigrams(text: str) -> set:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class WorkerIndex:
+    """Prefix + trigram index of worker names and phone numbers (not thread-safe)."""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._docs = {}       # worker_id -> (worker dict, name, phone digits, name trigrams, tie-break key)
+        self._words = []      # sorted (name word, worker_id)
+        self._phones = []     # sorted (phone digits, worker_id)
+        self._grams = {}      # trigram -> {worker_id}
+
+    def __len__(self):
+        return len(self._docs)
+
+    # ---------------- Updates ----------------
+    def put(self, worker: dict):
+        """Adds or replaces a worker ({"id", "name", "phone", ...})."""
+        worker_id = worker["id"]
+        self.remove(worker_id)
+        name = normalize(worker.get("name"))
+        phone = "".join(c for c in str(worker.get("phone") or "") if c.isdigit())
+        name_grams = _trigrams(name)
+        key = (worker.get("is_active") is False, len(name), name, worker_id)
+
+        self._docs[worker_id] = (dict(worker), name, phone, name_grams, key)
+        for word in set(name.split()):
+            insort(self._words, (word, worker_id))
+        for term in self._phone_terms(phone):
+            insort(self._phones, (term, worker_id))
+        for gram in name_grams | _trigrams(phone):
+            self._grams.setdefault(gram, set()).add(worker_id)
+
+    def remove(self, worker_id: str):
+        doc = self._docs.pop(worker_id, None)
+        if doc is None:
+            return
+        _, name, phone, name_grams, _ = doc
+        for word in set(name.split()):
+            self._discard(self._words, (word, worker_id))
+        for term in self._phone_terms(phone):
+            self._discard(self._phones, (term, worker_id))
+        for gram in name_grams | _trigrams(phone):
+            ids = self._grams[gram]
+            ids.discard(worker_id)
+            if not ids:
+                del self._grams[gram]
+
+    @staticmethod
+    def _phone_terms(phone: str) -> set:
+        return {phone, phone[-PHONE_LOCAL_DIGITS:]} if phone else set()
+
+    @staticmethod
+    def _discard(terms: list, entry: tuple):
+        i = bisect_left(terms, entry)
+        if i < len(terms) and terms[i] == entry:
+            del terms[i]
+
+    # ---------------- Lookup ----------------
+    @staticmethod
+    def _prefixed(terms: list, prefix: str) -> set:
+        """Ids with a term starting with prefix."""
+        ids = set()
+        for i in range(bisect_left(terms, (prefix,)), len(terms)):
+            term, worker_id = terms[i]
+            if not term.startswith(prefix):
+                break
+            ids.add(worker_id)
+        return ids
+
+    def search(self, query: str, limit: int = SEARCH_LIMIT, is_active: bool = None):
+        """Output: Up to `limit` worker dicts, best match first."""
+        q = normalize(query)
+        if not q:
+            return []
+        words = q.split()
+        digits = _phone_digits(query)
+
+        tiers = {}  # worker_id -> (tier, similarity)
+
+        # Every query word must start some word of the name
+        matched = None
+        for word in sorted(words, key=len, reverse=True):
+            ids = self._prefixed(self._words, word)
+            matched = ids if matched is None else matched & ids
+            if not matched:
+                break
+        for worker_id in matched or ():
+            name = self._docs[worker_id][1]
+            tier = EXACT if name == q else NAME_PREFIX if name.startswith(q) else WORD_PREFIX
+            tiers[worker_id] = (tier, 1.0)
+
+        if digits:
+            for worker_id in self._prefixed(self._phones, digits):
+                tiers.setdefault(worker_id, (WORD_PREFIX, 1.0))
+
+        # Substrings and near-misses: workers sharing enough trigrams
+        grams = _trigrams(digits or q)
+        if grams:
+            shared = Counter()
+            for gram in grams:
+                shared.update(self._grams.get(gram, ()))
+            for worker_id, count in shared.items():
+                if worker_id in tiers:
+                    continue
+                _, name, phone, name_grams, _ = self._docs[worker_id]
+                if count == len(grams) and ((digits or q) in phone or q in name):
+                    tiers[worker_id] = (CONTAINS, 1.0)
+                    continue
+                if digits:
+                    continue  # a phone number is right or wrong, not "similar"
+                similarity = 2 * count / (len(grams) + len(name_grams))
+                if similarity >= FUZZY_MIN:
+                    tiers[worker_id] = (SIMILAR, similarity)
+
+        def rank(worker_id):
+            tier, similarity = tiers[worker_id]
+            return (-tier, -similarity) + self._docs[worker_id][4]
+
+        candidates = (
+            worker_id for worker_id in tiers
+            if is_active is None or (self._docs[worker_id][0].get("is_active") is not False) == is_active
+        )
+        return [dict(self._docs[worker_id][0]) for worker_id in heapq.nsmallest(limit, candidates, key=rank)]
@@ -0,0 +1,173 @@
+import io
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+
+# --------------------------------------------------
+# SALARY SLIP PDF RENDERING
+# --------------------------------------------------
+# Runs in the slip process pool (see app/slips.py), so this module only
+# imports reportlab: no FastAPI, storage or Firebase in the workers.
+#
+# A slip is the dashboard's printed layout:
+#   worker name | period
+#   date x loom grid with a TOTAL row (looms split into blocks of
+#   LOOMS_PER_BLOCK columns so wide sheds stay legible)
+#   loom summary table | total meters, average rate, total pay
+# Input slips are {"worker_id", "worker_name", "period", "grid"} where
+# 'grid' is the output of CRUD.salary_grid.
+
+PAGE_WIDTH, PAGE_HEIGHT = A4
+MARGIN = 36
+ROW_HEIGHT = 14
+DATE_COLUMN = 48
+LOOMS_PER_BLOCK = 14
+FONT, BOLD = "Helvetica", "Helvetica-Bold"
+# The standard PDF fonts have no rupee glyph
+CURRENCY = "Rs."
+
+
+def _date_label(day: str):
+    """'2024-03-07' -> '7/3', as on the dashboard."""
+    _, month, dom = day.split("-")
+    return f"{int(dom)}/{int(month)}"
+
+
+def _meters(value):
+    return f"{value:.1f}" if value > 0 else "-"
+
+
+class _SlipPage:
+    """A canvas with a y cursor that starts a new page when a row does not fit."""
+
+    def __init__(self, pdf, slip: dict):
+        self.pdf = pdf
+        self.slip = slip
+        self.y = None
+        self.new_page(first=True)
+
+    def new_page(self, first: bool = False):
+        if not first:
+            self.pdf.showPage()
+        name = self.slip["worker_name"] or self.slip["worker_id"]
+        top = PAGE_HEIGHT - MARGIN
+        self.pdf.setLineWidth(1.5)
+        self.pdf.rect(MARGIN, top - 34, 300, 34)
+        self.pdf.rect(PAGE_WIDTH - MARGIN - 170, top - 34, 170, 34)
+        self.pdf.setFont(BOLD, 14)
+        self.pdf.drawString(MARGIN + 8, top - 22, (name if first else f"{name} (cont.)").upper()[:36])
+        self.pdf.setFont(FONT, 7)
+        self.pdf.drawRightString(PAGE_WIDTH - MARGIN - 8, top - 12, "PERIOD")
+        self.pdf.setFont(BOLD, 9)
+        period = self.slip["period"]
+        self.pdf.drawRightString(PAGE_WIDTH - MARGIN - 8, top - 26, f"{period['start']} to {period['end']}")
+        self.pdf.setLineWidth(0.5)
+        self.y = top - 50
+
+    def ensure(self, height: float):
+        if self.y - height < MARGIN:
+            self.new_page()
+
+    def row(self, x: float, widths: list, cells: list, bold: bool = False, shade: bool = False,
+            align: list = None):
+        """One bordered table row at the cursor; 'align' is 'l'/'c'/'r' per cell."""
+        self.ensure(ROW_HEIGHT)
+        top = self.y
+        if shade:
+            self.pdf.setFillGray(0.9)
+            self.pdf.rect(x, top - ROW_HEIGHT, sum(widths), ROW_HEIGHT, stroke=0, fill=1)
+            self.pdf.setFillGray(0)
+        self.pdf.setFont(BOLD if bold else FONT, 7.5)
+        left = x
+        for i, (width, text) in enumerate(zip(widths, cells)):
+            self.pdf.rect(left, top - ROW_HEIGHT, width, ROW_HEIGHT)
+            how = align[i] if align else "c"
+            baseline = top - ROW_HEIGHT + 4
+            if how == "l":
+                self.pdf.drawString(left + 3, baseline, text)
+            elif how == "r":
+                self.pdf.drawRightString(left + width - 3, baseline, text)
+            else:
+                self.pdf.drawCentredString(left + width / 2, baseline, text)
+            left += width
+        self.y -= ROW_HEIGHT
+
+
+def _draw_grid(page: _SlipPage, grid: dict):
+    dates, looms, meters = grid["dates"], grid["looms"], grid["meters"]
+    usable = PAGE_WIDTH - 2 * MARGIN - DATE_COLUMN
+
+    for first in range(0, len(looms), LOOMS_PER_BLOCK):
+        block = range(first, min(first + LOOMS_PER_BLOCK, len(looms)))
+        widths = [DATE_COLUMN] + [usable / LOOMS_PER_BLOCK] * len(block)
+        header = ["DATE"] + [looms[j] for j in block]
+
+        page.ensure(3 * ROW_HEIGHT)
+        page.row(MARGIN, widths, header, bold=True, shade=True)
+        for i, day in enumerate(dates):
+            if page.y - ROW_HEIGHT < MARGIN:
+                page.new_page()
+                page.row(MARGIN, widths, header, bold=True, shade=True)
+            page.row(MARGIN, widths, [_date_label(day)] + [_meters(meters[i][j]) for j in block])
+        page.row(MARGIN, widths, ["TOTAL"] + [f"{grid['loom_totals'][j]:.1f}" for j in block],
+                 bold=True, shade=True)
+        page.y -= 10
+
+
+def _draw_summary(page: _SlipPage, grid: dict):
+    total_meters = float(grid["summary"].get("total_meters") or 0)
+    total_salary = float(grid["summary"].get("total_salary") or 0)
+    avg_rate = total_salary / total_meters if total_meters > 0 else 0
+
+    half = (PAGE_WIDTH - 2 * MARGIN - 24) / 2
+    widths = [half * 0.55, half * 0.45]
+    right = MARGIN + half + 24
+
+    page.ensure(4 * ROW_HEIGHT + 10)
+    page.pdf.setLineWidth(1.5)
+    page.pdf.line(MARGIN, page.y, PAGE_WIDTH - MARGIN, page.y)
+    page.pdf.setLineWidth(0.5)
+    page.y -= 10
+
+    # Totals first, beside the top of the loom table
+    top = page.y
+    lines = [("TOTAL METERS:", f"{total_meters:.2f}"),
+             ("AVG RATE:", f"{CURRENCY} {avg_rate:.2f}"),
+             ("TOTAL PAY:", f"{CURRENCY} {round(total_salary)}")]
+    for k, (label, value) in enumerate(lines):
+        y = top - 12 - k * 20
+        page.pdf.setFont(BOLD if k == 2 else FONT, 11 if k == 2 else 9)
+        page.pdf.drawString(right, y, label)
+        page.pdf.drawRightString(PAGE_WIDTH - MARGIN, y, value)
+    page.pdf.rect(right - 4, top - 12 - 2 * 20 - 5, PAGE_WIDTH - MARGIN - right + 8, 17)
+
+    page.row(MARGIN, widths, ["LOOM NUMBERS", "TOTAL METERS"], bold=True, shade=True, align=["l", "r"])
+    for loom, total in zip(grid["looms"], grid["loom_totals"]):
+        page.row(MARGIN, widths, [loom, f"{total:.1f}"], align=["l", "r"])
+
+
+def _draw_slip(pdf, slip: dict):
+    page = _SlipPage(pdf, slip)
+    _draw_grid(page, slip["grid"])
+    _draw_summary(page, slip["grid"])
+    pdf.showPage()
+
+
+def render_pdf(slips: list):
+    """Output: One PDF (bytes) with the slips one after another, each from a new page."""
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4, pageCompression=1)
+    pdf.setTitle("Salary slips")
+    for slip in slips:
+        _draw_slip(pdf, slip)
+    pdf.save()
+    return buffer.getvalue()
+
+
+def render_files(slips: list):
+    """Output: [(filename, PDF bytes)], one file per slip."""
+    return [(slip_filename(slip), render_pdf([slip])) for slip in slips]
+
+
+def slip_filename(slip: dict):
+    name = "".join(ch if ch.isalnum() else "_" for ch in (slip["worker_name"] or "")).strip("_")
+    return f"{name}_{slip['worker_id']}.pdf" if name else f"{slip['worker_id']}.pdf"
@@ -0,0 +1,216 @@
+import io
+import logging
+import math
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from .crud import crud
+from .refdata import refdata
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------
+# BATCH SALARY SLIP PDFs (Background jobs)
+# --------------------------------------------------
+# POST /export/slips starts a job and returns at once; the dashboard polls
+# GET /export/slips/{id} for progress and downloads the result when done.
+#
+# A job:
+#   1. loads the period's production for every matching worker in ONE
+#      storage scan (CRUD.calculate_payroll) and pivots each worker's slip
+#      into the date x loom grid (CRUD.salary_grid), in a job thread;
+#   2. renders the slips in a process pool (app/slip_pdf.py), chunks of
+#      slips per task so every core is busy and pickling stays cheap;
+#   3. merges the chunks into one PDF, or zips one PDF per worker.
+# No part of this runs on the event loop or in the request thread pool.
+#
+# The pool uses 'spawn' workers: forking a process that holds gRPC
+# channels (Firestore) is unsafe. Results are files under SLIP_OUTPUT_DIR;
+# only the newest SLIP_JOBS_KEEP jobs (and their files) are kept.
+SLIP_PROCESSES = int(os.getenv("SLIP_PROCESSES", "0")) or os.cpu_count() or 1
+SLIP_CHUNK = int(os.getenv("SLIP_CHUNK", "20"))        # max slips per pool task
+SLIP_CONCURRENT_JOBS = int(os.getenv("SLIP_CONCURRENT_JOBS", "2"))
+SLIP_JOBS_KEEP = int(os.getenv("SLIP_JOBS_KEEP", "20"))
+SLIP_OUTPUT_DIR = os.getenv("SLIP_OUTPUT_DIR") or None  # default: a temp dir per process
+
+MEDIA_TYPES = {"pdf": "application/pdf", "zip": "application/zip"}
+
+
+class SlipJobs:
+    """Registry of slip jobs plus the pools that run them."""
+
+    def __init__(self, processes: int = SLIP_PROCESSES):
+        self.processes = processes
+        self._lock = threading.Lock()
+        self._jobs = {}         # id -> job dict, oldest first
+        self._runner = None     # ThreadPoolExecutor: one thread per running job
+        self._pool = None       # ProcessPoolExecutor: the renderers
+        self._dir = None
+
+    # ---------------- Lifecycle ----------------
+    def _ensure_started(self):
+        with self._lock:
+            if self._runner is None:
+                self._runner = ThreadPoolExecutor(SLIP_CONCURRENT_JOBS, thread_name_prefix="slip-job")
+                self._pool = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context("spawn"))
+                self._dir = SLIP_OUTPUT_DIR or tempfile.mkdtemp(prefix="asm-slips-")
+                os.makedirs(self._dir, exist_ok=True)
+
+    def stop(self):
+        """Called from the lifespan: running jobs are abandoned, not awaited."""
+        with self._lock:
+            runner, pool = self._runner, self._pool
+            self._runner = self._pool = None
+        if runner is not None:
+            runner.shutdown(wait=False, cancel_futures=True)
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    # ---------------- Jobs ----------------
+    def submit(self, start: str, end: str, fmt: str = "pdf", worker_id: str = None, shed_name: str = None):
+        """Queues a job. Output: Its status (see get)."""
+        self._ensure_started()
+        job = {
+            "id": uuid.uuid4().hex,
+            "status": "queued",          # queued -> loading -> rendering -> done | failed
+            "format": fmt,
+            "period": {"start": start, "end": end},
+            "filters": {"worker_id": worker_id, "shed_name": shed_name},
+            "total": None,               # workers with production, once loaded
+            "done": 0,                   # slips rendered
+            "error": None,
+            "created_at": time.time(),
+            "finished_at": None,
+            "path": None,
+        }
+        with self._lock:
+            self._jobs[job["id"]] = job
+            self._evict()
+        self._runner.submit(self._run, job)
+        return self.get(job["id"])
+
+    def get(self, job_id: str):
+        """Output: Public status of a job, or None if unknown (or evicted)."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            status = {k: v for k, v in job.items() if k != "path"}
+        total = status["total"]
+        status["progress"] = round(status["done"] / total, 3) if total else (1.0 if status["status"] == "done" else 0.0)
+        status["download"] = status["status"] == "done" and job["path"] is not None
+        return status
+
+    def result(self, job_id: str):
+        """Output: (path, media type, filename) of a finished job's file, or None."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["path"] is None:
+                return None
+            period = job["period"]
+            filename = f"salary_slips_{period['start']}_{period['end']}.{job['format']}"
+            return job["path"], MEDIA_TYPES[job["format"]], filename
+
+    def _evict(self):
+        finished = [j for j in self._jobs.values() if j["status"] in ("done", "failed")]
+        for job in finished[:max(0, len(self._jobs) - SLIP_JOBS_KEEP)]:
+            del self._jobs[job["id"]]
+            if job["path"]:
+                try:
+                    os.remove(job["path"])
+                except OSError:
+                    pass
+
+    def _update(self, job: dict, **changes):
+        with self._lock:
+            job.update(changes)
+
+    # ---------------- Execution (job thread) ----------------
+    def _load(self, job: dict):
+        """Every matching worker's slip grid from a single production scan."""
+        period, filters = job["period"], job["filters"]
+        payroll = crud.calculate_payroll(
+            period["start"], period["end"],
+            **{k: v for k, v in filters.items() if v is not None}
+        )
+        slips = []
+        for worker_id, slip in payroll.items():
+            worker = refdata.get_worker(worker_id)
+            slips.append({
+                "worker_id": worker_id,
+                "worker_name": worker.get("name") if worker else None,
+                "period": period,
+                "grid": crud.salary_grid(slip),
+            })
+        slips.sort(key=lambda s: ((s["worker_name"] or "").lower(), s["worker_id"]))
+        return slips
+
+    def _run(self, job: dict):
+        started = time.perf_counter()
+        try:
+            self._update(job, status="loading")
+            slips = self._load(job)
+            self._update(job, status="rendering", total=len(slips))
+            if slips:
+                path = os.path.join(self._dir, f"{job['id']}.{job['format']}")
+                self._render(job, slips, path)
+                self._update(job, path=path)
+            self._update(job, status="done", finished_at=time.time())
+            logger.info("Slip job %s: %d slips in %.1fs", job["id"], len(slips), time.perf_counter() - started)
+        except Exception as e:
+            logger.warning("Slip job %s failed: %s", job["id"], e)
+            self._update(job, status="failed", error=str(e), finished_at=time.time())
+
+    def _render(self, job: dict, slips: list, path: str):
+        # Small enough chunks that every process gets several (load balance)
+        size = max(1, min(SLIP_CHUNK, math.ceil(len(slips) / (self.processes * 4))))
+        chunks = [slips[i:i + size] for i in range(0, len(slips), size)]
+        from . import slip_pdf  # reportlab is only needed once a job renders
+
+        render = slip_pdf.render_pdf if job["format"] == "pdf" else slip_pdf.render_files
+        pool = self._pool
+        if pool is None:
+            raise RuntimeError("Slip export was stopped")
+        futures = {pool.submit(render, chunk): index for index, chunk in enumerate(chunks)}
+
+        rendered = [None] * len(chunks)
+        pending = set(futures)
+        while pending:
+            # Wake up now and then: after stop() the pool may never finish
+            # (or cancel) these, and a blocked job thread would hang exit
+            done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = futures[future]
+                rendered[index] = future.result()
+                self._update(job, done=job["done"] + len(chunks[index]))
+            if pending and self._pool is not pool:
+                for future in pending:
+                    future.cancel()
+                raise RuntimeError("Slip export was stopped")
+
+        tmp = path + ".tmp"
+        if job["format"] == "pdf":
+            _merge_pdfs(rendered, tmp)
+        else:
+            with zipfile.ZipFile(tmp, "w", zipfile.ZIP_STORED) as archive:  # PDFs are already compressed
+                for files in rendered:
+                    for filename, data in files:
+                        archive.writestr(filename, data)
+        os.replace(tmp, path)
+
+
+def _merge_pdfs(parts: list, path: str):
+    from pypdf import PdfWriter
+
+    writer = PdfWriter()
+    for part in parts:
+        writer.append(io.BytesIO(part))
+    with open(path, "wb") as f:
+        writer.write(f)
+
+
+slip_jobs = SlipJobs()
@@ -0,0 +1,127 @@
+import time
+
+# Taken before any other app import: main.py imports this module first
+IMPORT_STARTED = time.perf_counter()
+
+import asyncio
+import inspect
+import logging
+import threading
+from anyio import to_thread
+from .metrics import STARTUP_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------
+# COLD START: BACKGROUND PRE-WARM AND READINESS
+# --------------------------------------------------
+# The service is spun down when idle, so boot time is user facing. The
+# lifespan therefore does no network work before the server starts
+# accepting connections: Firebase, the Firestore gRPC channels, reference
+# data and Google's signing certificates are warmed by a background task.
+#   GET /health  liveness: the process is up (answers immediately)
+#   GET /ready   readiness: 200 once every required warm-up step succeeded
+#                (best-effort steps, e.g. certificates, may still be running)
+# Requests that arrive earlier still work; they pay for what is not warm
+# yet (CRUD falls back to storage reads until refdata is loaded).
+#
+# asm_startup_seconds{phase} records seconds since this module's import:
+#   lifespan        the app finished importing and the lifespan began
+#   ready           the required warm-up steps finished
+#   first_response  the first HTTP response was sent
+
+
+class WarmUpStep:
+    """A named warm-up callable (sync ones run in a worker thread)."""
+
+    def __init__(self, name: str, func, required: bool = True):
+        self.name = name
+        self.func = func
+        self.required = required
+
+
+class Startup:
+    def __init__(self):
+        self.steps = {}  # name -> {"ms", "required"} or {"error", "required"}
+        self.phases = {}  # phase -> seconds since import
+        self._required_done = threading.Event()
+        self._done = threading.Event()
+        self._task = None
+
+    def _mark(self, phase: str):
+        if phase not in self.phases:
+            seconds = time.perf_counter() - IMPORT_STARTED
+            self.phases[phase] = round(seconds, 4)
+            STARTUP_SECONDS.labels(phase).set(seconds)
+
+    # ---------------- Lifecycle ----------------
+    def begin(self, steps: list):
+        """Called from the lifespan: schedules the warm-up without waiting for it."""
+        self._mark("lifespan")
+        self.steps = {}
+        self._required_done.clear()
+        self._done.clear()
+        self._task = asyncio.get_running_loop().create_task(self._warm_up(steps))
+
+    async def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def _warm_up(self, steps: list):
+        # Yield first, so the server binds its port before any work starts
+        await asyncio.sleep(0)
+        # Required steps run in order (each may need the previous one);
+        # best-effort ones then run together and do not delay readiness
+        for step in steps:
+            if step.required:
+                await self._run(step)
+        self._mark("ready")
+        self._required_done.set()
+        logger.info("Ready %.2fs after import", self.phases["ready"])
+
+        await asyncio.gather(*(self._run(step) for step in steps if not step.required))
+        self._done.set()
+
+    async def _run(self, step: WarmUpStep):
+        started = time.perf_counter()
+        try:
+            if inspect.iscoroutinefunction(step.func):
+                await step.func()
+            else:
+                await to_thread.run_sync(step.func)
+            self.steps[step.name] = {"ms": round((time.perf_counter() - started) * 1000, 1),
+                                     "required": step.required}
+        except Exception as e:
+            logger.warning("Warm-up step '%s' failed: %s", step.name, e)
+            self.steps[step.name] = {"error": str(e), "required": step.required}
+
+    def mark_first_response(self):
+        if "first_response" not in self.phases:
+            self._mark("first_response")
+
+    # ---------------- Readiness ----------------
+    @property
+    def ready(self):
+        return self._required_done.is_set() and not any(
+            "error" in step and step["required"] for step in self.steps.values()
+        )
+
+    async def wait_ready(self, timeout: float = None):
+        """Output: True once the required warm-up steps finished within 'timeout'."""
+        return await to_thread.run_sync(self._required_done.wait, timeout)
+
+    def status(self):
+        return {
+            "ready": self.ready,
+            "warming_up": not self._done.is_set(),
+            "steps": dict(self.steps),
+            "startup_seconds": dict(self.phases),
+        }
+
+
+startup = Startup()
@@ -0,0 +1,75 @@
+import os
+import threading
+from pathlib import Path
+from dotenv import load_dotenv
+from .aio import ThreadedAsyncEngine
+
+load_dotenv()
+
+# --------------------------------------------------
+# STORAGE ENGINE SELECTION
+# --------------------------------------------------
+# STORAGE_ENGINE=firestore (default) -> Firebase Firestore (needs the service account)
+# STORAGE_ENGINE=sqlite              -> Embedded SQLite file at SQLITE_PATH
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+STORAGE_ENGINE = os.getenv("STORAGE_ENGINE", "firestore").lower()
+SQLITE_PATH = os.getenv("SQLITE_PATH", str(BASE_DIR / "asm.db"))
+
+_engine = None
+_async_engine = None
+_engine_lock = threading.Lock()
+
+
+def create_engine(name: str = None):
+    """Builds a new storage engine by name (defaults to STORAGE_ENGINE)."""
+    name = (name or STORAGE_ENGINE).lower()
+
+    if name == "firestore":
+        # Imported lazily: importing it initialises Firebase
+        from .firestore_engine import FirestoreEngine
+        return FirestoreEngine()
+    if name == "sqlite":
+        from .sqlite_engine import SQLiteEngine
+        return SQLiteEngine(SQLITE_PATH)
+
+    raise ValueError(f"Unknown STORAGE_ENGINE '{name}'. Use 'firestore' or 'sqlite'.")
+
+
+def get_engine():
+    """Returns the process-wide storage engine, creating it on first use."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = create_engine()
+    return _engine
+
+
+def get_async_engine():
+    """
+    Returns the async facade used by the async request path:
+    a native AsyncClient engine for Firestore, a thread-offloading
+    wrapper around the sync engine otherwise.
+    """
+    global _async_engine
+    if _async_engine is None:
+        engine = get_engine()
+        with _engine_lock:
+            if _async_engine is None:
+                if engine.name == "firestore":
+                    from .async_firestore_engine import AsyncFirestoreEngine
+                    _async_engine = AsyncFirestoreEngine(engine)
+                else:
+                    _async_engine = ThreadedAsyncEngine(engine)
+    return _async_engine
+
+
+def set_engine(engine, async_engine=None):
+    """
+    Swaps the process-wide engine (tests, benchmarks, local tooling).
+    Without async_engine, the async path wraps the new engine in threads.
+    """
+    global _engine, _async_engine
+    with _engine_lock:
+        _engine = engine
+        _async_engine = async_engine or ThreadedAsyncEngine(engine)
@@ -0,0 +1,102 @@
+import functools
+from itertools import islice
+from anyio import to_thread
+
+# --------------------------------------------------
+# ASYNC STORAGE ENGINE
+# --------------------------------------------------
+# The async request path awaits these methods. ThreadedAsyncEngine runs a
+# sync engine's calls in a worker thread, which suits SQLite (sub-ms local
+# calls) and is the fallback for anything an engine does not do natively.
+# Engines with a real async client (AsyncFirestoreEngine) override methods.
+STREAM_CHUNK = 1000  # rows per worker-thread hop in stream_production
+
+
+class ThreadedAsyncEngine:
+    """Async facade over a sync StorageEngine."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.name = engine.name
+
+    async def _run(self, fn, *args, **kwargs):
+        return await to_thread.run_sync(functools.partial(fn, *args, **kwargs))
+
+    # ---------------- Workers ----------------
+    async def create_worker(self, worker_data: dict):
+        return await self._run(self.engine.create_worker, worker_data)
+
+    async def list_workers(self):
+        return await self._run(self.engine.list_workers)
+
+    async def query_workers(self, limit: int, after: list = None, **filters):
+        return await self._run(self.engine.query_workers, limit, after, **filters)
+
+    # ---------------- Sheds / Looms ----------------
+    async def create_shed(self, name: str):
+        return await self._run(self.engine.create_shed, name)
+
+    async def create_loom(self, shed_id: str, loom_number: str):
+        return await self._run(self.engine.create_loom, shed_id, loom_number)
+
+    async def load_hierarchy(self):
+        return await self._run(self.engine.load_hierarchy)
+
+    # ---------------- Production ----------------
+    async def insert_production(self, record: dict):
+        return await self._run(self.engine.insert_production, record)
+
+    async def insert_production_many(self, records: list):
+        return await self._run(self.engine.insert_production_many, records)
+
+    async def get_production(self, record_ids: list):
+        return await self._run(self.engine.get_production, record_ids)
+
+    async def stream_production(self, start: str, end: str, **filters):
+        """
+        StorageEngine.stream_production as an async generator: rows are
+        pulled STREAM_CHUNK at a time in a worker thread, so memory stays
+        flat for any range.
+        """
+        rows = self.engine.stream_production(start, end, **filters)
+        try:
+            while True:
+                chunk = await self._run(lambda: list(islice(rows, STREAM_CHUNK)))
+                if not chunk:
+                    return
+                for row in chunk:
+                    yield row
+        finally:
+            rows.close()
+
+    async def query_production(self, limit: int, after: list = None, **filters):
+        return await self._run(self.engine.query_production, limit, after, **filters)
+
+    async def production_totals(self, worker_id: str, start: str, end: str):
+        return await self._run(self.engine.production_totals, worker_id, start, end)
+
+    async def rebuild_rollups(self, start: str, end: str):
+        return await self._run(self.engine.rebuild_rollups, start, end)
+
+    # ---------------- Rate card ----------------
+    async def put_rate(self, rate_id: str, rate: dict):
+        return await self._run(self.engine.put_rate, rate_id, rate)
+
+    async def list_rates(self):
+        return await self._run(self.engine.list_rates)
+
+    # ---------------- Payroll snapshots ----------------
+    async def list_payroll_periods(self):
+        return await self._run(self.engine.list_payroll_periods)
+
+    async def put_payroll_period(self, period_id: str, period: dict, expected_revision: int):
+        return await self._run(self.engine.put_payroll_period, period_id, period, expected_revision)
+
+    async def delete_payroll_period(self, period_id: str, expected_revision: int):
+        return await self._run(self.engine.delete_payroll_period, period_id, expected_revision)
+
+    async def save_payroll_slips(self, period_id: str, snapshot_id: str, slips: dict):
+        return await self._run(self.engine.save_payroll_slips, period_id, snapshot_id, slips)
+
+    async def get_payroll_slips(self, period_id: str, snapshot_id: str, worker_ids: list = None):
+        return await self._run(self.engine.get_payroll_slips, period_id, snapshot_id, worker_ids)
@@ -0,0 +1,168 @@
+import asyncio
+from ..database import get_async_firestore_db
+from .. import rollups
+from .aio import ThreadedAsyncEngine
+from .base import SLIP_FIELDS, production_key
+from .firestore_engine import (
+    WRITES_PER_RECORD, UPSERT_ATTEMPTS, UPSERT_CONFLICTS,
+    workers_query, keep_workers, production_query, production_range_query,
+    plan_upserts, production_refs, records_by_key,
+    payroll_slips_collection, payroll_chunks_collection, slips_from_chunks,
+)
+from ..rollups import BATCH_LIMIT
+from ..ratecard import RATES
+
+
+class AsyncFirestoreEngine(ThreadedAsyncEngine):
+    """
+    Request-path Firestore access on firestore.AsyncClient, so awaiting a
+    slow Firestore call frees the event loop instead of a pool thread.
+    Independent reads are issued concurrently. Rare admin operations
+    (rollup rebuild) fall back to the sync engine in a thread.
+    """
+
+    @property
+    def db(self):
+        return get_async_firestore_db()
+
+    # -------------------------------------------------
+    # WORKERS
+    # -------------------------------------------------
+    async def create_worker(self, worker_data: dict):
+        doc_ref = self.db.collection("workers").document()
+        await doc_ref.set(worker_data)
+        return doc_ref.id
+
+    async def list_workers(self):
+        return [{"id": doc.id, **doc.to_dict()} async for doc in self.db.collection("workers").stream()]
+
+    async def query_workers(self, limit: int, after: list = None, **filters):
+        """Same paging as FirestoreEngine.query_workers."""
+        workers = []
+        while True:
+            docs = [doc async for doc in workers_query(self.db, limit, after, **filters).stream()]
+            workers += keep_workers(docs, **filters)
+            if len(docs) < limit or len(workers) >= limit:
+                return workers[:limit]
+            after = [docs[-1].get("name"), docs[-1].id]
+
+    # -------------------------------------------------
+    # SHEDS / LOOMS
+    # -------------------------------------------------
+    async def create_shed(self, name: str):
+        doc_ref = self.db.collection("sheds").document()
+        await doc_ref.set({"name": name})
+        return doc_ref.id
+
+    async def create_loom(self, shed_id: str, loom_number: str):
+        doc_ref = self.db.collection("sheds").document(shed_id).collection("looms").document()
+        await doc_ref.set({"loom_number": loom_number})
+        return doc_ref.id
+
+    async def load_hierarchy(self):
+        """Sheds and the 'looms' collection group are fetched concurrently."""
+        async def collect(query):
+            return [doc async for doc in query.stream()]
+
+        shed_docs, loom_docs = await asyncio.gather(
+            collect(self.db.collection("sheds")),
+            collect(self.db.collection_group("looms")),
+        )
+
+        hierarchy = []
+        sheds_by_id = {}
+        for shed_doc in shed_docs:
+            shed = {"id": shed_doc.id, "name": shed_doc.to_dict().get("name"), "looms": []}
+            sheds_by_id[shed_doc.id] = shed
+            hierarchy.append(shed)
+
+        for loom in loom_docs:
+            # Path is sheds/{shed_id}/looms/{loom_id}
+            shed_ref = loom.reference.parent.parent
+            shed = sheds_by_id.get(shed_ref.id) if shed_ref is not None else None
+            if shed is not None:
+                shed["looms"].append({"id": loom.id, "loom_number": loom.to_dict().get("loom_number")})
+
+        return hierarchy
+
+    # -------------------------------------------------
+    # PRODUCTION
+    # -------------------------------------------------
+    async def _upsert(self, records: dict):
+        """Same plan and retries as FirestoreEngine._upsert."""
+        snapshots = None
+        for attempt in range(UPSERT_ATTEMPTS):
+            batch = self.db.batch()
+            if not plan_upserts(self.db, batch, records, snapshots):
+                return
+            try:
+                await batch.commit()
+                return
+            except UPSERT_CONFLICTS:
+                if attempt == UPSERT_ATTEMPTS - 1:
+                    raise
+                snapshots = {snap.id: snap async for snap in self.db.get_all(production_refs(self.db, records))}
+
+    async def insert_production(self, record: dict):
+        key = production_key(record)
+        await self._upsert({key: record})
+        return key
+
+    async def insert_production_many(self, records: list):
+        """All WriteBatch chunks are committed concurrently."""
+        chunk_size = BATCH_LIMIT // WRITES_PER_RECORD
+
+        async def commit_chunk(start: int):
+            chunk = records[start:start + chunk_size]
+            try:
+                await self._upsert(records_by_key(chunk))
+                return [{"index": start + i, "id": production_key(record)} for i, record in enumerate(chunk)]
+            except Exception as e:
+                return [{"index": start + i, "error": f"Commit failed: {e}"} for i in range(len(chunk))]
+
+        chunks = await asyncio.gather(*(commit_chunk(start) for start in range(0, len(records), chunk_size)))
+        return [result for chunk in chunks for result in chunk]
+
+    async def get_production(self, record_ids: list):
+        found = {
+            snap.id: snap.to_dict()
+            async for snap in self.db.get_all(production_refs(self.db, record_ids))
+            if snap.exists
+        }
+        return [{"id": record_id, **found[record_id]} for record_id in record_ids if record_id in found]
+
+    async def stream_production(self, start: str, end: str, worker_id: str = None,
+                                shed_name: str = None, fields: list = SLIP_FIELDS):
+        async for doc in production_range_query(self.db, start, end, worker_id, shed_name, fields).stream():
+            yield doc.to_dict()
+
+    async def query_production(self, limit: int, after: list = None, **filters):
+        query = production_query(self.db, limit, after, **filters)
+        return [{"id": doc.id, **doc.to_dict()} async for doc in query.stream()]
+
+    async def production_totals(self, worker_id: str, start: str, end: str):
+        refs = rollups.range_refs(worker_id, start, end, client=self.db)
+        snapshots = [snap async for snap in self.db.get_all(refs)] if refs else []
+        return rollups.sum_rollups(snapshots)
+
+    # -------------------------------------------------
+    # RATE CARD
+    # -------------------------------------------------
+    async def put_rate(self, rate_id: str, rate: dict):
+        await self.db.collection(RATES).document(rate_id).set(rate)
+
+    async def list_rates(self):
+        return [{"id": doc.id, **doc.to_dict()} async for doc in self.db.collection(RATES).stream()]
+
+    # -------------------------------------------------
+    # PAYROLL SNAPSHOTS (reads; freezing runs on the sync engine)
+    # -------------------------------------------------
+    async def get_payroll_slips(self, period_id: str, snapshot_id: str, worker_ids: list = None):
+        collection = payroll_slips_collection(self.db, period_id, snapshot_id)
+        if worker_ids is None:
+            chunks = [doc.to_dict() async for doc in payroll_chunks_collection(self.db, period_id, snapshot_id).stream()]
+            if chunks:
+                return slips_from_chunks(chunks)
+            return {doc.id: doc.to_dict() async for doc in collection.stream()}
+        refs = [collection.document(worker_id) for worker_id in worker_ids]
+        return {snap.id: snap.to_dict() async for snap in self.db.get_all(refs) if snap.exists}
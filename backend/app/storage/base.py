@@ -0,0 +1,200 @@
+from abc import ABC, abstractmethod
+
+# --------------------------------------------------
+# STORAGE ENGINE INTERFACE
+# --------------------------------------------------
+# CRUD owns the business rules (amount calculation, enrichment, slip
+# building); an engine only stores and fetches. Records are plain dicts
+# and dates are ISO strings (YYYY-MM-DD) in every engine.
+
+# Only the production fields that a salary slip actually reads
+SLIP_FIELDS = [
+    "worker_id", "date", "shift", "meters", "total_amount",
+    "shed_name", "loom_number", "loom_id",
+]
+
+# A worker works a loom at most once per date and shift
+SHIFTS = ("Day", "Night")
+
+# Every stored production field, in export column order
+PRODUCTION_FIELDS = [
+    "date", "shift", "worker_id", "loom_id", "shed_name", "loom_number",
+    "meters", "rate", "total_amount",
+]
+
+
+def production_key(record: dict):
+    """
+    Deterministic id of a production record: one per (worker, loom, date,
+    shift). Saving the same shift again therefore replaces, never duplicates.
+    """
+    return f"{record['worker_id']}_{record['loom_id']}_{record['date']}_{record['shift']}"
+
+
+class StorageEngine(ABC):
+    name = "base"
+
+    # ---------------- Workers ----------------
+    @abstractmethod
+    def create_worker(self, worker_data: dict) -> str:
+        """Stores a worker and returns its new id."""
+
+    @abstractmethod
+    def list_workers(self) -> list:
+        """All workers as dicts including 'id'."""
+
+    @abstractmethod
+    def query_workers(self, limit: int, after: list = None, is_active: bool = None,
+                      name_prefix: str = None, shed_id: str = None) -> list:
+        """
+        Up to 'limit' workers ordered by (name, id), starting after the
+        [name, id] cursor 'after', with optional equality/prefix filters.
+        """
+
+    # ---------------- Sheds / Looms ----------------
+    @abstractmethod
+    def create_shed(self, name: str) -> str:
+        """Stores a shed and returns its new id."""
+
+    @abstractmethod
+    def create_loom(self, shed_id: str, loom_number: str) -> str:
+        """Stores a loom under a shed and returns its new id."""
+
+    @abstractmethod
+    def load_hierarchy(self) -> list:
+        """[{"id", "name", "looms": [{"id", "loom_number"}]}]"""
+
+    # ---------------- Production ----------------
+    @abstractmethod
+    def insert_production(self, record: dict) -> str:
+        """
+        Upserts one complete production record under production_key() and
+        returns that id. Repeating the same write changes nothing.
+        """
+
+    @abstractmethod
+    def insert_production_many(self, records: list) -> list:
+        """
+        Upserts like insert_production. One result per record, in order:
+        {"index", "id"} or {"index", "error"}.
+        """
+
+    @abstractmethod
+    def get_production(self, record_ids: list) -> list:
+        """Point lookup by id: the records that exist (with 'id'), in the given order."""
+
+    @abstractmethod
+    def stream_production(self, start: str, end: str, worker_id: str = None,
+                          shed_name: str = None, fields: list = SLIP_FIELDS):
+        """
+        Lazily yields production dicts (only 'fields') in the date range,
+        ordered by date, optionally filtered by worker and/or shed.
+        """
+
+    def production_columns(self, start: str, end: str, fields: list, shed_name: str = None) -> dict:
+        """
+        The records stream_production yields, column-major: {field: [values]}
+        (app.analytics turns the lists into NumPy arrays). Engines that can
+        hand back tuples cheaply override this.
+        """
+        columns = {field: [] for field in fields}
+        appends = [(field, columns[field].append) for field in fields]
+        for record in self.stream_production(start, end, shed_name=shed_name, fields=fields):
+            for field, append in appends:
+                append(record.get(field))
+        return columns
+
+    def production_shift_columns(self, start: str, end: str, fields: list, shed_name: str = None) -> dict:
+        """
+        production_columns for loom / shed analytics, whose 'fields' are
+        among date, shift, loom_id, shed_name, loom_number and meters.
+        Engines with per-shift rollups override this scan.
+        """
+        return self.production_columns(start, end, fields, shed_name=shed_name)
+
+    def production_month_stats(self, first: str = None, last: str = None) -> dict:
+        """
+        {"YYYY-MM": {"records", "meters", "amount"}} for every month with
+        production between 'first' and 'last' (inclusive, "YYYY-MM"; open
+        ended when None). app.archive compares them between runs to find
+        changed months. Engines with rollups or aggregates override this scan.
+        """
+        stats = {}
+        start, end = f"{first or '0000-01'}-01", f"{last or '9999-12'}-31"
+        for record in self.stream_production(start, end, fields=["date", "meters", "total_amount"]):
+            month = stats.setdefault(record["date"][:7], {"records": 0, "meters": 0.0, "amount": 0.0})
+            month["records"] += 1
+            month["meters"] += record.get("meters") or 0
+            month["amount"] += record.get("total_amount") or 0
+        return stats
+
+    @abstractmethod
+    def production_versions(self, start: str, end: str) -> dict:
+        """
+        {"YYYY-MM-DD": writes} for the dates in [start, end] that have ever
+        had production: a counter bumped by every write that creates or
+        changes a record of that date (a payroll run compares them to tell
+        whether its period was edited, see app.payroll_runs).
+        """
+
+    @abstractmethod
+    def query_production(self, limit: int, after: list = None, worker_id: str = None,
+                         loom_id: str = None, shed_name: str = None,
+                         start: str = None, end: str = None) -> list:
+        """
+        Up to 'limit' production records (with 'id') ordered by (date, id),
+        starting after the [date, id] cursor 'after'.
+        """
+
+    @abstractmethod
+    def production_totals(self, worker_id: str, start: str, end: str) -> dict:
+        """{"summary": {...}, "looms": [...]} for a worker over a date range."""
+
+    def rebuild_rollups(self, start: str, end: str) -> dict:
+        """Engines without precomputed rollups have nothing to rebuild."""
+        return {"daily": 0, "monthly": 0}
+
+    # ---------------- Rate card ----------------
+    @abstractmethod
+    def put_rate(self, rate_id: str, rate: dict) -> None:
+        """Creates or replaces one rate card entry under its deterministic id."""
+
+    @abstractmethod
+    def list_rates(self) -> list:
+        """All rate card entries as dicts including 'id'."""
+
+    # ---------------- Payroll snapshots ----------------
+    @abstractmethod
+    def list_payroll_periods(self) -> list:
+        """All payroll period documents as dicts including 'id' (see app.payroll)."""
+
+    @abstractmethod
+    def put_payroll_period(self, period_id: str, period: dict, expected_revision: int) -> None:
+        """
+        Compare-and-set: stores 'period' only if the stored document's
+        'revision' is still 'expected_revision' (0: it must not exist yet).
+        Raises app.payroll.PayrollConflict otherwise.
+        """
+
+    @abstractmethod
+    def delete_payroll_period(self, period_id: str, expected_revision: int) -> None:
+        """
+        Compare-and-set delete, like put_payroll_period: undoes the first
+        freeze of a period (app.payroll_runs). Its snapshots are kept.
+        """
+
+    @abstractmethod
+    def save_payroll_slips(self, period_id: str, snapshot_id: str, slips: dict) -> None:
+        """Stores {worker_id: slip} as snapshot 'snapshot_id' of the period."""
+
+    @abstractmethod
+    def get_payroll_slips(self, period_id: str, snapshot_id: str, worker_ids: list = None) -> dict:
+        """{worker_id: slip} from one snapshot: every worker, or only 'worker_ids' (point reads)."""
+
+    # ---------------- Reference data ----------------
+    @abstractmethod
+    def reference_feed(self):
+        """
+        Change feed for app.refdata (workers, sheds, looms), app.ratecard
+        (rate_card) and app.payroll (payroll_periods).
+        """
@@ -0,0 +1,414 @@
+import json
+from collections import Counter
+from google.api_core.exceptions import AlreadyExists, FailedPrecondition, NotFound
+from firebase_admin import firestore
+from ..database import get_firestore_db
+from .. import rollups
+from ..rollups import BATCH_LIMIT
+from ..refdata import FirestoreChangeFeed
+from ..ratecard import RATES
+from ..payroll import PAYROLL_PERIODS, PayrollConflict
+from .base import StorageEngine, SLIP_FIELDS, production_key
+
+# Each production record is written together with its daily + monthly rollup,
+# and at most one version counter bump for its date (see app.rollups)
+WRITES_PER_RECORD = 4
+
+
+# --------------------------------------------------
+# PAGED QUERIES (shared with AsyncFirestoreEngine)
+# --------------------------------------------------
+# Each combination of filters + ordering needs a Firestore composite index;
+# the console links to create one on the first failing query.
+def workers_query(client, limit: int, after: list = None, is_active: bool = None,
+                  name_prefix: str = None, shed_id: str = None):
+    query = client.collection("workers")
+    # Workers saved before is_active was stored count as active, but
+    # Firestore cannot match a missing field: is_active=True is applied
+    # after the fetch instead (see keep_workers)
+    if is_active is False:
+        query = query.where("is_active", "==", False)
+    if shed_id is not None:
+        query = query.where("shed_id", "==", shed_id)
+    if name_prefix:
+        query = query \
+            .where("name", ">=", name_prefix) \
+            .where("name", "<", name_prefix + "\uf8ff")
+
+    query = query.order_by("name").order_by("__name__")
+    if after:
+        query = query.start_after(after)
+    return query.limit(limit)
+
+
+def keep_workers(docs: list, is_active: bool = None, **_):
+    """Worker dicts of a workers_query page that pass the is_active filter it could not apply."""
+    workers = [{"id": doc.id, **doc.to_dict()} for doc in docs]
+    if is_active:
+        workers = [w for w in workers if w.get("is_active", True)]
+    return workers
+
+
+def production_query(client, limit: int, after: list = None, worker_id: str = None,
+                     loom_id: str = None, shed_name: str = None,
+                     start: str = None, end: str = None):
+    query = client.collection("production")
+    for field, value in (("worker_id", worker_id), ("loom_id", loom_id), ("shed_name", shed_name)):
+        if value is not None:
+            query = query.where(field, "==", value)
+    if start is not None:
+        query = query.where("date", ">=", start)
+    if end is not None:
+        query = query.where("date", "<=", end)
+
+    query = query.order_by("date").order_by("__name__")
+    if after:
+        query = query.start_after(after)
+    return query.limit(limit)
+
+
+def production_range_query(client, start: str, end: str, worker_id: str = None,
+                           shed_name: str = None, fields: list = SLIP_FIELDS):
+    """Date-ordered records in [start, end] (stream_production), only 'fields'."""
+    query = client.collection("production")
+    if worker_id is not None:
+        query = query.where("worker_id", "==", worker_id)
+    if shed_name is not None:
+        query = query.where("shed_name", "==", shed_name)
+
+    return query \
+        .where("date", ">=", start) \
+        .where("date", "<=", end) \
+        .order_by("date") \
+        .select(fields)
+
+
+# --------------------------------------------------
+# IDEMPOTENT UPSERTS (shared with AsyncFirestoreEngine)
+# --------------------------------------------------
+# Production documents are keyed by production_key(), so a retried save
+# targets the same document. A chunk is first committed with create()
+# preconditions and no reads (the usual case: every row is new). If a row
+# already exists, the chunk is re-planned from fresh snapshots: identical
+# rows are skipped and changed rows are updated under a last_update_time
+# precondition, applying only the difference to the rollups. A concurrent
+# save of the same row fails the precondition and the chunk is re-planned.
+UPSERT_ATTEMPTS = 3
+UPSERT_CONFLICTS = (AlreadyExists, FailedPrecondition, NotFound)
+
+
+def records_by_key(records: list):
+    """{production_key: record}; a later row for the same key wins."""
+    return {production_key(record): record for record in records}
+
+
+def plan_upserts(client, batch, records: dict, snapshots: dict = None):
+    """
+    Queues the writes for {key: record} on 'batch'. Without snapshots
+    every record is created. Output: number of records written.
+    """
+    days = Counter()
+    for key, record in records.items():
+        ref = client.collection("production").document(key)
+        snapshot = snapshots.get(key) if snapshots is not None else None
+
+        if snapshot is None or not snapshot.exists:
+            batch.create(ref, record)
+            rollups.add_rollup_writes(batch, record, client=client)
+            days[record["date"]] += 1
+            continue
+
+        previous = snapshot.to_dict()
+        if previous == record:
+            continue
+        changes = {**record, **{field: firestore.DELETE_FIELD for field in previous if field not in record}}
+        batch.update(ref, changes, option=client.write_option(last_update_time=snapshot.update_time))
+        rollups.add_rollup_writes(batch, record, client=client, previous=previous)
+        days[record["date"]] += 1
+    rollups.add_version_writes(batch, days, client=client)
+    return sum(days.values())
+
+
+def production_refs(client, keys):
+    return [client.collection("production").document(key) for key in keys]
+
+
+# --------------------------------------------------
+# PAYROLL SNAPSHOTS (shared with AsyncFirestoreEngine)
+# --------------------------------------------------
+# Each slip is its own document, for point reads of one worker. The whole
+# snapshot is also stored as a few chunk documents (slips as JSON, ordered
+# by worker id and kept under Firestore's 1 MiB document limit), so reading
+# every slip of a frozen period costs one read per chunk, not per worker:
+#   payroll_periods/{period}/snapshots/{run}/chunks/{0000, 0001, ...}  {"slips": "<json>"}
+# Snapshots frozen before chunks existed are read from their slips.
+SNAPSHOT_CHUNK_BYTES = 800_000
+
+
+def payroll_slips_collection(client, period_id: str, snapshot_id: str):
+    return client.collection(PAYROLL_PERIODS).document(period_id) \
+        .collection("snapshots").document(snapshot_id).collection("slips")
+
+
+def payroll_chunks_collection(client, period_id: str, snapshot_id: str):
+    return client.collection(PAYROLL_PERIODS).document(period_id) \
+        .collection("snapshots").document(snapshot_id).collection("chunks")
+
+
+def snapshot_chunks(slips: dict):
+    """{worker_id: slip} as JSON objects of at most SNAPSHOT_CHUNK_BYTES each."""
+    chunks, parts, size = [], [], 0
+    for worker_id in sorted(slips):
+        # ASCII-only JSON, so its length is its size in bytes
+        part = json.dumps(worker_id) + ":" + json.dumps(slips[worker_id], separators=(",", ":"))
+        if parts and size + len(part) > SNAPSHOT_CHUNK_BYTES:
+            chunks.append("{" + ",".join(parts) + "}")
+            parts, size = [], 0
+        parts.append(part)
+        size += len(part) + 1
+    if parts:
+        chunks.append("{" + ",".join(parts) + "}")
+    return chunks
+
+
+def slips_from_chunks(chunks: list):
+    """Inverse of snapshot_chunks, from the chunk documents' data in order."""
+    slips = {}
+    for chunk in chunks:
+        slips.update(json.loads(chunk["slips"]))
+    return slips
+
+
+class FirestoreEngine(StorageEngine):
+    """
+    Firebase Firestore storage:
+      workers/{id}, sheds/{id}/looms/{id}, production/{id}
+    plus the per-worker rollups maintained in app.rollups.
+    """
+    name = "firestore"
+
+    def __init__(self):
+        self.db = get_firestore_db()  # Initialises Firebase on first use
+
+    # -------------------------------------------------
+    # WORKERS
+    # -------------------------------------------------
+    def create_worker(self, worker_data: dict):
+        doc_ref = self.db.collection("workers").document()
+        doc_ref.set(worker_data)
+        return doc_ref.id
+
+    def list_workers(self):
+        docs = self.db.collection("workers").stream()
+        return [{"id": doc.id, **doc.to_dict()} for doc in docs]
+
+    def query_workers(self, limit: int, after: list = None, **filters):
+        """Fetches further pages while keep_workers drops rows (only with is_active=True)."""
+        workers = []
+        while True:
+            docs = list(workers_query(self.db, limit, after, **filters).stream())
+            workers += keep_workers(docs, **filters)
+            if len(docs) < limit or len(workers) >= limit:
+                return workers[:limit]
+            after = [docs[-1].get("name"), docs[-1].id]
+
+    # -------------------------------------------------
+    # SHEDS / LOOMS
+    # -------------------------------------------------
+    def create_shed(self, name: str):
+        doc_ref = self.db.collection("sheds").document()
+        doc_ref.set({"name": name})
+        return doc_ref.id
+
+    def create_loom(self, shed_id: str, loom_number: str):
+        # Looms are stored as a sub-collection inside a specific Shed document
+        doc_ref = self.db.collection("sheds").document(shed_id).collection("looms").document()
+        doc_ref.set({"loom_number": loom_number})
+        return doc_ref.id
+
+    def load_hierarchy(self):
+        """
+        Two Firestore queries regardless of shed count:
+        all sheds, then every loom via a 'looms' collection-group query,
+        joined to their parent shed in memory.
+        """
+        hierarchy = []
+        sheds_by_id = {}
+
+        for shed_doc in self.db.collection("sheds").stream():
+            shed = {
+                "id": shed_doc.id,
+                "name": shed_doc.to_dict().get("name"),
+                "looms": []
+            }
+            sheds_by_id[shed_doc.id] = shed
+            hierarchy.append(shed)
+
+        for loom in self.db.collection_group("looms").stream():
+            # Path is sheds/{shed_id}/looms/{loom_id}
+            shed_ref = loom.reference.parent.parent
+            shed = sheds_by_id.get(shed_ref.id) if shed_ref is not None else None
+            if shed is not None:
+                shed["looms"].append({"id": loom.id, "loom_number": loom.to_dict().get("loom_number")})
+
+        return hierarchy
+
+    # -------------------------------------------------
+    # PRODUCTION
+    # -------------------------------------------------
+    def _upsert(self, records: dict):
+        """Commits {key: record} and their rollups atomically (see plan_upserts)."""
+        snapshots = None
+        for attempt in range(UPSERT_ATTEMPTS):
+            batch = self.db.batch()
+            if not plan_upserts(self.db, batch, records, snapshots):
+                return
+            try:
+                batch.commit()
+                return
+            except UPSERT_CONFLICTS:
+                if attempt == UPSERT_ATTEMPTS - 1:
+                    raise
+                snapshots = {snap.id: snap for snap in self.db.get_all(production_refs(self.db, records))}
+
+    def insert_production(self, record: dict):
+        # Raw record and its rollups are committed atomically
+        key = production_key(record)
+        self._upsert({key: record})
+        return key
+
+    def insert_production_many(self, records: list):
+        """
+        Records are committed (with their rollups) in WriteBatch chunks,
+        so a failed chunk only marks its own rows as failed.
+        """
+        results = []
+        chunk_size = BATCH_LIMIT // WRITES_PER_RECORD
+        for start in range(0, len(records), chunk_size):
+            chunk = records[start:start + chunk_size]
+            try:
+                self._upsert(records_by_key(chunk))
+                results.extend(
+                    {"index": start + i, "id": production_key(record)} for i, record in enumerate(chunk)
+                )
+            except Exception as e:
+                results.extend(
+                    {"index": start + i, "error": f"Commit failed: {e}"} for i in range(len(chunk))
+                )
+
+        return results
+
+    def get_production(self, record_ids: list):
+        snapshots = self.db.get_all(production_refs(self.db, record_ids))
+        found = {snap.id: snap.to_dict() for snap in snapshots if snap.exists}
+        return [{"id": record_id, **found[record_id]} for record_id in record_ids if record_id in found]
+
+    def stream_production(self, start: str, end: str, worker_id: str = None,
+                          shed_name: str = None, fields: list = SLIP_FIELDS):
+        """
+        Filtering by worker_id or shed_name as well as the date range
+        requires a Firestore composite index.
+        """
+        for doc in production_range_query(self.db, start, end, worker_id, shed_name, fields).stream():
+            yield doc.to_dict()
+
+    def query_production(self, limit: int, after: list = None, **filters):
+        docs = production_query(self.db, limit, after, **filters).stream()
+        return [{"id": doc.id, **doc.to_dict()} for doc in docs]
+
+    def production_totals(self, worker_id: str, start: str, end: str):
+        """Answered from the daily/monthly rollups in O(months) reads."""
+        return rollups.range_totals(worker_id, start, end)
+
+    def rebuild_rollups(self, start: str, end: str):
+        return rollups.rebuild_rollups(start, end)
+
+    def production_shift_columns(self, start: str, end: str, fields: list, shed_name: str = None):
+        """
+        From the monthly rollups' loom slots. Months whose rollups predate
+        the slots are read record by record until the rollups are rebuilt.
+        """
+        columns, stale = rollups.shift_columns(start, end, fields, shed_name)
+        for month in sorted(stale):
+            low, high = max(start, f"{month}-01"), min(end, f"{month}-31")
+            live = self.production_columns(low, high, fields, shed_name=shed_name)
+            for field in fields:
+                columns[field].extend(live[field])
+        return columns
+
+    def production_month_stats(self, first: str = None, last: str = None):
+        """From the monthly rollups, not the raw records."""
+        return rollups.month_stats(first, last)
+
+    def production_versions(self, start: str, end: str):
+        return rollups.date_versions(start, end)
+
+    # -------------------------------------------------
+    # RATE CARD
+    # -------------------------------------------------
+    def put_rate(self, rate_id: str, rate: dict):
+        self.db.collection(RATES).document(rate_id).set(rate)
+
+    def list_rates(self):
+        return [{"id": doc.id, **doc.to_dict()} for doc in self.db.collection(RATES).stream()]
+
+    # -------------------------------------------------
+    # PAYROLL SNAPSHOTS
+    # -------------------------------------------------
+    def list_payroll_periods(self):
+        return [{"id": doc.id, **doc.to_dict()} for doc in self.db.collection(PAYROLL_PERIODS).stream()]
+
+    def put_payroll_period(self, period_id: str, period: dict, expected_revision: int):
+        """The write carries a precondition on the snapshot it was checked against."""
+        ref = self.db.collection(PAYROLL_PERIODS).document(period_id)
+        snapshot = ref.get()
+        current = snapshot.to_dict().get("revision", 0) if snapshot.exists else 0
+        if current != expected_revision:
+            raise PayrollConflict(f"Payroll period {period_id} was changed concurrently")
+        try:
+            if snapshot.exists:
+                # Period documents always carry every field, so update() replaces it whole
+                ref.update(period, option=self.db.write_option(last_update_time=snapshot.update_time))
+            else:
+                ref.create(period)
+        except UPSERT_CONFLICTS:
+            raise PayrollConflict(f"Payroll period {period_id} was changed concurrently")
+
+    def delete_payroll_period(self, period_id: str, expected_revision: int):
+        ref = self.db.collection(PAYROLL_PERIODS).document(period_id)
+        snapshot = ref.get()
+        if not snapshot.exists or snapshot.to_dict().get("revision", 0) != expected_revision:
+            raise PayrollConflict(f"Payroll period {period_id} was changed concurrently")
+        try:
+            ref.delete(option=self.db.write_option(last_update_time=snapshot.update_time))
+        except UPSERT_CONFLICTS:
+            raise PayrollConflict(f"Payroll period {period_id} was changed concurrently")
+
+    def save_payroll_slips(self, period_id: str, snapshot_id: str, slips: dict):
+        collection = payroll_slips_collection(self.db, period_id, snapshot_id)
+        items = list(slips.items())
+        for start in range(0, len(items), BATCH_LIMIT):
+            batch = self.db.batch()
+            for worker_id, slip in items[start:start + BATCH_LIMIT]:
+                batch.set(collection.document(worker_id), slip)
+            batch.commit()
+        # One chunk per write: a few of them would pass a commit's size limit
+        chunks = payroll_chunks_collection(self.db, period_id, snapshot_id)
+        for index, chunk in enumerate(snapshot_chunks(slips)):
+            chunks.document(f"{index:04d}").set({"slips": chunk})
+
+    def get_payroll_slips(self, period_id: str, snapshot_id: str, worker_ids: list = None):
+        collection = payroll_slips_collection(self.db, period_id, snapshot_id)
+        if worker_ids is None:
+            chunks = [doc.to_dict() for doc in payroll_chunks_collection(self.db, period_id, snapshot_id).stream()]
+            if chunks:
+                return slips_from_chunks(chunks)
+            return {doc.id: doc.to_dict() for doc in collection.stream()}
+        refs = [collection.document(worker_id) for worker_id in worker_ids]
+        return {snap.id: snap.to_dict() for snap in self.db.get_all(refs) if snap.exists}
+
+    # -------------------------------------------------
+    # REFERENCE DATA
+    # -------------------------------------------------
+    def reference_feed(self):
+        return FirestoreChangeFeed(self.db)
@@ -0,0 +1,466 @@
+import json
+import sqlite3
+import threading
+import uuid
+from ..refdata import LocalChangeFeed
+from ..ratecard import RATES
+from ..payroll import PAYROLL_PERIODS, PayrollConflict
+from .base import StorageEngine, SLIP_FIELDS, production_key
+
+# --------------------------------------------------
+# SCHEMA
+# --------------------------------------------------
+# Ids are random 20-char strings, like Firestore auto-ids, so the API
+# and the frontend see the same id shape whichever engine is configured.
+# Production rows are the exception: they are keyed by production_key().
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS workers (
+    id          TEXT PRIMARY KEY,
+    name        TEXT NOT NULL,
+    phone       TEXT,
+    is_active   INTEGER NOT NULL DEFAULT 1,
+    shed_id     TEXT
+);
+
+CREATE TABLE IF NOT EXISTS sheds (
+    id          TEXT PRIMARY KEY,
+    name        TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS looms (
+    id          TEXT PRIMARY KEY,
+    shed_id     TEXT NOT NULL REFERENCES sheds(id) ON DELETE CASCADE,
+    loom_number TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS production (
+    id           TEXT PRIMARY KEY,
+    worker_id    TEXT NOT NULL,
+    loom_id      TEXT NOT NULL,
+    shed_name    TEXT,
+    loom_number  TEXT,
+    date         TEXT NOT NULL,
+    shift        TEXT NOT NULL,
+    meters       REAL NOT NULL,
+    rate         REAL NOT NULL,
+    total_amount REAL NOT NULL,
+    quality      TEXT
+);
+
+CREATE TABLE IF NOT EXISTS rate_card (
+    id             TEXT PRIMARY KEY,
+    scope          TEXT NOT NULL,
+    key            TEXT NOT NULL,
+    effective_from TEXT NOT NULL,
+    rate           REAL NOT NULL
+);
+
+-- Frozen payroll (see app.payroll): documents are stored as JSON
+CREATE TABLE IF NOT EXISTS payroll_periods (
+    id          TEXT PRIMARY KEY,
+    revision    INTEGER NOT NULL,
+    data        TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS payroll_slips (
+    snapshot_id TEXT NOT NULL,
+    worker_id   TEXT NOT NULL,
+    slip        TEXT NOT NULL,
+    PRIMARY KEY (snapshot_id, worker_id)
+);
+
+-- Writes per production date (StorageEngine.production_versions), bumped
+-- by the triggers below in the same transaction as the write. Saving an
+-- unchanged record again (a retry, a journal replay) does not count.
+CREATE TABLE IF NOT EXISTS production_versions (
+    date        TEXT PRIMARY KEY,
+    writes      INTEGER NOT NULL
+);
+
+CREATE TRIGGER IF NOT EXISTS production_version_insert AFTER INSERT ON production
+BEGIN
+    INSERT INTO production_versions (date, writes) VALUES (NEW.date, 1)
+    ON CONFLICT(date) DO UPDATE SET writes = writes + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS production_version_update AFTER UPDATE ON production
+WHEN OLD.meters IS NOT NEW.meters OR OLD.rate IS NOT NEW.rate
+  OR OLD.total_amount IS NOT NEW.total_amount OR OLD.shed_name IS NOT NEW.shed_name
+  OR OLD.loom_number IS NOT NEW.loom_number OR OLD.quality IS NOT NEW.quality
+BEGIN
+    INSERT INTO production_versions (date, writes) VALUES (NEW.date, 1)
+    ON CONFLICT(date) DO UPDATE SET writes = writes + 1;
+END;
+
+CREATE INDEX IF NOT EXISTS idx_workers_name ON workers (name, id);
+CREATE INDEX IF NOT EXISTS idx_looms_shed ON looms (shed_id);
+CREATE INDEX IF NOT EXISTS idx_production_worker_date ON production (worker_id, date);
+CREATE INDEX IF NOT EXISTS idx_production_loom_date ON production (loom_id, date);
+CREATE INDEX IF NOT EXISTS idx_production_date ON production (date);
+"""
+
+# Columns added after the first release: (table, column, type)
+MIGRATIONS = [
+    ("workers", "shed_id", "TEXT"),
+    ("production", "quality", "TEXT"),
+]
+
+PRODUCTION_COLUMNS = [
+    "worker_id", "loom_id", "shed_name", "loom_number",
+    "date", "shift", "meters", "rate", "total_amount", "quality",
+]
+
+
+def _new_id():
+    return uuid.uuid4().hex[:20]
+
+
+class SQLiteEngine(StorageEngine):
+    """
+    Embedded SQLite storage for single-mill deployments and local runs.
+    One connection per thread (FastAPI runs sync routes in a thread pool),
+    WAL journal so readers never block the writer.
+    """
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._migrate()
+        self._conn().executescript(SCHEMA)
+
+    def _migrate(self):
+        """Adds columns missing from databases created by older versions."""
+        conn = self._conn()
+        for table, column, col_type in MIGRATIONS:
+            existing = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+            if existing and column not in existing:
+                with conn:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {col_type}")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, uri=self.path.startswith("file:"), check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def _write(self, sql: str, params=()):
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                conn.execute(sql, params)
+
+    # -------------------------------------------------
+    # WORKERS
+    # -------------------------------------------------
+    def create_worker(self, worker_data: dict):
+        worker_id = _new_id()
+        self._write(
+            "INSERT INTO workers (id, name, phone, is_active, shed_id) VALUES (?, ?, ?, ?, ?)",
+            (worker_id, worker_data["name"], worker_data.get("phone"),
+             int(worker_data.get("is_active", True)), worker_data.get("shed_id"))
+        )
+        return worker_id
+
+    @staticmethod
+    def _worker(row):
+        return {**dict(row), "is_active": bool(row["is_active"])}
+
+    def list_workers(self):
+        rows = self._conn().execute("SELECT id, name, phone, is_active, shed_id FROM workers ORDER BY id")
+        return [self._worker(row) for row in rows]
+
+    def query_workers(self, limit: int, after: list = None, is_active: bool = None,
+                      name_prefix: str = None, shed_id: str = None):
+        sql = "SELECT id, name, phone, is_active, shed_id FROM workers WHERE 1 = 1"
+        params = []
+        if is_active is not None:
+            sql += " AND is_active = ?"
+            params.append(int(is_active))
+        if shed_id is not None:
+            sql += " AND shed_id = ?"
+            params.append(shed_id)
+        if name_prefix:
+            sql += " AND name >= ? AND name < ?"
+            params += [name_prefix, name_prefix + "\uffff"]
+        if after:
+            sql += " AND (name, id) > (?, ?)"
+            params += list(after)
+        sql += " ORDER BY name, id LIMIT ?"
+        params.append(limit)
+
+        return [self._worker(row) for row in self._conn().execute(sql, params)]
+
+    # -------------------------------------------------
+    # SHEDS / LOOMS
+    # -------------------------------------------------
+    def create_shed(self, name: str):
+        shed_id = _new_id()
+        self._write("INSERT INTO sheds (id, name) VALUES (?, ?)", (shed_id, name))
+        return shed_id
+
+    def create_loom(self, shed_id: str, loom_number: str):
+        loom_id = _new_id()
+        self._write("INSERT INTO looms (id, shed_id, loom_number) VALUES (?, ?, ?)", (loom_id, shed_id, loom_number))
+        return loom_id
+
+    def load_hierarchy(self):
+        conn = self._conn()
+        hierarchy = {
+            row["id"]: {"id": row["id"], "name": row["name"], "looms": []}
+            for row in conn.execute("SELECT id, name FROM sheds ORDER BY id")
+        }
+        for row in conn.execute("SELECT id, shed_id, loom_number FROM looms ORDER BY shed_id, id"):
+            shed = hierarchy.get(row["shed_id"])
+            if shed is not None:
+                shed["looms"].append({"id": row["id"], "loom_number": row["loom_number"]})
+        return list(hierarchy.values())
+
+    # -------------------------------------------------
+    # PRODUCTION
+    # -------------------------------------------------
+    # Re-saving a (worker, loom, date, shift) replaces the stored row
+    UPSERT_PRODUCTION = (
+        f"INSERT INTO production (id, {', '.join(PRODUCTION_COLUMNS)}) "
+        f"VALUES ({', '.join('?' * (len(PRODUCTION_COLUMNS) + 1))}) "
+        f"ON CONFLICT(id) DO UPDATE SET {', '.join(f'{col} = excluded.{col}' for col in PRODUCTION_COLUMNS)}"
+    )
+
+    def _production_row(self, record: dict):
+        record_id = production_key(record)
+        return record_id, (record_id, *(record.get(col) for col in PRODUCTION_COLUMNS))
+
+    def insert_production(self, record: dict):
+        record_id, row = self._production_row(record)
+        self._write(self.UPSERT_PRODUCTION, row)
+        return record_id
+
+    def insert_production_many(self, records: list):
+        """Each record is its own savepoint, so one bad row fails alone."""
+        results = []
+        sql = self.UPSERT_PRODUCTION
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                for index, record in enumerate(records):
+                    record_id, row = self._production_row(record)
+                    try:
+                        conn.execute("SAVEPOINT row")
+                        conn.execute(sql, row)
+                        conn.execute("RELEASE row")
+                        results.append({"index": index, "id": record_id})
+                    except sqlite3.Error as e:
+                        conn.execute("ROLLBACK TO row")
+                        conn.execute("RELEASE row")
+                        results.append({"index": index, "error": f"Insert failed: {e}"})
+        return results
+
+    def get_production(self, record_ids: list):
+        if not record_ids:
+            return []
+        rows = self._conn().execute(
+            f"SELECT id, {', '.join(PRODUCTION_COLUMNS)} FROM production "
+            f"WHERE id IN ({', '.join('?' * len(record_ids))})",
+            list(record_ids)
+        ).fetchall()
+        found = {row["id"]: self._production(row) for row in rows}
+        return [found[record_id] for record_id in record_ids if record_id in found]
+
+    def stream_production(self, start: str, end: str, worker_id: str = None,
+                          shed_name: str = None, fields: list = SLIP_FIELDS):
+        unknown = set(fields) - set(PRODUCTION_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown production fields: {sorted(unknown)}")
+
+        sql = f"SELECT {', '.join(fields)} FROM production WHERE date >= ? AND date <= ?"
+        params = [start, end]
+        if worker_id is not None:
+            sql += " AND worker_id = ?"
+            params.append(worker_id)
+        if shed_name is not None:
+            sql += " AND shed_name = ?"
+            params.append(shed_name)
+        sql += " ORDER BY date"
+
+        # The cursor fetches rows lazily, so memory stays flat for any range
+        for row in self._conn().execute(sql, params):
+            yield dict(row)
+
+    def production_columns(self, start: str, end: str, fields: list, shed_name: str = None):
+        """Plain tuples transposed by zip: no per-row dict."""
+        unknown = set(fields) - set(PRODUCTION_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown production fields: {sorted(unknown)}")
+
+        sql = f"SELECT {', '.join(fields)} FROM production WHERE date >= ? AND date <= ?"
+        params = [start, end]
+        if shed_name is not None:
+            sql += " AND shed_name = ?"
+            params.append(shed_name)
+
+        cursor = self._conn().cursor()
+        cursor.row_factory = None
+        rows = cursor.execute(sql, params).fetchall()
+        values = list(zip(*rows)) if rows else [()] * len(fields)
+        return {field: list(column) for field, column in zip(fields, values)}
+
+    def production_month_stats(self, first: str = None, last: str = None):
+        sql = "SELECT substr(date, 1, 7), COUNT(*), SUM(meters), SUM(total_amount) FROM production " \
+              "WHERE date >= ? AND date <= ? GROUP BY substr(date, 1, 7)"
+        params = [f"{first or '0000-01'}-01", f"{last or '9999-12'}-31"]
+        return {
+            month: {"records": records, "meters": meters or 0.0, "amount": amount or 0.0}
+            for month, records, meters, amount in self._conn().execute(sql, params)
+        }
+
+    def production_versions(self, start: str, end: str):
+        rows = self._conn().execute(
+            "SELECT date, writes FROM production_versions WHERE date >= ? AND date <= ?", (start, end)
+        )
+        return {day: writes for day, writes in rows}
+
+    def query_production(self, limit: int, after: list = None, worker_id: str = None,
+                         loom_id: str = None, shed_name: str = None,
+                         start: str = None, end: str = None):
+        sql = f"SELECT id, {', '.join(PRODUCTION_COLUMNS)} FROM production WHERE 1 = 1"
+        params = []
+        for column, value in (("worker_id", worker_id), ("loom_id", loom_id), ("shed_name", shed_name)):
+            if value is not None:
+                sql += f" AND {column} = ?"
+                params.append(value)
+        if start is not None:
+            sql += " AND date >= ?"
+            params.append(start)
+        if end is not None:
+            sql += " AND date <= ?"
+            params.append(end)
+        if after:
+            sql += " AND (date, id) > (?, ?)"
+            params += list(after)
+        sql += " ORDER BY date, id LIMIT ?"
+        params.append(limit)
+
+        return [self._production(row) for row in self._conn().execute(sql, params)]
+
+    @staticmethod
+    def _production(row):
+        """Row as a record dict; like on Firestore, 'quality' only when set."""
+        record = dict(row)
+        if record.get("quality") is None:
+            record.pop("quality", None)
+        return record
+
+    def production_totals(self, worker_id: str, start: str, end: str):
+        """Aggregated by SQLite over the (worker_id, date) index."""
+        rows = self._conn().execute(
+            """
+            SELECT loom_id,
+                   COALESCE(shed_name, '') || COALESCE(loom_number, '') AS loom,
+                   SUM(meters) AS meters,
+                   SUM(total_amount) AS amount,
+                   COUNT(*) AS shifts
+            FROM production
+            WHERE worker_id = ? AND date >= ? AND date <= ?
+            GROUP BY loom_id
+            """,
+            (worker_id, start, end)
+        ).fetchall()
+
+        return {
+            "summary": {
+                "total_meters": float(sum(row["meters"] for row in rows)),
+                "total_salary": float(sum(row["amount"] for row in rows)),
+                "shifts": sum(row["shifts"] for row in rows)
+            },
+            "looms": [
+                {"loom_id": row["loom_id"], "loom": row["loom"], "meters": row["meters"], "amount": row["amount"]}
+                for row in rows
+            ]
+        }
+
+    # -------------------------------------------------
+    # RATE CARD
+    # -------------------------------------------------
+    def put_rate(self, rate_id: str, rate: dict):
+        self._write(
+            "INSERT OR REPLACE INTO rate_card (id, scope, key, effective_from, rate) VALUES (?, ?, ?, ?, ?)",
+            (rate_id, rate["scope"], rate["key"], rate["effective_from"], rate["rate"])
+        )
+
+    def list_rates(self):
+        rows = self._conn().execute("SELECT id, scope, key, effective_from, rate FROM rate_card ORDER BY id")
+        return [dict(row) for row in rows]
+
+    # -------------------------------------------------
+    # PAYROLL SNAPSHOTS
+    # -------------------------------------------------
+    def list_payroll_periods(self):
+        rows = self._conn().execute("SELECT id, data FROM payroll_periods ORDER BY id")
+        return [{"id": row["id"], **json.loads(row["data"])} for row in rows]
+
+    def put_payroll_period(self, period_id: str, period: dict, expected_revision: int):
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                row = conn.execute("SELECT revision FROM payroll_periods WHERE id = ?", (period_id,)).fetchone()
+                if (row["revision"] if row else 0) != expected_revision:
+                    raise PayrollConflict(f"Payroll period {period_id} was changed concurrently")
+                conn.execute(
+                    "INSERT OR REPLACE INTO payroll_periods (id, revision, data) VALUES (?, ?, ?)",
+                    (period_id, period["revision"], json.dumps(period))
+                )
+
+    def delete_payroll_period(self, period_id: str, expected_revision: int):
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                row = conn.execute("SELECT revision FROM payroll_periods WHERE id = ?", (period_id,)).fetchone()
+                if row is None or row["revision"] != expected_revision:
+                    raise PayrollConflict(f"Payroll period {period_id} was changed concurrently")
+                conn.execute("DELETE FROM payroll_periods WHERE id = ?", (period_id,))
+
+    def save_payroll_slips(self, period_id: str, snapshot_id: str, slips: dict):
+        # snapshot_id is unique across periods, so it alone keys the slips
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO payroll_slips (snapshot_id, worker_id, slip) VALUES (?, ?, ?)",
+                    [(snapshot_id, worker_id, json.dumps(slip)) for worker_id, slip in slips.items()]
+                )
+
+    def get_payroll_slips(self, period_id: str, snapshot_id: str, worker_ids: list = None):
+        sql = "SELECT worker_id, slip FROM payroll_slips WHERE snapshot_id = ?"
+        params = [snapshot_id]
+        if worker_ids is not None:
+            if not worker_ids:
+                return {}
+            sql += f" AND worker_id IN ({', '.join('?' * len(worker_ids))})"
+            params += list(worker_ids)
+        return {row["worker_id"]: json.loads(row["slip"]) for row in self._conn().execute(sql, params)}
+
+    # -------------------------------------------------
+    # REFERENCE DATA
+    # -------------------------------------------------
+    def reference_feed(self):
+        """
+        The local file has no remote writers, so the initial snapshot plus
+        CRUD's write-through keeps app.refdata, app.ratecard and app.payroll current.
+        """
+        conn = self._conn()
+        return LocalChangeFeed({
+            "workers": [("ADDED", w["id"], None, w) for w in self.list_workers()],
+            "sheds": [("ADDED", row["id"], None, {"name": row["name"]}) for row in conn.execute("SELECT id, name FROM sheds")],
+            "looms": [
+                ("ADDED", row["id"], row["shed_id"], {"loom_number": row["loom_number"]})
+                for row in conn.execute("SELECT id, shed_id, loom_number FROM looms")
+            ],
+            RATES: [("ADDED", rate["id"], None, rate) for rate in self.list_rates()],
+            PAYROLL_PERIODS: [("ADDED", p["id"], None, p) for p in self.list_payroll_periods()],
+        })
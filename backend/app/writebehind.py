@@ -0,0 +1,432 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from .archive import archive
+from .storage import get_engine
+from .metrics import (
+    WRITE_BEHIND_PENDING, WRITE_BEHIND_FLUSHED, WRITE_BEHIND_FLUSH_FAILURES, WRITE_BEHIND_DEAD_LETTERS,
+)
+from .payroll import payroll_periods
+from .resilience import StorageUnavailable, outage_errors
+from .storage.base import production_key
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, one process per journal is up to the operator
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------
+# WRITE-BEHIND PRODUCTION JOURNAL (Optional)
+# --------------------------------------------------
+# With WRITE_BEHIND=1 a production entry is acknowledged once it is
+# appended (and fsynced) to a local append-only journal. A background
+# flusher group-commits queued records to storage when WRITE_BEHIND_BATCH
+# records are waiting or the oldest has waited WRITE_BEHIND_INTERVAL_MS.
+#
+# Journal lines (JSON):
+#   {"seq": 12, "record": {...}}          a queued production record
+#   {"flushed": 12, "done": [15, 16]}     every record up to seq 12, and
+#                                         15 and 16, is settled
+# On startup the records that are not settled are queued again.
+# Replaying is safe because production writes are idempotent upserts on
+# production_key(): a record that did reach storage is written as a no-op.
+# Once everything is settled the journal is truncated.
+#
+# Until a record is flushed, salary and list routes do not see it; the
+# point lookup (lookup_production) does. Batches are taken oldest first.
+# When rows of a batch fail, each is retried alone to tell the cause:
+#   - storage is down (outage_errors, StorageUnavailable, SQLite busy):
+#     the row stays queued and is retried with backoff;
+#   - anything else means the row can never be stored (e.g. a constraint
+#     it breaks): it is settled as a dead letter, appended to
+#     <journal>.dead and listed in /production/flush-status.
+# A row dated inside a payroll period frozen after it was queued is a dead
+# letter too, without a write: paid salary must not change.
+# Rows that were stored are settled either way, so one bad row never holds
+# back the queue. A later save of a shift still always wins: it is only
+# written once the older save is settled or in the same batch.
+# Stored rows mark their closed months for the archive (ProductionArchive.touch)
+# before they are settled, never at enqueue: an archive run waits for the
+# queue to drain, so it cannot clear a mark whose row is not stored yet.
+#
+# Every process needs its own journal. Each uvicorn worker locks the first
+# free slot (<journal>, <journal>.1, ...) for its lifetime, so after a
+# restart every slot left behind is recovered by the process that claims it.
+BASE_DIR = Path(__file__).resolve().parent.parent
+WRITE_BEHIND = os.getenv("WRITE_BEHIND", "0").lower() in ("1", "true", "yes")
+WRITE_BEHIND_JOURNAL = os.getenv("WRITE_BEHIND_JOURNAL", str(BASE_DIR / "production.journal"))
+WRITE_BEHIND_BATCH = int(os.getenv("WRITE_BEHIND_BATCH", "150"))  # Fits one Firestore WriteBatch
+WRITE_BEHIND_INTERVAL_MS = float(os.getenv("WRITE_BEHIND_INTERVAL_MS", "200"))
+WRITE_BEHIND_SLOTS = int(os.getenv("WRITE_BEHIND_SLOTS", "32"))  # journals (processes) per path
+RETRY_BACKOFF_MAX = 30.0  # seconds between attempts after repeated failures
+DEAD_LETTERS_SHOWN = 20   # most recent dead letters in status()
+
+
+def _transient(error: Exception):
+    """True when a failed write may succeed later (storage was unavailable)."""
+    return isinstance(error, outage_errors() + (StorageUnavailable, sqlite3.OperationalError))
+
+
+class WriteBehindQueue:
+    """Durable FIFO of production records, drained by one flusher thread."""
+
+    def __init__(self, path: str, batch_size: int = WRITE_BEHIND_BATCH,
+                 interval_ms: float = WRITE_BEHIND_INTERVAL_MS):
+        self.base_path = Path(path)
+        self.path = self.base_path
+        self.batch_size = batch_size
+        self.interval = interval_ms / 1000
+        self._cond = threading.Condition()
+        self._pending = []      # [(seq, record, queued_at)], oldest first
+        self._by_key = {}       # production_key -> newest pending record
+        self._seq = 0
+        self._file = None
+        self._lock = None       # open lock file holding the journal slot
+        self._thread = None
+        self._stopping = False
+        self._flushing = 0      # records in the batch being committed
+        self.stats = {
+            "flushed": 0, "batches": 0, "recovered": 0,
+            "last_flush_at": None, "last_batch_ms": None,
+            "last_error": None, "consecutive_failures": 0, "dead_letters": 0,
+        }
+        self._dead = deque(maxlen=DEAD_LETTERS_SHOWN)
+
+    # ---------------- Lifecycle ----------------
+    def start(self):
+        """Claims a journal, re-queues its unsettled records, then starts the flusher."""
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._claim()
+            self._recover()
+            self._file = open(self.path, "a", encoding="utf-8")
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Flushes what it can within 'timeout'; the rest stays in the journal."""
+        with self._cond:
+            if self._thread is None:
+                return
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning("Write-behind flusher still busy after %ss; %d records left in the journal",
+                           timeout, len(self._pending))
+            return
+        with self._cond:
+            self._thread = None
+            self._file.close()
+            self._file = None
+            self._release()
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def _claim(self):
+        """Locks the first journal slot no other process holds."""
+        if fcntl is None:
+            return
+        for slot in range(WRITE_BEHIND_SLOTS):
+            path = self.base_path if slot == 0 else self.base_path.with_name(f"{self.base_path.name}.{slot}")
+            lock = open(path.with_name(path.name + ".lock"), "a")
+            try:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock.close()
+                continue
+            self.path, self._lock = path, lock
+            return
+        raise RuntimeError(
+            f"All {WRITE_BEHIND_SLOTS} write-behind journals at {self.base_path} are in use; "
+            "raise WRITE_BEHIND_SLOTS or set WRITE_BEHIND_JOURNAL per process"
+        )
+
+    def _release(self):
+        if self._lock is not None:
+            self._lock.close()  # Closing drops the lock
+            self._lock = None
+
+    def _recover(self):
+        if not self.path.exists():
+            return
+        records, flushed, done = [], 0, set()
+        with open(self.path, encoding="utf-8") as journal:
+            for line in journal:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A torn last line: the crash came before its fsync, so
+                    # the entry was never acknowledged
+                    logger.warning("Skipping unreadable journal line in %s", self.path)
+                    continue
+                if "flushed" in entry:
+                    flushed = max(flushed, entry["flushed"])
+                    done.update(entry.get("done", ()))
+                else:
+                    records.append(entry)
+
+        now = time.monotonic()
+        for entry in records:
+            if entry["seq"] > flushed and entry["seq"] not in done:
+                self._queue(entry["seq"], entry["record"], now)
+        self._seq = max([flushed] + [entry["seq"] for entry in records])
+        self.stats["recovered"] = len(self._pending)
+
+        # Rewrite the journal with only the unflushed entries, so new appends
+        # never follow a torn line
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as journal:
+            for seq, record, _ in self._pending:
+                journal.write(json.dumps({"seq": seq, "record": record}, separators=(",", ":")) + "\n")
+            journal.flush()
+            os.fsync(journal.fileno())
+        os.replace(tmp, self.path)
+        if self._pending:
+            logger.warning("Recovered %d unflushed production records from %s", len(self._pending), self.path)
+
+    # ---------------- Enqueue ----------------
+    def enqueue(self, records: list):
+        """
+        Appends records to the journal and fsyncs before returning,
+        so an acknowledged entry survives a crash. Output: their ids.
+        """
+        with self._cond:
+            if self._file is None:
+                raise RuntimeError("Write-behind queue is not running")
+            lines = []
+            for record in records:
+                self._seq += 1
+                lines.append(json.dumps({"seq": self._seq, "record": record}, separators=(",", ":")))
+            self._file.write("\n".join(lines) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+            now = time.monotonic()
+            first = self._seq - len(records) + 1
+            for seq, record in enumerate(records, first):
+                self._queue(seq, record, now)
+            # Wake the flusher to start the interval timer or flush a full batch
+            if len(self._pending) == len(records) or len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+        return [production_key(record) for record in records]
+
+    def _queue(self, seq: int, record: dict, queued_at: float):
+        self._pending.append((seq, record, queued_at))
+        self._by_key[production_key(record)] = record
+        WRITE_BEHIND_PENDING.inc()
+
+    def pending_records(self, keys: list):
+        """Queued (not yet flushed) records for these ids, with 'id'."""
+        with self._cond:
+            return {key: {"id": key, **self._by_key[key]} for key in keys if key in self._by_key}
+
+    # ---------------- Flushing ----------------
+    def _run(self):
+        retry_at = 0.0
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    if not self._pending:
+                        if self._stopping:
+                            return
+                        self._cond.wait()
+                        continue
+                    if now < retry_at:
+                        if self._stopping:
+                            return  # Storage is failing: leave the rest in the journal
+                        self._cond.wait(retry_at - now)
+                        continue
+                    due = self._pending[0][2] + self.interval
+                    if self._stopping or len(self._pending) >= self.batch_size or now >= due:
+                        break
+                    self._cond.wait(due - now)
+                batch = self._pending[:self.batch_size]
+                self._flushing = len(batch)
+
+            if not self._flush(batch):
+                failures = self.stats["consecutive_failures"]
+                retry_at = time.monotonic() + min(RETRY_BACKOFF_MAX, max(self.interval, 0.5) * 2 ** (failures - 1))
+
+    def _flush(self, batch: list):
+        """
+        Commits one batch (oldest first) and settles every row that was
+        stored or can never be. Output: False when storage was unavailable.
+        """
+        # Only the newest version of a shift needs writing
+        newest = {}
+        for seq, record, _ in batch:
+            newest[production_key(record)] = (seq, record)
+
+        started = time.perf_counter()
+        engine = get_engine()
+        try:
+            if not payroll_periods.ready:
+                payroll_periods.load(engine.list_payroll_periods())
+        except Exception as e:
+            self._failed(len(batch), e)
+            return False
+
+        # Rows acknowledged before a freeze began are still stored (the
+        # freeze waits for them); rows of a frozen period never are
+        with payroll_periods.writing((r["date"] for _, r in newest.values()), admit_freezing=True) as blocked:
+            dead = [(seq, record, blocked[record["date"]])
+                    for seq, record in newest.values() if record["date"] in blocked]
+            newest = {key: entry for key, entry in newest.items() if entry[1]["date"] not in blocked}
+            keys = list(newest)
+            try:
+                results = engine.insert_production_many([record for _, record in newest.values()]) if keys else []
+            except Exception as e:
+                self._failed(len(batch), e)
+                return False
+
+            # A row error may be an outage or a bad record: retrying the row on
+            # its own raises the real exception
+            waiting, outage = set(), None
+            for result in results:
+                if "error" not in result:
+                    continue
+                key = keys[result["index"]]
+                seq, record = newest[key]
+                try:
+                    engine.insert_production(record)
+                except Exception as e:
+                    if _transient(e):
+                        waiting.add(seq)
+                        outage = e
+                    else:
+                        dead.append((seq, record, str(e)))
+
+        unstored = waiting | {seq for seq, _, _ in dead}
+        try:
+            archive.touch(record["date"] for seq, record in newest.values() if seq not in unstored)
+        except OSError as e:
+            logger.warning("Could not mark archived months written by the flush: %s", e)
+
+        # Older saves of a shift are settled with its newest one, unless that
+        # one is still waiting
+        still = {key for key in keys if newest[key][0] in waiting}
+        settled = [entry for entry in batch if production_key(entry[1]) not in still]
+        with self._cond:
+            self._settle({seq for seq, _, _ in settled}, dead)
+            self._flushing = 0
+            self.stats["flushed"] += len(settled) - len(dead)
+            self.stats["batches"] += 1
+            self.stats["last_flush_at"] = time.time()
+            self.stats["last_batch_ms"] = round((time.perf_counter() - started) * 1000, 2)
+            if outage is None:
+                self.stats["last_error"] = None
+                self.stats["consecutive_failures"] = 0
+            self._cond.notify_all()
+        WRITE_BEHIND_PENDING.dec(len(settled))
+        WRITE_BEHIND_FLUSHED.inc(len(settled) - len(dead))
+        if outage is not None:
+            self._failed(len(waiting), outage)
+            return False
+        return True
+
+    def _failed(self, count: int, error: Exception):
+        with self._cond:
+            self._flushing = 0
+            self.stats["last_error"] = str(error)
+            self.stats["consecutive_failures"] += 1
+        WRITE_BEHIND_FLUSH_FAILURES.inc()
+        logger.warning("Write-behind flush of %d records failed (will retry): %s", count, error)
+
+    def _settle(self, seqs: set, dead: list):
+        """Drops settled records from the queue and the journal (lock held)."""
+        if dead:
+            self._dead_letter(dead)
+        for seq, record, _ in self._pending:
+            if seq in seqs:
+                key = production_key(record)
+                # A newer save of the same shift may still be waiting
+                if self._by_key.get(key) is record:
+                    del self._by_key[key]
+        self._pending = [entry for entry in self._pending if entry[0] not in seqs]
+
+        if not self._pending:
+            self._file.truncate(0)
+            self._file.seek(0)
+        else:
+            flushed = self._pending[0][0] - 1
+            mark = {"flushed": flushed}
+            later = sorted(seq for seq in seqs if seq > flushed)
+            if later:
+                mark["done"] = later
+            self._file.write(json.dumps(mark, separators=(",", ":")) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _dead_letter(self, dead: list):
+        """Keeps rows storage rejected in <journal>.dead, fsynced before they leave the journal."""
+        now = time.time()
+        with open(self.path.with_name(self.path.name + ".dead"), "a", encoding="utf-8") as letters:
+            for seq, record, error in dead:
+                entry = {"id": production_key(record), "error": error, "at": now}
+                letters.write(json.dumps({**entry, "record": record}, separators=(",", ":")) + "\n")
+                self._dead.append(entry)
+                logger.error("Write-behind dead letter %s: %s", entry["id"], error)
+            letters.flush()
+            os.fsync(letters.fileno())
+        self.stats["dead_letters"] += len(dead)
+        WRITE_BEHIND_DEAD_LETTERS.inc(len(dead))
+
+    def wait_flushed(self, timeout: float = None):
+        """Blocks until the queue is empty. Output: True if it emptied in time."""
+        with self._cond:
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: not self._pending, timeout)
+
+    def ensure_flushed(self, timeout: float):
+        """wait_flushed, raising StorageUnavailable when the queue did not empty in time."""
+        if not self.wait_flushed(timeout):
+            raise StorageUnavailable(
+                f"Write-behind queue not flushed after {timeout}s ({self.stats['last_error'] or 'still busy'})"
+            )
+
+    # ---------------- Status ----------------
+    def status(self):
+        with self._cond:
+            oldest = self._pending[0][2] if self._pending else None
+            return {
+                "enabled": True,
+                "running": self.running,
+                "pending": len(self._pending),
+                "flushing": self._flushing,
+                "oldest_pending_ms": round((time.monotonic() - oldest) * 1000, 1) if oldest else 0,
+                "batch_size": self.batch_size,
+                "interval_ms": self.interval * 1000,
+                "journal": str(self.path),
+                "dead_letter_file": str(self.path.with_name(self.path.name + ".dead")),
+                "recent_dead_letters": list(self._dead),
+                **self.stats,
+            }
+
+
+write_behind = WriteBehindQueue(WRITE_BEHIND_JOURNAL) if WRITE_BEHIND else None
+
+
+def ensure_flushed(timeout: float = 30.0):
+    """Waits until queued production is stored (no-op without write-behind); see WriteBehindQueue.ensure_flushed."""
+    if write_behind is not None:
+        write_behind.ensure_flushed(timeout)
+
+
+def status():
+    """Flush status for the API; {"enabled": False} when write-behind is off."""
+    if write_behind is None:
+        return {"enabled": False}
+    return write_behind.status()
@@ -0,0 +1,638 @@
+"""
+In-memory stand-in for the parts of google.cloud.firestore the app uses.
+
+Documents live in plain dicts keyed by collection path. Every document a
+query returns counts as one read and every set/update/delete as one write,
+the way Firestore bills them, so benchmarks can report Firestore usage.
+
+install() hands the fake clients to app.database (use_clients) before the
+storage engine is created, so no service account or network access is needed.
+"""
+import asyncio
+import threading
+import uuid
+from collections import defaultdict
+from google.api_core.exceptions import AlreadyExists, FailedPrecondition, NotFound
+from google.cloud.firestore_v1 import transforms
+
+
+# --------------------------------------------------
+# HELPERS
+# --------------------------------------------------
+def _copy(value):
+    """Cheap deep copy for JSON-like documents."""
+    if isinstance(value, dict):
+        return {k: _copy(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_copy(v) for v in value]
+    return value
+
+
+def _merge(current: dict, data: dict):
+    """Applies 'data' onto 'current' the way set(merge=True)/update do."""
+    out = _copy(current)
+    for key, value in data.items():
+        parts = key.split(".")
+        target = out
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        last = parts[-1]
+        if isinstance(value, transforms.Increment):
+            target[last] = (target.get(last) or 0) + value.value
+        elif value is transforms.DELETE_FIELD:
+            target.pop(last, None)
+        elif value is transforms.SERVER_TIMESTAMP:
+            import datetime
+            target[last] = datetime.datetime.now(datetime.timezone.utc)
+        elif isinstance(value, dict):
+            existing = target.get(last)
+            target[last] = _merge(existing if isinstance(existing, dict) else {}, value)
+        else:
+            target[last] = _copy(value)
+    return out
+
+
+def _lt(a, b):
+    """Firestore-like ordering: None sorts first."""
+    if a is None:
+        return b is not None
+    if b is None:
+        return False
+    return a < b
+
+
+class _SortKey:
+    __slots__ = ("values", "directions")
+
+    def __init__(self, values, directions):
+        self.values = values
+        self.directions = directions
+
+    def __lt__(self, other):
+        for a, b, desc in zip(self.values, other.values, self.directions):
+            if a == b:
+                continue
+            return _lt(b, a) if desc else _lt(a, b)
+        return False
+
+
+OPERATORS = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a is not None and a != b,
+    "<": lambda a, b: a is not None and a < b,
+    "<=": lambda a, b: a is not None and a <= b,
+    ">": lambda a, b: a is not None and a > b,
+    ">=": lambda a, b: a is not None and a >= b,
+    "in": lambda a, b: a in b,
+    "not-in": lambda a, b: a is not None and a not in b,
+    "array_contains": lambda a, b: isinstance(a, list) and b in a,
+}
+
+
+# --------------------------------------------------
+# SNAPSHOTS & REFERENCES
+# --------------------------------------------------
+class FakeSnapshot:
+    def __init__(self, reference, data, update_time=None):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.exists = data is not None
+        self.update_time = update_time  # A per-document write counter
+
+    def to_dict(self):
+        return _copy(self._data) if self._data is not None else None
+
+    def get(self, field):
+        value = self._data
+        for part in field.split("."):
+            value = (value or {}).get(part)
+        return value
+
+
+class FakeDocumentReference:
+    def __init__(self, client, path: str):
+        self._client = client
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    @property
+    def parent(self):
+        return FakeCollectionReference(self._client, self.path.rsplit("/", 1)[0])
+
+    def collection(self, name: str):
+        return FakeCollectionReference(self._client, f"{self.path}/{name}")
+
+    def get(self, *args, **kwargs):
+        self._client.stats.record("get", self.parent.id, docs=1)
+        with self._client._lock:
+            return FakeSnapshot(self, _copy(self._client._read(self.path)), self._client._versions.get(self.path))
+
+    def set(self, data: dict, merge: bool = False):
+        self._client.stats.record("set", self.parent.id, writes=1)
+        self._client._write(self.path, data, merge=merge)
+
+    def create(self, data: dict):
+        with self._client._lock:
+            self._check(exists=False)
+            self.set(data)
+
+    def update(self, data: dict, option=None):
+        with self._client._lock:
+            self._check(exists=True, option=option)
+            self._update(data)
+
+    def _update(self, data: dict):
+        self._client.stats.record("update", self.parent.id, writes=1)
+        self._client._write(self.path, data, merge=True)
+
+    def _check(self, exists: bool, option=None):
+        """Raises like Firestore when a write precondition does not hold."""
+        current = self._client._read(self.path)
+        if not exists and current is not None:
+            raise AlreadyExists(f"Document already exists: {self.path}")
+        if exists and current is None:
+            raise NotFound(f"No document to update: {self.path}")
+        if option is not None and option.last_update_time is not None \
+                and option.last_update_time != self._client._versions.get(self.path):
+            raise FailedPrecondition(f"Document changed since it was read: {self.path}")
+
+    def delete(self, option=None):
+        self._client.stats.record("delete", self.parent.id, writes=1)
+        with self._client._lock:
+            if option is not None:
+                self._check(exists=True, option=option)
+            self._client._delete(self.path)
+
+
+# --------------------------------------------------
+# QUERIES
+# --------------------------------------------------
+class FakeQuery:
+    def __init__(self, client, path: str, group: bool = False, filters=(), orders=(),
+                 limit=None, after=None, fields=None):
+        self._client = client
+        self._path = path
+        self._group = group
+        self._filters = list(filters)
+        self._orders = list(orders)
+        self._limit = limit
+        self._after = after
+        self._fields = fields
+
+    def _clone(self, **changes):
+        state = dict(filters=self._filters, orders=self._orders, limit=self._limit,
+                     after=self._after, fields=self._fields)
+        state.update(changes)
+        return FakeQuery(self._client, self._path, self._group, **state)
+
+    @property
+    def id(self):
+        return self._path.rsplit("/", 1)[-1]
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._clone(filters=self._filters + [(field_path, op_string, value)])
+
+    def order_by(self, field_path, direction="ASCENDING"):
+        return self._clone(orders=self._orders + [(field_path, direction == "DESCENDING")])
+
+    def limit(self, count: int):
+        return self._clone(limit=count)
+
+    def start_after(self, values):
+        return self._clone(after=values)
+
+    def select(self, field_paths):
+        return self._clone(fields=list(field_paths))
+
+    def _value(self, path, data, field):
+        if field == "__name__":
+            return path.rsplit("/", 1)[-1]
+        value = data
+        for part in field.split("."):
+            value = (value or {}).get(part) if isinstance(value, dict) else None
+        return value
+
+    def _cursor_values(self):
+        after = self._after
+        orders = self._orders or [("__name__", False)]
+        if isinstance(after, FakeSnapshot):
+            return [self._value(after.reference.path, after._data, f) for f, _ in orders]
+        if isinstance(after, dict):
+            return [after.get(f) for f, _ in orders]
+        values = list(after)
+        return [v.id if isinstance(v, FakeDocumentReference) else v for v in values]
+
+    def _matches(self):
+        client = self._client
+        if self._group:
+            collections = [p for p in client._collections if p.rsplit("/", 1)[-1] == self._path]
+        else:
+            collections = [self._path]
+
+        for collection in collections:
+            docs = client._collections.get(collection, {})
+            candidates = None
+            for field, op, value in self._filters:
+                index = client._indexes.get((collection, field))
+                if op == "==" and index is not None:
+                    candidates = index.get(value, set()) if candidates is None else candidates & index.get(value, set())
+            ids = candidates if candidates is not None else docs.keys()
+            for doc_id in list(ids):
+                data = docs.get(doc_id)
+                if data is None:
+                    continue
+                path = f"{collection}/{doc_id}"
+                if all(OPERATORS[op](self._value(path, data, f), v) for f, op, v in self._filters):
+                    yield path, data
+
+    def stream(self, *args, **kwargs):
+        orders = self._orders or [("__name__", False)]
+        directions = [desc for _, desc in orders]
+        rows = sorted(
+            self._matches(),
+            key=lambda row: _SortKey([self._value(row[0], row[1], f) for f, _ in orders], directions)
+        )
+
+        if self._after is not None:
+            cursor = _SortKey(self._cursor_values(), directions)
+            rows = [row for row in rows
+                    if cursor < _SortKey([self._value(row[0], row[1], f) for f, _ in orders], directions)]
+        if self._limit is not None:
+            rows = rows[:self._limit]
+
+        # Firestore bills at least one read per query
+        self._client.stats.record("stream", self.id, docs=max(len(rows), 1))
+        for path, data in rows:
+            if self._fields is not None:
+                data = {k: v for k, v in data.items() if k in self._fields}
+            yield FakeSnapshot(FakeDocumentReference(self._client, path), _copy(data), self._client._versions.get(path))
+
+    def get(self, *args, **kwargs):
+        return list(self.stream())
+
+    def on_snapshot(self, callback):
+        return self._client._listen(self, callback)
+
+
+class FakeCollectionReference(FakeQuery):
+    def __init__(self, client, path: str):
+        super().__init__(client, path)
+
+    @property
+    def parent(self):
+        if "/" not in self._path:
+            return None
+        return FakeDocumentReference(self._client, self._path.rsplit("/", 1)[0])
+
+    def document(self, document_id: str = None):
+        return FakeDocumentReference(self._client, f"{self._path}/{document_id or uuid.uuid4().hex[:20]}")
+
+    def add(self, data: dict):
+        ref = self.document()
+        ref.set(data)
+        return None, ref
+
+
+# --------------------------------------------------
+# BATCHES & LISTENERS
+# --------------------------------------------------
+class _WriteOption:
+    def __init__(self, last_update_time=None, exists=None):
+        self.last_update_time = last_update_time
+        self.exists = exists
+
+
+class FakeWriteBatch:
+    """Atomic like Firestore: every precondition is checked before any write."""
+
+    def __init__(self, client):
+        self._client = client
+        self._ops = []  # (precondition check or None, write)
+
+    def set(self, reference, data, merge=False):
+        self._ops.append((None, lambda: reference.set(data, merge=merge)))
+
+    def create(self, reference, data):
+        self._ops.append((lambda: reference._check(exists=False), lambda: reference.set(data)))
+
+    def update(self, reference, data, option=None):
+        self._ops.append((lambda: reference._check(exists=True, option=option), lambda: reference._update(data)))
+
+    def delete(self, reference, option=None):
+        check = (lambda: reference._check(exists=True, option=option)) if option is not None else None
+        self._ops.append((check, reference.delete))
+
+    def commit(self):
+        if len(self._ops) > 500:
+            raise ValueError("A WriteBatch can hold at most 500 writes")
+        self._client.stats.record("commit", "batch")
+        with self._client._lock:
+            try:
+                for check, _ in self._ops:
+                    if check is not None:
+                        check()
+                for _, write in self._ops:
+                    write()
+            finally:
+                self._ops = []
+        return []
+
+    def __len__(self):
+        return len(self._ops)
+
+
+class _ChangeType:
+    def __init__(self, name):
+        self.name = name
+
+
+class _Change:
+    def __init__(self, kind, document):
+        self.type = _ChangeType(kind)
+        self.document = document
+
+
+class _Watch:
+    def __init__(self, client, entry):
+        self._client = client
+        self._entry = entry
+
+    def unsubscribe(self):
+        with self._client._lock:
+            if self._entry in self._client._listeners:
+                self._client._listeners.remove(self._entry)
+
+
+# --------------------------------------------------
+# CLIENT
+# --------------------------------------------------
+class FirestoreStats:
+    """Firestore operation counters, keyed by (operation, collection)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.calls = defaultdict(int)
+            self.reads = 0
+            self.writes = 0
+
+    def record(self, op: str, collection: str, docs: int = 0, writes: int = 0):
+        with self._lock:
+            self.calls[(op, collection)] += 1
+            self.reads += docs
+            self.writes += writes
+
+    def snapshot(self):
+        with self._lock:
+            return {"reads": self.reads, "writes": self.writes}
+
+
+class FakeFirestore:
+    """
+    Sync client. 'indexed_fields' get an equality index per collection so
+    '==' queries on large collections stay fast, like Firestore's indexes.
+    """
+
+    def __init__(self, indexed_fields=("worker_id", "loom_id", "shed_name")):
+        self._collections = defaultdict(dict)   # collection path -> {doc_id: data}
+        self._indexed_fields = set(indexed_fields)
+        self._indexes = {}                      # (collection path, field) -> {value: {doc_id}}
+        self._listeners = []
+        self._versions = {}                     # document path -> update counter
+        self._version_clock = 0
+        self._lock = threading.RLock()
+        self.stats = FirestoreStats()
+
+    # ---------------- API ----------------
+    def collection(self, path: str):
+        return FakeCollectionReference(self, path)
+
+    def collection_group(self, collection_id: str):
+        return FakeQuery(self, collection_id, group=True)
+
+    def document(self, path: str):
+        return FakeDocumentReference(self, path)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    @staticmethod
+    def write_option(**kwargs):
+        return _WriteOption(**kwargs)
+
+    def get_all(self, references, field_paths=None, **kwargs):
+        for ref in references:
+            yield ref.get()
+
+    def close(self):
+        pass
+
+    # ---------------- Storage ----------------
+    def load(self, collection: str, doc_id: str, data: dict):
+        """Seeds a document without counting it as a write."""
+        self._store(collection, doc_id, data)
+
+    def _split(self, path: str):
+        collection, doc_id = path.rsplit("/", 1)
+        return collection, doc_id
+
+    def _read(self, path: str):
+        collection, doc_id = self._split(path)
+        return self._collections.get(collection, {}).get(doc_id)
+
+    def _store(self, collection: str, doc_id: str, data):
+        docs = self._collections[collection]
+        old = docs.get(doc_id)
+        for field in self._indexed_fields:
+            index = self._indexes.setdefault((collection, field), defaultdict(set))
+            if old is not None and field in old:
+                index[old[field]].discard(doc_id)
+            if data is not None and field in data:
+                index[data[field]].add(doc_id)
+        path = f"{collection}/{doc_id}"
+        if data is None:
+            docs.pop(doc_id, None)
+            self._versions.pop(path, None)
+        else:
+            docs[doc_id] = data
+            self._version_clock += 1
+            self._versions[path] = self._version_clock
+        return old
+
+    def _write(self, path: str, data: dict, merge: bool):
+        with self._lock:
+            collection, doc_id = self._split(path)
+            current = self._read(path) if merge else None
+            new = _merge(current or {}, data)
+            old = self._store(collection, doc_id, new)
+            self._notify(path, "ADDED" if old is None else "MODIFIED", new)
+
+    def _delete(self, path: str):
+        with self._lock:
+            collection, doc_id = self._split(path)
+            if self._store(collection, doc_id, None) is not None:
+                self._notify(path, "REMOVED", None)
+
+    # ---------------- Listeners ----------------
+    def _listen(self, query, callback):
+        with self._lock:
+            entry = (query, callback)
+            self._listeners.append(entry)
+            initial = [_Change("ADDED", snap) for snap in FakeQuery.stream(query)]
+        callback([c.document for c in initial], initial, None)
+        return _Watch(self, entry)
+
+    def _notify(self, path: str, kind: str, data):
+        collection, _ = self._split(path)
+        for query, callback in list(self._listeners):
+            in_scope = collection.rsplit("/", 1)[-1] == query._path if query._group else collection == query._path
+            if in_scope:
+                snap = FakeSnapshot(FakeDocumentReference(self, path), _copy(data))
+                callback([snap], [_Change(kind, snap)], None)
+
+
+# --------------------------------------------------
+# ASYNC FACADE (firestore.AsyncClient look-alike)
+# --------------------------------------------------
+class _AsyncQuery:
+    _CHAINABLE = ("where", "order_by", "limit", "start_after", "select")
+
+    def __init__(self, query):
+        self._query = query
+
+    def __getattr__(self, name):
+        attr = getattr(self._query, name)
+        if name in self._CHAINABLE:
+            return lambda *args, **kwargs: _AsyncQuery(attr(*args, **kwargs))
+        return attr
+
+    async def stream(self, *args, **kwargs):
+        for snap in list(self._query.stream()):
+            yield snap
+        await asyncio.sleep(0)
+
+    async def get(self, *args, **kwargs):
+        return list(self._query.stream())
+
+
+class _AsyncCollection(_AsyncQuery):
+    def document(self, document_id: str = None):
+        return _AsyncDocument(self._query.document(document_id))
+
+
+class _AsyncDocument:
+    def __init__(self, ref):
+        self._ref = ref
+        self.id = ref.id
+        self.path = ref.path
+
+    @property
+    def parent(self):
+        return _AsyncCollection(self._ref.parent)
+
+    def collection(self, name: str):
+        return _AsyncCollection(self._ref.collection(name))
+
+    async def get(self, *args, **kwargs):
+        return self._ref.get()
+
+    async def set(self, data, merge=False):
+        self._ref.set(data, merge=merge)
+
+    async def create(self, data):
+        self._ref.create(data)
+
+    async def update(self, data, option=None):
+        self._ref.update(data, option=option)
+
+    async def delete(self):
+        self._ref.delete()
+
+
+def _unwrap(ref):
+    return ref._ref if isinstance(ref, _AsyncDocument) else ref
+
+
+class _AsyncBatch:
+    def __init__(self, batch):
+        self._batch = batch
+
+    def set(self, reference, data, merge=False):
+        self._batch.set(_unwrap(reference), data, merge=merge)
+
+    def create(self, reference, data):
+        self._batch.create(_unwrap(reference), data)
+
+    def update(self, reference, data, option=None):
+        self._batch.update(_unwrap(reference), data, option=option)
+
+    def delete(self, reference, option=None):
+        self._batch.delete(_unwrap(reference), option=option)
+
+    async def commit(self):
+        return self._batch.commit()
+
+
+class AsyncFakeFirestore:
+    """Async view over a FakeFirestore, sharing its documents and stats."""
+
+    def __init__(self, client: FakeFirestore):
+        self._client = client
+        self.stats = client.stats
+
+    def collection(self, path: str):
+        return _AsyncCollection(self._client.collection(path))
+
+    def collection_group(self, collection_id: str):
+        return _AsyncQuery(self._client.collection_group(collection_id))
+
+    def document(self, path: str):
+        return _AsyncDocument(self._client.document(path))
+
+    def batch(self):
+        return _AsyncBatch(self._client.batch())
+
+    write_option = staticmethod(FakeFirestore.write_option)
+
+    async def get_all(self, references, field_paths=None, **kwargs):
+        for ref in references:
+            yield _unwrap(ref).get()
+
+    def close(self):
+        pass
+
+
+# --------------------------------------------------
+# INSTALL
+# --------------------------------------------------
+def install(client: FakeFirestore = None):
+    """
+    Makes app.database serve the fake clients.
+    Must run before the storage engine is created. Returns the sync fake.
+    """
+    import firebase_admin
+    from app import database
+
+    client = client or FakeFirestore()
+    async_client = AsyncFakeFirestore(client)
+
+    # Wrapped like the real clients, so the /metrics accounting and the
+    # resilience layer are exercised
+    from app.metrics import instrument_client
+    from app.resilience import protect_client
+    database.use_clients(
+        protect_client(instrument_client(client)),
+        protect_client(instrument_client(async_client), is_async=True),
+    )
+
+    # A credential-less app is enough: benchmarks replace token verification
+    if not firebase_admin._apps:
+        firebase_admin.initialize_app(options={"projectId": "benchmark"})
+
+    return client
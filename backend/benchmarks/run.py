@@ -0,0 +1,460 @@
+"""
+Benchmark suite for the ASM Loom API.
+
+Runs every route of app.main through the ASGI app against an in-memory
+Firestore stand-in seeded with a synthetic mill, then reports p50/p95/p99
+latency, throughput and Firestore reads/writes per request.
+
+Usage (from backend/):
+    python -m benchmarks.run                     # full mill, compare with baseline.json
+    python -m benchmarks.run --days 90           # smaller dataset (at least MIN_DAYS)
+    python -m benchmarks.run --only salary       # scenarios whose name contains 'salary'
+    python -m benchmarks.run --update-baseline   # record the current results
+    python -m benchmarks.run --write-behind      # production entry through the journal
+
+Exits with status 1 when a scenario regresses against the stored baseline:
+more Firestore reads/writes per request, or a p95 slower than the baseline
+by more than --tolerance. Latency is only gated for scenarios with at least
+GATED_SAMPLES requests; for the others it is reported, not compared.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+os.environ["STORAGE_ENGINE"] = "firestore"
+
+from . import fake_firestore
+from .seed import FIRST_NAMES, START, seed_mill
+
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+WARMUP = 2           # unmeasured GETs before each read scenario (caches, code paths)
+GATED_SAMPLES = 20   # fewer requests than this: a p95 is one unlucky request
+
+TOKENS = {
+    "bench-admin": {"uid": "admin", "email": "admin@bench.local", "admin": True},
+    "bench-user": {"uid": "user", "email": "user@bench.local"},
+}
+
+
+# --------------------------------------------------
+# SCENARIOS
+# --------------------------------------------------
+# One-day payroll periods of the first month that are frozen / reopened once
+# each. Nothing writes production there: a write would make the runs stale
+# and is refused while a period is frozen.
+FREEZE_DAYS = range(1, 6)
+REOPEN_DAYS = range(6, 11)
+
+# The first month (the periods above, archived reads), the frozen month
+# (the one before the last) and the last month, which production_* and
+# rates_create write to, must be three different months: the mill has to
+# reach the first day of its third month.
+_third_month = START.month + 1  # zero-based month two months on
+MIN_DAYS = (date(START.year + _third_month // 12, _third_month % 12 + 1, 1) - START).days + 1
+
+
+def one_day(mill: dict, day: int):
+    """That day of the mill's first month, as YYYY-MM-DD."""
+    return f"{mill['start'][:8]}{day:02d}"
+
+
+def build_scenarios(mill: dict):
+    """
+    One or more scenarios per route: (name, method, route path, request builder, repeat).
+    A builder takes a Random and returns (url, request kwargs).
+    """
+    workers, looms, sheds = mill["worker_ids"], mill["loom_ids"], mill["shed_ids"]
+    month_start = mill["end"][:8] + "01"
+    month = {"start_date": month_start, "end_date": mill["end"]}
+    year = {"start_date": mill["start"], "end_date": mill["end"]}
+    # A closed month nothing writes to (production_* scenarios write mill["end"])
+    next_month = (date.fromisoformat(mill["start"]).replace(day=28) + timedelta(days=4)).replace(day=1)
+    first_month = {"start_date": mill["start"], "end_date": str(next_month - timedelta(days=1))}
+
+    def production_row(rng, day=None):
+        return {
+            "worker_id": rng.choice(workers),
+            "loom_id": rng.choice(looms),
+            "date": day or mill["end"],
+            "shift": rng.choice(["Day", "Night"]),
+            "meters": round(rng.uniform(20, 60), 1),
+        }
+
+    retry_row = {"worker_id": workers[0], "loom_id": looms[-1], "date": mill["end"], "shift": "Day"}
+
+    def day_period(day: int):
+        """A one-day payroll period in the first month (see prepare_fixtures)."""
+        return {"start_date": one_day(mill, day), "end_date": one_day(mill, day)}
+
+    freeze_runs = iter(range(len(FREEZE_DAYS)))
+    reopen_days = iter(REOPEN_DAYS)
+
+    def seeded_lookup(rng):
+        """A (worker, loom, date) that has a seeded record (see seed_mill)."""
+        w = rng.randrange(len(workers))
+        return {"worker_id": workers[w], "loom_id": looms[(2 * w) % len(looms)], "date": mill["end"]}
+
+    return [
+        ("health", "GET", "/health", lambda rng: ("/health", {}), 200),
+        ("ready", "GET", "/ready", lambda rng: ("/ready", {}), 200),
+        ("metrics", "GET", "/metrics", lambda rng: ("/metrics", {}), 50),
+        ("auth_me", "GET", "/api/v1/auth/me", lambda rng: ("/api/v1/auth/me", {}), 200),
+        ("auth_token_cache", "GET", "/api/v1/auth/token-cache",
+         lambda rng: ("/api/v1/auth/token-cache", {}), 200),
+
+        ("workers_list", "GET", "/api/v1/workers/", lambda rng: ("/api/v1/workers/", {}), 100),
+        # Revalidation of an unchanged list: 304 without a body
+        ("workers_list_304", "GET", "/api/v1/workers/",
+         lambda rng: ("/api/v1/workers/", {"headers": {"If-None-Match": "*"}}), 100),
+        ("workers_page_active", "GET", "/api/v1/workers/",
+         lambda rng: ("/api/v1/workers/", {"params": {"limit": 50, "is_active": True}}), 100),
+        ("workers_create", "POST", "/api/v1/workers/",
+         lambda rng: ("/api/v1/workers/", {"json": {"name": f"Bench {rng.randrange(10 ** 6)}"}}), 50),
+        # Typeahead: what has been typed so far of a name (1-6 letters) / a misspelling
+        ("workers_search_prefix", "GET", "/api/v1/workers/search",
+         lambda rng: ("/api/v1/workers/search", {"params": {"q": rng.choice(FIRST_NAMES)[:rng.randint(1, 6)]}}), 200),
+        ("workers_search_fuzzy", "GET", "/api/v1/workers/search",
+         lambda rng: ("/api/v1/workers/search", {"params": {"q": _misspell(rng, rng.choice(FIRST_NAMES))}}), 200),
+
+        ("hierarchy", "GET", "/api/v1/sheds-looms/", lambda rng: ("/api/v1/sheds-looms/", {}), 100),
+        ("hierarchy_304", "GET", "/api/v1/sheds-looms/",
+         lambda rng: ("/api/v1/sheds-looms/", {"headers": {"If-None-Match": "*"}}), 100),
+        ("shed_create", "POST", "/api/v1/sheds/",
+         lambda rng: ("/api/v1/sheds/", {"params": {"name": f"z{rng.randrange(10 ** 6)}"}}), 20),
+        ("loom_create", "POST", "/api/v1/looms/",
+         lambda rng: ("/api/v1/looms/", {"params": {"shed_id": rng.choice(sheds), "loom_num": str(rng.randrange(900, 999))}}), 20),
+
+        ("production_create", "POST", "/api/v1/production/",
+         lambda rng: ("/api/v1/production/", {"json": production_row(rng)}), 100),
+        # The same shift saved again (a client retry): an idempotent no-op
+        ("production_retry", "POST", "/api/v1/production/",
+         lambda rng: ("/api/v1/production/", {"json": {**retry_row, "meters": 42.0}}), 50),
+        ("production_bulk_200", "POST", "/api/v1/production/bulk",
+         lambda rng: ("/api/v1/production/bulk", {"json": [production_row(rng) for _ in range(200)]}), 5),
+        ("production_flush_status", "GET", "/api/v1/production/flush-status",
+         lambda rng: ("/api/v1/production/flush-status", {}), 100),
+        ("production_page", "GET", "/api/v1/production/",
+         lambda rng: ("/api/v1/production/", {"params": {"worker_id": rng.choice(workers), "limit": 50, **month}}), 50),
+
+        ("production_lookup", "GET", "/api/v1/production_records/",
+         lambda rng: ("/api/v1/production_records/", {"params": seeded_lookup(rng)}), 200),
+
+        ("salary_month", "GET", "/api/v1/salary/calculate",
+         lambda rng: ("/api/v1/salary/calculate", {"params": {"worker_id": rng.choice(workers), **month}}), 50),
+        ("salary_month_grid", "GET", "/api/v1/salary/calculate",
+         lambda rng: ("/api/v1/salary/calculate", {"params": {"worker_id": rng.choice(workers), "format": "grid", **month}}), 50),
+        ("salary_totals_year", "GET", "/api/v1/salary/totals",
+         lambda rng: ("/api/v1/salary/totals", {"params": {"worker_id": rng.choice(workers), **year}}), 50),
+        ("payroll_month", "GET", "/api/v1/salary/payroll",
+         lambda rng: ("/api/v1/salary/payroll", {"params": month}), 3),
+        # The month before is frozen by prepare_fixtures: served from its snapshot
+        ("salary_frozen_month", "GET", "/api/v1/salary/calculate",
+         lambda rng: ("/api/v1/salary/calculate", {"params": {"worker_id": rng.choice(workers), **mill["frozen_month"]}}), 50),
+        ("payroll_frozen_month", "GET", "/api/v1/salary/payroll",
+         lambda rng: ("/api/v1/salary/payroll", {"params": mill["frozen_month"]}), 3),
+        ("rollups_rebuild_month", "POST", "/api/v1/salary/rollups/rebuild",
+         lambda rng: ("/api/v1/salary/rollups/rebuild", {"params": month}), 2),
+
+        ("rates_list", "GET", "/api/v1/rates/", lambda rng: ("/api/v1/rates/", {}), 100),
+        ("rates_resolve", "GET", "/api/v1/rates/resolve",
+         lambda rng: ("/api/v1/rates/resolve", {"params": {"loom_id": rng.choice(looms), "date": mill["end"]}}), 200),
+        ("rates_create", "POST", "/api/v1/rates/",
+         lambda rng: ("/api/v1/rates/", {"json": {"scope": "loom", "key": rng.choice(looms),
+                                                  "effective_from": mill["end"], "rate": 3.5}}), 20),
+
+        ("export_production_shed_month", "GET", "/api/v1/export/production",
+         lambda rng: ("/api/v1/export/production", {"params": {"shed_name": mill["shed_names"][0], **month}}), 5),
+        ("export_salary_month", "GET", "/api/v1/export/salary",
+         lambda rng: ("/api/v1/export/salary", {"params": month}), 3),
+
+        ("payroll_run_month", "POST", "/api/v1/payroll/runs",
+         lambda rng: ("/api/v1/payroll/runs", {"params": month}), 3),
+        ("payroll_run_status", "GET", "/api/v1/payroll/runs/{run_id}",
+         lambda rng: (f"/api/v1/payroll/runs/{mill['payroll_runs'][-1]}", {}), 100),
+        # Each request freezes / reopens a different one-day period
+        ("payroll_run_freeze", "POST", "/api/v1/payroll/runs/{run_id}/freeze",
+         lambda rng: (f"/api/v1/payroll/runs/{mill['payroll_runs'][next(freeze_runs)]}/freeze", {}), len(FREEZE_DAYS)),
+        ("payroll_periods", "GET", "/api/v1/payroll/periods", lambda rng: ("/api/v1/payroll/periods", {}), 100),
+        ("payroll_period_reopen", "POST", "/api/v1/payroll/periods/reopen",
+         lambda rng: ("/api/v1/payroll/periods/reopen", {"params": day_period(next(reopen_days))}), len(REOPEN_DAYS)),
+
+        ("analytics_looms_year", "GET", "/api/v1/analytics/looms",
+         lambda rng: ("/api/v1/analytics/looms", {"params": year}), 3),
+        ("analytics_sheds_year", "GET", "/api/v1/analytics/sheds",
+         lambda rng: ("/api/v1/analytics/sheds", {"params": {"window": 7, **year}}), 3),
+
+        # Last: once archive_run_first has run, closed months are read from Parquet
+        ("archive_run_first", "POST", "/api/v1/archive/run", lambda rng: ("/api/v1/archive/run", {}), 1),
+        ("archive_run_unchanged", "POST", "/api/v1/archive/run", lambda rng: ("/api/v1/archive/run", {}), 3),
+        ("archive_status", "GET", "/api/v1/archive", lambda rng: ("/api/v1/archive", {}), 100),
+        ("salary_month_archived", "GET", "/api/v1/salary/calculate",
+         lambda rng: ("/api/v1/salary/calculate", {"params": {"worker_id": rng.choice(workers), **first_month}}), 50),
+        ("payroll_month_archived", "GET", "/api/v1/salary/payroll",
+         lambda rng: ("/api/v1/salary/payroll", {"params": first_month}), 3),
+        ("export_production_shed_month_archived", "GET", "/api/v1/export/production",
+         lambda rng: ("/api/v1/export/production", {"params": {"shed_name": mill["shed_names"][0], **first_month}}), 5),
+        ("analytics_looms_year_archived", "GET", "/api/v1/analytics/looms",
+         lambda rng: ("/api/v1/analytics/looms", {"params": year}), 3),
+
+        # Slip jobs return at once; status/download use the job prepare_fixtures finished
+        ("slips_job_shed_month", "POST", "/api/v1/export/slips",
+         lambda rng: ("/api/v1/export/slips", {"params": {"shed_name": mill["shed_names"][0], **month}}), 3),
+        ("slips_job_status", "GET", "/api/v1/export/slips/{job_id}",
+         lambda rng: (f"/api/v1/export/slips/{mill['slip_job_id']}", {}), 100),
+        ("slips_download_shed_month", "GET", "/api/v1/export/slips/{job_id}/download",
+         lambda rng: (f"/api/v1/export/slips/{mill['slip_job_id']}/download", {}), 5),
+    ]
+
+
+def _misspell(rng, name: str):
+    """Name with one letter dropped (what a hurried typist sends)."""
+    i = rng.randrange(1, len(name))
+    return name[:i] + name[i + 1:]
+
+
+async def _finished_payroll_run(start: str, end: str):
+    from anyio import to_thread
+    from app.payroll_runs import payroll_runs
+
+    run = payroll_runs.submit(start, end)
+    while run["status"] not in ("done", "failed"):
+        await to_thread.run_sync(time.sleep, 0.02)
+        run = payroll_runs.get(run["id"])
+    if run["status"] == "failed":
+        raise SystemExit(f"Payroll run fixture failed: {run['error']}")
+    return run["id"]
+
+
+async def prepare_fixtures(mill: dict):
+    """Objects scenarios refer to by id, created once the server is warm."""
+    from anyio import to_thread
+    from app.slips import slip_jobs
+    from app.payroll_runs import payroll_runs
+
+    month_start = mill["end"][:8] + "01"
+
+    # Frozen: the month before the last one, and the days reopen will unfreeze
+    previous_end = date.fromisoformat(month_start) - timedelta(days=1)
+    mill["frozen_month"] = {"start_date": str(previous_end.replace(day=1)), "end_date": str(previous_end)}
+    frozen = [(mill["frozen_month"]["start_date"], mill["frozen_month"]["end_date"])]
+    frozen += [(one_day(mill, day),) * 2 for day in REOPEN_DAYS]
+    for start, end in frozen:
+        run_id = await _finished_payroll_run(start, end)
+        await to_thread.run_sync(payroll_runs.freeze, run_id)
+    # Computed, not yet frozen: one per payroll_run_freeze request
+    mill["payroll_runs"] = [
+        await _finished_payroll_run(one_day(mill, day), one_day(mill, day))
+        for day in FREEZE_DAYS
+    ]
+    job = slip_jobs.submit(month_start, mill["end"], "pdf", shed_name=mill["shed_names"][0])
+    started = time.perf_counter()
+    while job["status"] not in ("done", "failed"):
+        await to_thread.run_sync(time.sleep, 0.05)
+        job = slip_jobs.get(job["id"])
+    if job["status"] == "failed":
+        raise SystemExit(f"Slip job fixture failed: {job['error']}")
+    print(f"Rendered {job['total']} slips in {time.perf_counter() - started:.1f}s")
+    mill["slip_job_id"] = job["id"]
+
+
+def check_coverage(app, scenarios):
+    """Every API route must have at least one scenario."""
+    from fastapi.routing import APIRoute
+    from app.metrics import flat_routes
+
+    covered = {(method, path) for _, method, path, _, _ in scenarios}
+    missing = [
+        f"{method} {route.path}"
+        for route in flat_routes(app.routes)
+        if isinstance(getattr(route, "original_route", route), APIRoute)
+        for method in route.methods
+        if (method, route.path) not in covered
+    ]
+    if missing:
+        raise SystemExit("No benchmark scenario for: " + ", ".join(sorted(missing)))
+
+
+# --------------------------------------------------
+# MEASUREMENT
+# --------------------------------------------------
+def percentile(samples: list, p: float):
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(p * len(ordered)) - 1)]
+
+
+async def run_scenario(client, fake, method: str, builder, repeat: int, concurrency: int, seed: int):
+    rng = random.Random(seed)
+    requests = [builder(rng) for _ in range(repeat)]
+    headers = {"Authorization": "Bearer bench-admin"}
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(url, kwargs, measured=True):
+        async with semaphore:
+            started = time.perf_counter()
+            kwargs = {**kwargs, "headers": {**headers, **kwargs.get("headers", {})}}
+            response = await client.request(method, url, **kwargs)
+            if measured:
+                latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                raise RuntimeError(f"{method} {url} -> {response.status_code}: {response.text[:200]}")
+
+    # Only reads are repeated: a write would change what is measured
+    if method == "GET":
+        for url, kwargs in requests[:WARMUP]:
+            await one(url, kwargs, measured=False)
+    fake.stats.reset()
+    started = time.perf_counter()
+    await asyncio.gather(*(one(url, kwargs) for url, kwargs in requests))
+    elapsed = time.perf_counter() - started
+    usage = fake.stats.snapshot()
+
+    return {
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "rps": round(repeat / elapsed, 1),
+        "samples": repeat,
+        "reads_per_req": round(usage["reads"] / repeat, 2),
+        "writes_per_req": round(usage["writes"] / repeat, 2),
+    }
+
+
+async def run_all(app, fake, scenarios, concurrency: int, prepare=None):
+    import httpx
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    from anyio import to_thread
+    from app.startup import startup
+    from app.payroll_runs import payroll_runs
+
+    async with app.router.lifespan_context(app):
+        # Measure a warm server: reference data loaded, channels open
+        await startup.wait_ready(30)
+        if prepare is not None:
+            await prepare()
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for index, (name, method, _, builder, repeat) in enumerate(scenarios):
+                results[name] = await run_scenario(client, fake, method, builder, repeat, concurrency, seed=index)
+                print(_format_row(name, results[name]), flush=True)
+                # Runs a scenario queued must not bill their reads to the next one
+                while payroll_runs.busy():
+                    await to_thread.run_sync(time.sleep, 0.02)
+    return results
+
+
+# --------------------------------------------------
+# BASELINE
+# --------------------------------------------------
+def compare(results: dict, baseline: dict, tolerance: float, slack_ms: float):
+    """Output: List of regression messages (empty when everything is within bounds)."""
+    problems = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for key in ("reads_per_req", "writes_per_req"):
+            if current[key] > base[key] * 1.01 + 0.5:
+                problems.append(f"{name}: {key} {base[key]} -> {current[key]}")
+        if current["samples"] < GATED_SAMPLES:
+            continue
+        # Absolute slack keeps millisecond-scale routes from flapping on noise
+        limit = base["p95_ms"] * (1 + tolerance) + slack_ms
+        if current["p95_ms"] > limit:
+            problems.append(f"{name}: p95 {base['p95_ms']}ms -> {current['p95_ms']}ms (limit {limit:.1f}ms)")
+    return problems
+
+
+def _format_row(name: str, r: dict):
+    return (f"{name:<30} p50 {r['p50_ms']:>9.2f}ms  p95 {r['p95_ms']:>9.2f}ms  p99 {r['p99_ms']:>9.2f}ms  "
+            f"{r['rps']:>8.1f} req/s  reads {r['reads_per_req']:>9.2f}  writes {r['writes_per_req']:>7.2f}")
+
+
+# --------------------------------------------------
+# MAIN
+# --------------------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sheds", type=int, default=30)
+    parser.add_argument("--looms", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=300)
+    parser.add_argument("--days", type=int, default=365, help=f"Days of production (at least {MIN_DAYS})")
+    parser.add_argument("--concurrency", type=int, default=1, help="In-flight requests per scenario")
+    parser.add_argument("--only", help="Run only scenarios whose name contains this text")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Allowed p95 slowdown (0.5 = +50%%)")
+    parser.add_argument("--slack-ms", type=float, default=3.0, help="Absolute p95 slack on top of --tolerance")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--write-behind", action="store_true", help="Enable WRITE_BEHIND with a temporary journal")
+    args = parser.parse_args(argv)
+    if args.days < MIN_DAYS:
+        parser.error(f"--days must be at least {MIN_DAYS}, so the frozen and archived months are not written to")
+
+    if args.write_behind:
+        os.environ["WRITE_BEHIND"] = "1"
+        os.environ["WRITE_BEHIND_JOURNAL"] = os.path.join(tempfile.mkdtemp(prefix="asm-bench-"), "production.journal")
+    # An empty archive: scenarios read storage until archive_run_first
+    os.environ["ARCHIVE_DIR"] = tempfile.mkdtemp(prefix="asm-archive-")
+
+    fake = fake_firestore.install()
+    started = time.perf_counter()
+    mill = seed_mill(fake, sheds=args.sheds, looms=args.looms, workers=args.workers, days=args.days)
+
+    from firebase_admin import auth as firebase_auth
+    from app import rollups
+    from app.main import app
+
+    def verify_id_token(token, *args, **kwargs):
+        if token not in TOKENS:
+            raise ValueError("Unknown benchmark token")
+        return {**TOKENS[token], "exp": time.time() + 3600}
+
+    firebase_auth.verify_id_token = verify_id_token
+
+    rollups.rebuild_rollups(mill["start"], mill["end"])
+    print(f"Seeded {mill['records']} production records in {time.perf_counter() - started:.1f}s")
+
+    scenarios = build_scenarios(mill)
+    check_coverage(app, scenarios)
+    if args.only:
+        scenarios = [s for s in scenarios if args.only in s[0]]
+
+    results = asyncio.run(run_all(app, fake, scenarios, args.concurrency, prepare=lambda: prepare_fixtures(mill)))
+
+    config = {"sheds": args.sheds, "looms": args.looms, "workers": args.workers,
+              "days": args.days, "concurrency": args.concurrency, "write_behind": args.write_behind}
+
+    if args.update_baseline:
+        stored = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+        scenarios_out = stored.get("scenarios", {}) if stored.get("config") == config else {}
+        scenarios_out.update(results)
+        args.baseline.write_text(json.dumps({"config": config, "scenarios": scenarios_out}, indent=2) + "\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        print("No baseline found; run with --update-baseline to record one.")
+        return 0
+
+    baseline = json.loads(args.baseline.read_text())
+    if baseline.get("config") != config:
+        print(f"Baseline was recorded with {baseline.get('config')}; not comparing.")
+        return 0
+
+    problems = compare(results, baseline["scenarios"], args.tolerance, args.slack_ms)
+    for problem in problems:
+        print("REGRESSION", problem)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
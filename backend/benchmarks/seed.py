@@ -0,0 +1,103 @@
+"""
+Deterministic synthetic mill for benchmarks.
+
+Default scale: 30 sheds, 500 looms, 300 workers and a year of Day/Night
+shifts. Every worker runs two looms on one shift a day (the shift flips
+weekly), which gives ~60 production records per worker per month.
+"""
+import random
+from datetime import date, timedelta
+from app.storage.base import production_key
+
+FIRST_NAMES = [
+    "Murugan", "Selvi", "Karthik", "Lakshmi", "Ravi", "Meena", "Arun", "Kavitha",
+    "Senthil", "Revathi", "Prakash", "Anitha", "Saravanan", "Priya", "Ganesh", "Devi",
+    "Kumar", "Vijaya", "Raja", "Malar",
+]
+INITIALS = "ABCDEGKMNPRSTV"
+START = date(2025, 1, 1)  # first production day
+
+
+def seed_mill(client, sheds: int = 30, looms: int = 500, workers: int = 300,
+              days: int = 365, start: date = START, seed: int = 42):
+    """
+    Loads the synthetic mill straight into a FakeFirestore (no write counts).
+    Output: ids and date range the benchmark scenarios need.
+    """
+    rng = random.Random(seed)
+
+    shed_ids = [f"shed{s:03d}" for s in range(sheds)]
+    shed_names = [_shed_name(s) for s in range(sheds)]
+    for shed_id, name in zip(shed_ids, shed_names):
+        client.load("sheds", shed_id, {"name": name})
+
+    loom_ids = []
+    loom_info = {}
+    for l in range(looms):
+        shed_index = l % sheds
+        loom_id = f"loom{l:04d}"
+        loom_number = str(l // sheds + 1)
+        client.load(f"sheds/{shed_ids[shed_index]}/looms", loom_id, {"loom_number": loom_number})
+        loom_ids.append(loom_id)
+        loom_info[loom_id] = (shed_index, loom_number)
+
+    worker_ids = []
+    for w in range(workers):
+        worker_id = f"worker{w:04d}"
+        name = f"{FIRST_NAMES[w % len(FIRST_NAMES)]} {INITIALS[(w // len(FIRST_NAMES)) % len(INITIALS)]}"
+        client.load("workers", worker_id, {
+            "name": name,
+            "phone": f"9{rng.randrange(10 ** 8, 10 ** 9)}",
+            "is_active": w % 10 != 0,
+            "shed_id": shed_ids[(2 * w) % looms % sheds],
+        })
+        worker_ids.append(worker_id)
+
+    # Rate card: one rate per shed from day one (what the records below use)
+    rates = [round(2.5 + 0.1 * s, 2) for s in range(sheds)]
+    for shed_id, rate in zip(shed_ids, rates):
+        effective_from = start.isoformat()
+        client.load("rate_card", f"shed_{shed_id}_{effective_from}",
+                    {"scope": "shed", "key": shed_id, "effective_from": effective_from, "rate": rate})
+    record_no = 0
+    for d in range(days):
+        day = (start + timedelta(days=d)).isoformat()
+        for w, worker_id in enumerate(worker_ids):
+            shift = "Day" if (w + d // 7) % 2 == 0 else "Night"
+            for loom_id in (loom_ids[(2 * w) % looms], loom_ids[(2 * w + 1) % looms]):
+                shed_index, loom_number = loom_info[loom_id]
+                meters = round(rng.uniform(20, 60), 1)
+                record = {
+                    "worker_id": worker_id,
+                    "loom_id": loom_id,
+                    "shed_name": shed_names[shed_index],
+                    "loom_number": loom_number,
+                    "date": day,
+                    "shift": shift,
+                    "meters": meters,
+                    "rate": rates[shed_index],
+                    "total_amount": round(meters * rates[shed_index], 2),
+                }
+                client.load("production", production_key(record), record)
+                record_no += 1
+
+    end = (start + timedelta(days=days - 1)).isoformat()
+    return {
+        "shed_ids": shed_ids,
+        "shed_names": shed_names,
+        "loom_ids": loom_ids,
+        "worker_ids": worker_ids,
+        "start": start.isoformat(),
+        "end": end,
+        "records": record_no,
+    }
+
+
+def _shed_name(index: int):
+    """A, B, ... Z, AA, AB, ..."""
+    name = ""
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        name = chr(65 + rem) + name
+    return name
@@ -171,33 +171,23 @@ def get_worker_meters(
     ):
         """
         Fetches the meters_produced for a specific worker on a specific loom and date.
+        The rows of every shift that day are summed.
         """
-        
-        # ---------------------------------------------------------
-        # SQL LOGIC (Pseudo-code for your DB driver)
-        # ---------------------------------------------------------
-        query = """
-            SELECT meters_produced 
-            FROM production_records 
-            WHERE worker_id = %s 
-            AND loom_id = %s 
-            AND date = %s;
-        """
-        
-        # Example using a standard cursor (replace with your actual DB call)
-        # cursor.execute(query, (worker_id, loom_id, date))
-        # result = cursor.fetchone()
-        
-        # ---------------------------------------------------------
-        # MOCK RESPONSE (Delete this and use real DB result above)
-        # ---------------------------------------------------------
-        result = {"meters_produced": -1} # Simulated data found in DB
-
-        if result:
-            return result
-        else:
+        res = supabase.table("production_records") \
+            .select("meters_produced, shift") \
+            .eq("worker_id", worker_id) \
+            .eq("loom_id", loom_id) \
+            .eq("date", str(date)) \
+            .execute()
+
+        if not res.data:
             raise HTTPException(status_code=404, detail="No production record found for these criteria")
-        
+
+        return {
+            "meters_produced": sum(float(r['meters_produced']) for r in res.data),
+            "shifts": res.data
+        }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,65 @@
+import pytest
+
+from app import crud as crud_module
+from app import writebehind
+from app.payroll import payroll_periods
+from app.ratecard import ratecard
+from app.refdata import refdata
+from app.storage import set_engine
+from app.storage.sqlite_engine import SQLiteEngine
+
+
+# --------------------------------------------------
+# STORAGE ENGINES
+# --------------------------------------------------
+# Every test gets an empty engine installed with set_engine and the
+# process-wide caches cleared, so nothing leaks between tests. Firestore is
+# the in-memory fake the benchmarks use (no service account, no network).
+@pytest.fixture(autouse=True)
+def clean_state(monkeypatch):
+    payroll_periods.clear()
+    refdata.clear()
+    ratecard.clear()
+    crud_module.invalidate_hierarchy_cache()
+    monkeypatch.setattr(writebehind, "write_behind", None)
+    yield
+    payroll_periods.clear()
+
+
+@pytest.fixture
+def sqlite_engine(tmp_path):
+    engine = SQLiteEngine(str(tmp_path / "asm.db"))
+    set_engine(engine)
+    return engine
+
+
+@pytest.fixture
+def firestore_engine():
+    from benchmarks import fake_firestore
+    from app.storage.firestore_engine import FirestoreEngine
+
+    fake_firestore.install()
+    engine = FirestoreEngine()
+    set_engine(engine)
+    return engine
+
+
+@pytest.fixture(params=["sqlite", "firestore"])
+def engine(request):
+    """Runs the test once per storage engine."""
+    return request.getfixturevalue(f"{request.param}_engine")
+
+
+def production(**overrides):
+    """A priced, enriched production entry (no rate card or hierarchy needed)."""
+    return {
+        "worker_id": "w1",
+        "loom_id": "l1",
+        "shed_name": "A",
+        "loom_number": "1",
+        "date": "2024-03-05",
+        "shift": "Day",
+        "meters": 10.0,
+        "rate": 2.0,
+        **overrides,
+    }
@@ -0,0 +1,118 @@
+import time
+
+import pytest
+
+from app.crud import crud
+from app.payroll import PayrollConflict
+from app.payroll_runs import PayrollRuns
+from app.storage import get_engine
+
+from conftest import production
+
+START, END = "2024-03-01", "2024-03-31"
+
+
+@pytest.fixture
+def runs():
+    runs = PayrollRuns()
+    yield runs
+    runs.stop()
+
+
+def finished_run(runs: PayrollRuns):
+    run = runs.submit(START, END)
+    deadline = time.monotonic() + 10
+    while runs.get(run["id"])["status"] in ("queued", "running"):
+        assert time.monotonic() < deadline, "payroll run did not finish"
+        time.sleep(0.01)
+    run = runs.get(run["id"])
+    assert run["status"] == "done", run["error"]
+    return run
+
+
+def test_unchanged_run_is_frozen(engine, runs):
+    crud.add_production(production())
+    run = finished_run(runs)
+
+    frozen = runs.freeze(run["id"])
+
+    assert (frozen["status"], frozen["version"], frozen["summary"]["total_meters"]) == ("frozen", 1, 10.0)
+    assert runs.get(run["id"])["status"] == "frozen"
+
+
+@pytest.mark.parametrize("edits", [
+    [production(meters=12.0)],                              # changes the totals
+    [production(meters=12.0), production()],                # puts them back
+    [production(worker_id="w2", shift="Night")],            # another worker, same period
+])
+def test_edit_inside_the_period_makes_the_run_stale(engine, runs, edits):
+    crud.add_production(production())
+    run = finished_run(runs)
+    for edit in edits:
+        crud.add_production(edit)
+
+    with pytest.raises(PayrollConflict):
+        runs.freeze(run["id"])
+
+    assert runs.get(run["id"])["status"] == "stale"
+    assert crud.get_payroll_period(START, END) is None
+
+
+def test_write_outside_the_period_does_not(engine, runs):
+    crud.add_production(production())
+    run = finished_run(runs)
+    crud.add_production(production(date="2024-04-01"))
+
+    assert runs.freeze(run["id"])["status"] == "frozen"
+
+
+def test_frozen_period_refuses_writes(engine, runs):
+    crud.add_production(production())
+    runs.freeze(finished_run(runs)["id"])
+
+    with pytest.raises(PayrollConflict):
+        crud.add_production(production(meters=12.0))
+    results = crud.add_production_bulk([production(meters=12.0), production(date="2024-04-01")])
+
+    assert "error" in results[0] and "id" in results[1]
+    assert [r["meters"] for r in crud.lookup_production("w1", "l1", "2024-03-05")] == [10.0]
+
+
+def _racing_write(monkeypatch):
+    """Makes another process store a record in the period right after the period is frozen."""
+    freeze_payroll = crud.freeze_payroll
+
+    def freeze_then_write(*args, **kwargs):
+        frozen = freeze_payroll(*args, **kwargs)
+        get_engine().insert_production(crud._production_record(production(meters=12.0)))
+        return frozen
+
+    monkeypatch.setattr(crud, "freeze_payroll", freeze_then_write)
+
+
+def test_freeze_raced_by_a_write_is_undone(engine, runs, monkeypatch):
+    crud.add_production(production())
+    run = finished_run(runs)
+    _racing_write(monkeypatch)
+
+    with pytest.raises(PayrollConflict):
+        runs.freeze(run["id"])
+
+    assert runs.get(run["id"])["status"] == "stale"
+    assert crud.get_payroll_period(START, END) is None
+    crud.add_production(production(meters=14.0))  # open again
+
+
+def test_refreeze_raced_by_a_write_restores_the_reopened_period(engine, runs, monkeypatch):
+    crud.add_production(production())
+    runs.freeze(finished_run(runs)["id"])
+    crud.reopen_payroll(START, END)
+    run = finished_run(runs)
+    _racing_write(monkeypatch)
+
+    with pytest.raises(PayrollConflict):
+        runs.freeze(run["id"])
+
+    period = crud.get_payroll_period(START, END)
+    assert (period["status"], period["version"]) == ("open", 1)
+    assert get_engine().list_payroll_periods()[0]["status"] == "open"
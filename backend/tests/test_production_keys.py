@@ -0,0 +1,40 @@
+from app.crud import crud
+from app.storage.base import production_key
+
+from conftest import production
+
+
+def test_production_key_is_worker_loom_date_shift():
+    assert production_key(production()) == "w1_l1_2024-03-05_Day"
+
+
+def test_saving_a_shift_again_replaces_it(engine):
+    first = crud.add_production(production())
+    again = crud.add_production(production(meters=12.0))
+
+    assert first["id"] == again["id"] == "w1_l1_2024-03-05_Day"
+    stored = crud.lookup_production("w1", "l1", "2024-03-05")
+    assert [(r["id"], r["meters"], r["total_amount"]) for r in stored] == [("w1_l1_2024-03-05_Day", 12.0, 24.0)]
+    assert len(list(crud.stream_production("2024-03-01", "2024-03-31", archived=False))) == 1
+
+
+def test_other_shifts_are_separate_records(engine):
+    crud.add_production(production())
+    crud.add_production(production(shift="Night", meters=8.0))
+
+    assert {r["shift"] for r in crud.lookup_production("w1", "l1", "2024-03-05")} == {"Day", "Night"}
+    assert [r["meters"] for r in crud.lookup_production("w1", "l1", "2024-03-05", "Night")] == [8.0]
+
+
+def test_retried_bulk_save_does_not_duplicate(engine):
+    rows = [production(), production(loom_id="l2", loom_number="2", meters=5.0)]
+    first = crud.add_production_bulk(rows)
+    retried = crud.add_production_bulk(rows)
+
+    assert [r["id"] for r in first] == [r["id"] for r in retried]
+    totals = crud.production_totals("w1", "2024-03-01", "2024-03-31")
+    assert totals["summary"] == {"total_meters": 15.0, "total_salary": 30.0, "shifts": 2}
+
+
+def test_lookup_of_an_unsaved_shift_is_empty(engine):
+    assert crud.lookup_production("w1", "l1", "2024-03-05") == []
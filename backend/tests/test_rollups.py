@@ -0,0 +1,52 @@
+from app import rollups
+from app.crud import crud
+
+from conftest import production
+
+
+def daily():
+    return rollups.daily_ref("w1", "2024-03-05").get().to_dict()
+
+
+def monthly():
+    return rollups.monthly_ref("w1", "2024-03").get().to_dict()
+
+
+def test_new_record_increments_daily_and_monthly(firestore_engine):
+    crud.add_production(production())
+
+    for doc in (daily(), monthly()):
+        assert (doc["meters"], doc["amount"], doc["shifts"]) == (10.0, 20.0, 1)
+        assert doc["looms"]["l1"]["meters"] == 10.0
+    assert monthly()["looms"]["l1"]["slots"] == {"05_Day": 10.0}
+
+
+def test_update_applies_only_the_difference(firestore_engine):
+    crud.add_production(production())
+    crud.add_production(production(meters=12.0))
+    crud.add_production(production(meters=7.0))
+
+    for doc in (daily(), monthly()):
+        assert (doc["meters"], doc["amount"], doc["shifts"]) == (7.0, 14.0, 1)
+        assert (doc["looms"]["l1"]["meters"], doc["looms"]["l1"]["amount"]) == (7.0, 14.0)
+    assert monthly()["looms"]["l1"]["slots"] == {"05_Day": 7.0}
+
+
+def test_bulk_update_applies_only_the_difference(firestore_engine):
+    crud.add_production_bulk([production(), production(shift="Night", meters=4.0)])
+    crud.add_production_bulk([production(meters=11.0)])
+
+    doc = monthly()
+    assert (doc["meters"], doc["shifts"]) == (15.0, 2)
+    assert doc["looms"]["l1"]["slots"] == {"05_Day": 11.0, "05_Night": 4.0}
+
+
+def test_range_totals_match_the_records(firestore_engine):
+    days = ["2024-02-28", "2024-03-01", "2024-03-10", "2024-03-31", "2024-04-02"]
+    for i, day in enumerate(days):
+        crud.add_production(production(date=day, meters=float(i + 1)))
+    crud.add_production(production(date="2024-03-10", meters=20.0))  # replaces 3.0
+
+    totals = crud.production_totals("w1", "2024-02-15", "2024-04-01")
+    assert totals["summary"] == {"total_meters": 27.0, "total_salary": 54.0, "shifts": 4}
+    assert totals["looms"] == [{"loom_id": "l1", "loom": "A1", "meters": 27.0, "amount": 54.0}]
@@ -0,0 +1,74 @@
+import functools
+
+import pytest
+
+from app import writebehind
+from app.crud import crud
+from app.resilience import StorageUnavailable
+from app.writebehind import WriteBehindQueue
+
+from conftest import production
+
+
+@pytest.fixture
+def queue(sqlite_engine, tmp_path, monkeypatch):
+    queue = WriteBehindQueue(str(tmp_path / "production.journal"), interval_ms=10)
+    queue.start()
+    monkeypatch.setattr(writebehind, "write_behind", queue)
+    yield queue
+    queue.stop()
+
+
+@pytest.fixture
+def outage(sqlite_engine, monkeypatch):
+    """Batch writes fail with StorageUnavailable while outage["down"] is True."""
+    outage = {"down": True}
+    insert_many = sqlite_engine.insert_production_many
+
+    def insert_production_many(records):
+        if outage["down"]:
+            raise StorageUnavailable("storage is down")
+        return insert_many(records)
+
+    monkeypatch.setattr(sqlite_engine, "insert_production_many", insert_production_many)
+    return outage
+
+
+def test_queued_entry_is_stored_once_flushed(queue, sqlite_engine):
+    saved = crud.add_production(production())
+
+    assert saved["queued"] is True
+    assert queue.wait_flushed(5)
+    assert [r["meters"] for r in sqlite_engine.get_production([saved["id"]])] == [10.0]
+    assert queue.status()["pending"] == 0
+
+
+def test_wait_flushed_times_out_while_storage_is_down(queue, outage, sqlite_engine):
+    saved = crud.add_production(production())
+
+    assert queue.wait_flushed(0.3) is False
+    with pytest.raises(StorageUnavailable, match="storage is down"):
+        queue.ensure_flushed(0.3)
+    with pytest.raises(StorageUnavailable):
+        writebehind.ensure_flushed(0.3)
+    # Still served from the queue meanwhile
+    assert [r["meters"] for r in crud.lookup_production("w1", "l1", "2024-03-05")] == [10.0]
+
+    outage["down"] = False
+    assert queue.wait_flushed(5)
+    assert [r["id"] for r in sqlite_engine.get_production([saved["id"]])] == [saved["id"]]
+
+
+def test_production_version_refuses_to_read_past_the_queue(queue, outage, monkeypatch):
+    monkeypatch.setattr(writebehind, "ensure_flushed", functools.partial(writebehind.ensure_flushed, 0.3))
+    crud.add_production(production())
+
+    with pytest.raises(StorageUnavailable):
+        crud.production_version("2024-03-01", "2024-03-31")
+
+    outage["down"] = False
+    assert crud.production_version("2024-03-01", "2024-03-31") == {"2024-03-05": 1}
+
+
+def test_ensure_flushed_is_a_no_op_without_write_behind(sqlite_engine):
+    writebehind.ensure_flushed(0)